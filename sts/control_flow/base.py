@@ -82,6 +82,8 @@ class ReplaySyncCallback(STSSyncCallback, EventMixin):
     state_change = state_change_event.pending_state_change
     # Pass through
     self.ack_pending_state_change(state_change)
+    if not self._record_pass_through:
+      return
     # Record
     replay_event = ControllerStateChange(state_change.controller_id,
                                          state_change.fingerprint,
@@ -90,9 +92,11 @@ class ReplaySyncCallback(STSSyncCallback, EventMixin):
                                          time=state_change.time)
     self.passed_through_events.append(replay_event)
 
-  def set_pass_through(self):
-    '''Cause all pending state changes to pass through without being buffered'''
+  def set_pass_through(self, record=True):
+    '''Cause all pending state changes to pass through without being buffered.
+    If record is False, don't keep track of the state changes passed through'''
     self.passed_through_events = []
+    self._record_pass_through = record
     self.addListener(StateChange, self._pass_through_handler)
 
   def unset_pass_through(self):
@@ -14,10 +14,16 @@
 # limitations under the License.
 
 from sts.replay_event import *
+from sts.openflow_buffer import PendingMessage
+from sts.control_flow.base import StateChange
+from pox.lib.revent import EventMixin
+from pox.openflow.software_switch import DpPacketOut
 import time
-from collections import Counter
+from collections import Counter, defaultdict
 import operator
 import logging
+import json
+import os
 
 log = logging.getLogger("event_scheduler")
 
@@ -41,6 +47,9 @@ class EventSchedulerStats(object):
     self.msgrecv2timeouts = Counter()
     # ControlMessageSend packet classes -> timeout counts
     self.msgsend2timeouts = Counter()
+    # TimeoutModel.key(event) -> [[latency in seconds (None if timed out),
+    #                              wait budget, default wait budget], ...]
+    self.fingerprint2waits = defaultdict(list)
     self.replay_start = None
     self.record_start = None
 
@@ -72,6 +81,13 @@ class EventSchedulerStats(object):
       pkt_class = event.get_packet().__class__.__name__
       self.msgsend2timeouts[pkt_class] += 1
 
+  def event_waited(self, event, latency, budget, default_budget):
+    self.fingerprint2waits[TimeoutModel.key(event)].append([latency, budget,
+                                                            default_budget])
+
+  def get_waits_dict(self):
+    return dict(self.fingerprint2waits)
+
   def sorted_match_counts(self):
     for e, count in sorted(self.event2matched.items(),
                            key=operator.itemgetter(1)):
@@ -134,9 +150,212 @@ class EventSchedulerStats(object):
 
     return "".join(s)
 
+class TimeoutModel(object):
+  '''
+  Learns how long the EventScheduler should wait for each internal event,
+  from how long earlier replays waited for events with the same fingerprint.
+
+  For each fingerprint we keep the outcomes of its most recent max_samples
+  waits with the default budget, or with a shrunk budget that it matched
+  within. Once there are at least min_samples of them, the wait budget
+  shrinks to min_wait_seconds if they all timed out, and to latency_slack
+  times the longest observed latency (but at least min_wait_seconds) if they
+  all matched. Otherwise we keep the default budget.
+
+  A timeout with a shrunk budget says nothing about whether the default
+  budget would have sufficed, so it is not one of those outcomes. Instead,
+  one after shrinking to latency_slack times the latency puts the
+  fingerprint back on the default budget until it next matches, and every
+  min_samples'th in a row after shrinking to min_wait_seconds gets the
+  default budget, in case the event has started to show up (e.g. in pruned
+  traces).
+  '''
+  def __init__(self, min_samples=3, latency_slack=2.0, min_wait_seconds=0.05,
+               max_samples=50):
+    self.min_samples = min_samples
+    self.latency_slack = latency_slack
+    self.min_wait_seconds = min_wait_seconds
+    self.max_samples = max_samples
+    # { key -> [latency of each of the most recent waits, None for timeouts
+    #           with the default budget] }
+    self.samples = defaultdict(list)
+    # { key -> # of timeouts with a shrunk budget since the last sample }
+    self.shrunk_timeouts = Counter()
+
+  @staticmethod
+  def key(event):
+    ''' Return a string identifying the fingerprint of event '''
+    return json.dumps(dictify_fingerprint(event.fingerprint), sort_keys=True,
+                      default=str)
+
+  def budget(self, key, default_budget):
+    ''' Return how long to wait for an event with the given key, in seconds,
+    where default_budget is how long we would wait without the model '''
+    samples = self.samples.get(key, [])
+    if len(samples) < self.min_samples:
+      return default_budget
+    latencies = [ latency for latency in samples if latency is not None ]
+    shrunk_timeouts = self.shrunk_timeouts.get(key, 0)
+    if latencies == []:
+      if shrunk_timeouts >= self.min_samples:
+        return default_budget
+      return min(default_budget, self.min_wait_seconds)
+    if len(latencies) == len(samples) and shrunk_timeouts == 0:
+      return min(default_budget, max(self.min_wait_seconds,
+                                     max(latencies) * self.latency_slack))
+    return default_budget
+
+  def update(self, waits):
+    ''' Learn from the output of EventSchedulerStats.get_waits_dict() '''
+    for key, key_waits in waits.iteritems():
+      for latency, budget, default_budget in key_waits:
+        if latency is None and budget < default_budget:
+          self.shrunk_timeouts[key] += 1
+          continue
+        self.shrunk_timeouts.pop(key, None)
+        samples = self.samples[key]
+        samples.append(latency)
+        if len(samples) > self.max_samples:
+          samples.pop(0)
+
+  def summary(self):
+    ''' Return { key -> {predicted wait, mean and max observed latency,
+    matches, timeouts} } over the samples we keep, for runtime stats. The
+    predicted wait is None if we would keep the default. '''
+    summary = {}
+    for key in set(self.samples.keys()) | set(self.shrunk_timeouts.keys()):
+      samples = self.samples.get(key, [])
+      latencies = [ latency for latency in samples if latency is not None ]
+      predicted = self.budget(key, float("inf"))
+      summary[key] = {
+        'predicted_wait_seconds': None if predicted == float("inf") else predicted,
+        'mean_latency_seconds': (sum(latencies) / len(latencies)
+                                 if latencies else None),
+        'max_latency_seconds': max(latencies) if latencies else None,
+        'matches': len(latencies),
+        'timeouts': len(samples) - len(latencies),
+        'shrunk_timeouts': self.shrunk_timeouts.get(key, 0),
+      }
+    return summary
+
+  def to_dict(self):
+    return {'samples': dict(self.samples),
+            'shrunk_timeouts': dict(self.shrunk_timeouts)}
+
+  def load_dict(self, d):
+    self.samples = defaultdict(list, d['samples'])
+    self.shrunk_timeouts = Counter(d['shrunk_timeouts'])
+
+  def load(self, path):
+    ''' Load what earlier runs learned from path, if it exists '''
+    if not os.path.exists(path):
+      return
+    with open(path) as model_file:
+      self.load_dict(json.load(model_file))
+
+  def save(self, path):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as model_file:
+      json.dump(self.to_dict(), model_file)
+    os.rename(tmp_path, path)
+
+class EventWaiters(object):
+  '''
+  Registry of the internal events an EventScheduler is waiting on, keyed by
+  their expected fingerprint.
+
+  The OpenFlowBuffer, ReplaySyncCallback and BufferedPatchPanel raise an event
+  whenever a message, state change, or dataplane packet shows up. We listen
+  for those and mark the matching waiter as signalled, so that the scheduler
+  only re-checks event.proceed() once something it is waiting for has
+  arrived. All of those events are raised from within io_master.select(), so
+  the scheduler sees the signal as soon as select returns.
+  '''
+  def __init__(self, simulation):
+    self._waiting = set()
+    self._signalled = set()
+    # [(source, listener id)]
+    self._listeners = []
+    # Which kinds of keys we get notified about
+    self._kinds = set()
+    self._listen(simulation.openflow_buffer, PendingMessage,
+                 self._handle_PendingMessage, ['receive', 'send'])
+    self._listen(simulation.controller_sync_callback, StateChange,
+                 self._handle_StateChange, ['state_change'])
+    self._listen(simulation.patch_panel, DpPacketOut,
+                 self._handle_DpPacketOut, ['dp'])
+
+  def _listen(self, source, event_class, handler, kinds):
+    if not isinstance(source, EventMixin):
+      return
+    if (source._eventMixin_events is not True and
+        event_class not in source._eventMixin_events):
+      return
+    self._listeners.append((source, source.addListener(event_class, handler)))
+    self._kinds.update(kinds)
+
+  def _handle_PendingMessage(self, event):
+    kind = 'send' if event.send_event else 'receive'
+    self.signal((kind, event.pending_message))
+
+  def _handle_StateChange(self, event):
+    self.signal(('state_change', event.pending_state_change))
+
+  def _handle_DpPacketOut(self, event):
+    # N.B. BufferedPatchPanel monkey patches the fingerprint onto the event
+    self.signal(('dp', event.fingerprint))
+
+  def key_for(self, event):
+    ''' Return the key under which event's arrival will be signalled, or None
+    if we do not get notified about events of its type '''
+    if type(event) == ControlMessageReceive:
+      key = ('receive', event.pending_receive)
+    elif type(event) == ControlMessageSend:
+      key = ('send', event.pending_send)
+    elif type(event) == ControllerStateChange:
+      key = ('state_change', event.pending_state_change)
+    elif type(event) == DataplanePermit:
+      key = ('dp', event.fingerprint[1:])
+    else:
+      return None
+    if key[0] not in self._kinds:
+      return None
+    return key
+
+  def expect(self, key):
+    self._waiting.add(key)
+    self._signalled.discard(key)
+
+  def unexpect(self, key):
+    self._waiting.discard(key)
+    self._signalled.discard(key)
+
+  def signal(self, key):
+    if key in self._waiting:
+      self._signalled.add(key)
+
+  def signalled(self, key):
+    return key in self._signalled
+
+  def reset(self, key):
+    self._signalled.discard(key)
+
+  def close(self):
+    ''' Stop listening to the simulation '''
+    for source, listener_id in self._listeners:
+      source.removeListener(listener_id)
+    self._listeners = []
+    self._kinds = set()
+
 class EventSchedulerBase(object):
-  def __init__(self):
+  # When waiting on a signalled event, still re-check event.proceed() at least
+  # this often, in case it became available through an unsignalled path.
+  max_select_seconds = 5.0
+
+  def __init__(self, simulation):
+    self.simulation = simulation
     self._input_logger = None
+    self.waiters = EventWaiters(simulation)
 
   def set_input_logger(self, input_logger):
     self._input_logger = input_logger
@@ -145,12 +364,48 @@ class EventSchedulerBase(object):
     if self._input_logger is not None:
       self._input_logger.log_input_event(event, **kws)
 
+  def close(self):
+    ''' Detach from the simulation. Call once done scheduling events '''
+    self.waiters.close()
+
+  def _wait_for_event(self, event, end_time):
+    ''' Wait until event.proceed() succeeds or end_time passes. Return whether
+    the event proceeded. '''
+    key = self.waiters.key_for(event)
+    if key is None:
+      return self._poll_proceed(event, end_time)
+    self.waiters.expect(key)
+    try:
+      while True:
+        self.waiters.reset(key)
+        if event.proceed(self.simulation):
+          return True
+        now = time.time()
+        if now > end_time:
+          return False
+        recheck_time = min(end_time, now + self.max_select_seconds)
+        while not self.waiters.signalled(key):
+          remaining = recheck_time - time.time()
+          if remaining <= 0:
+            break
+          self.simulation.io_master.select(remaining)
+    finally:
+      self.waiters.unexpect(key)
+
+  def _poll_proceed(self, event, end_time):
+    while True:
+      now = time.time()
+      if event.proceed(self.simulation):
+        return True
+      elif now > end_time:
+        return False
+      self.simulation.io_master.select(self.sleep_interval_seconds)
+
 class DumbEventScheduler(EventSchedulerBase):
   kwargs = set(['epsilon_seconds', 'sleep_interval_seconds'])
 
   def __init__(self, simulation, epsilon_seconds=0.0, sleep_interval_seconds=0.2):
-    super(DumbEventScheduler, self).__init__()
-    self.simulation = simulation
+    super(DumbEventScheduler, self).__init__(simulation)
     self.epsilon_seconds = epsilon_seconds
     self.sleep_interval_seconds = sleep_interval_seconds
     self.last_event = None
@@ -168,20 +423,10 @@ class DumbEventScheduler(EventSchedulerBase):
     log.debug("Waiting for %s (maximum wait time: %.0f ms)" %
           ( str(event).replace("\n", ""), self.epsilon_seconds * 1000) )
 
-    now = time.time()
-    end = now  + self.epsilon_seconds
-    proceed = False
-    while True:
-      now = time.time()
-      if event.proceed(self.simulation):
-        proceed = True
-        break
-      elif now > end:
-        break
-      self.simulation.io_master.select(self.sleep_interval_seconds)
-    if proceed:
+    end = time.time() + self.epsilon_seconds
+    if self._wait_for_event(event, end):
       event.timed_out = False
-      self.stats.event_matches(event)
+      self.stats.event_matched(event)
     else:
       event.timed_out = True
       self.stats.event_timed_out(event)
@@ -194,13 +439,15 @@ class EventScheduler(EventSchedulerBase):
   any post-event delay '''
 
   kwargs = set(['speedup', 'delay_input_events', 'initial_wait',
-                'epsilon_seconds', 'sleep_interval_seconds'])
+                'epsilon_seconds', 'sleep_interval_seconds', 'timeout_model'])
 
   def __init__(self, simulation, speedup=1.0, delay_input_events=True,
                initial_wait=0.5, epsilon_seconds=0.5, sleep_interval_seconds=0.2,
-               assertion_checking=False):
-    super(EventScheduler, self).__init__()
-    self.simulation = simulation
+               assertion_checking=False, timeout_model=None):
+    ''' If timeout_model (a TimeoutModel) is not None, it decides how long to
+    wait for internal events, and we record how long we waited for each of
+    them in self.stats. '''
+    super(EventScheduler, self).__init__(simulation)
     self.speedup = speedup
     self.delay_input_events = delay_input_events
     self.last_real_time = None
@@ -211,6 +458,7 @@ class EventScheduler(EventSchedulerBase):
     self.started = False
     self.stats = EventSchedulerStats()
     self.assertion_checking = assertion_checking
+    self.timeout_model = timeout_model
 
   def schedule(self, event):
     if not self.started:
@@ -254,28 +502,27 @@ class EventScheduler(EventSchedulerBase):
     wait_time_seconds = self.wait_time(event)
     start = time.time()
     # TODO(cs): why - 0.01?
-    end = start + wait_time_seconds - 0.01 + self.epsilon_seconds
+    default_budget = wait_time_seconds - 0.01 + self.epsilon_seconds
+    budget = default_budget
     if event.timeout_disallowed:
       # Reaallllly far in the future
       end = 30000000000 # Fri, 30 Aug 2920 05:20:00 GMT
       log.debug("Waiting for %s forever" %
                 ( repr(event).replace("\n", "")))
     else:
+      if self.timeout_model is not None:
+        budget = self.timeout_model.budget(TimeoutModel.key(event),
+                                           default_budget)
+      end = start + budget
       log.debug("Waiting for %s (maximum wait time: %.0f ms)" %
-            ( repr(event).replace("\n", ""), self.epsilon_seconds * 1000) )
+            ( repr(event).replace("\n", ""), budget * 1000) )
     self._poll_event(event, end)
+    if self.timeout_model is not None and not event.timeout_disallowed:
+      latency = None if event.timed_out else time.time() - start
+      self.stats.event_waited(event, latency, budget, default_budget)
 
   def _poll_event(self, event, end_time):
-    proceed = False
-    while True:
-      now = time.time()
-      if event.proceed(self.simulation):
-        proceed = True
-        break
-      elif now > end_time:
-        break
-      self.simulation.io_master.select(self.sleep_interval_seconds)
-    if proceed:
+    if self._wait_for_event(event, end_time):
       event.timed_out = False
       self.stats.event_matched(event)
       self.update_event_time(event)
@@ -273,10 +273,11 @@ class Interactive(ControlFlow):
 
   def simulate(self, simulation=None, boot_controllers=default_boot_controllers,
                connect_to_controllers=None,
-               bound_objects=()):
+               bound_objects=(), virtual_clock=None):
     if simulation is None:
       self.simulation = self.simulation_cfg.bootstrap(self.sync_callback,
-                                                      boot_controllers=boot_controllers)
+                                                      boot_controllers=boot_controllers,
+                                                      virtual_clock=virtual_clock)
       if connect_to_controllers is None:
         self.default_connect_to_controllers(self.simulation)
       else:
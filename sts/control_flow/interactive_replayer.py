@@ -39,14 +39,11 @@ from sts.replay_event import *
 from sts.event_dag import EventDag
 from sts.util.console import msg
 from sts.util.convenience import is_flow_mod
+from sts.util.virtual_clock import VirtualClock
 
 import logging
 log = logging.getLogger("interactive_replayer")
 
-# TODO(cs): our switches call time.time() to decide when to expire flow
-# entries. This is potentially problematic, since we interactive mode perturbs
-# time substantially!
-
 # TODO(cs): support DataplanePermit/DataplaneDrop. This would require a change
 # in how we wait for internal events (the only other internal event we
 # currently support it ControlMessageReceive, which we inject manually rather
@@ -66,7 +63,14 @@ class InteractiveReplayer(Interactive):
   supported_internal_events = set([ControlMessageReceive])
 
   def __init__(self, simulation_cfg, superlog_path_or_dag, mock_controllers=True, input_logger=None,
-               show_flow_tables_each_step=True):
+               show_flow_tables_each_step=True, virtual_time=False):
+    '''
+    Our switches call time.time() to decide when to expire flow entries, and
+    interactive mode perturbs time substantially. If virtual_time is True,
+    replay on a virtual clock that jumps to the recorded timestamp of each
+    event, so that flow entries time out as they did in the original run.
+    Requires mock_controllers.
+    '''
     # TODO(cs): allow user to specify a round number where they want to stop,
     # otherwise play forward events without asking for interactive ack.
     Interactive.__init__(self, simulation_cfg, input_logger=input_logger)
@@ -74,6 +78,7 @@ class InteractiveReplayer(Interactive):
     if mock_controllers is False:
       raise NotImplementedError("Live controllers not yet supported")
     self.mock_controllers = mock_controllers
+    self.virtual_time = virtual_time
 
     if type(superlog_path_or_dag) == str:
       superlog_path = superlog_path_or_dag
@@ -97,9 +102,13 @@ class InteractiveReplayer(Interactive):
     # event, inject next pending event, examining total pending events
     # remaining.
     if self.mock_controllers:
+      virtual_clock = None
+      if self.virtual_time and self.event_list != []:
+        virtual_clock = VirtualClock(start_time=self.event_list[0].time.as_float())
       self.simulation = Interactive.simulate(self, boot_controllers=boot_mock_controllers,
                                              connect_to_controllers=connect_to_mock_controllers,
-                                             bound_objects=bound_objects)
+                                             bound_objects=bound_objects,
+                                             virtual_clock=virtual_clock)
     else: # not self.mock_controllers
       self.simulation = Interactive.simulate(self, simulation=simulation, bound_objects=bound_objects)
     return self.simulation
@@ -117,6 +126,8 @@ class InteractiveReplayer(Interactive):
       return
 
     next_event = self.event_list.pop(0)
+    if self.simulation.virtual_clock is not None:
+      self.simulation.advance_virtual_time(next_event.time.as_float())
     if type(next_event) in InteractiveReplayer.supported_input_events:
       msg.replay_event_success("Injecting %r" % next_event)
       next_event.proceed(self.simulation)
@@ -21,16 +21,20 @@ find the minimal causal sequence (MCS) of a failure.
 '''
 
 from sts.util.console import msg, color, Tee
-from sts.util.convenience import timestamp_string, ExitCode, create_clean_python_dir
-from sts.util.rpc_forker import LocalForker, test_serialize_response
-from sts.util.precompute_cache import PrecomputeCache
+from sts.util.convenience import timestamp_string, ExitCode, create_clean_python_dir, find_port, find_index
+from sts.util.rpc_forker import LocalForker, ReplayException, test_serialize_response, send_pickled, recv_pickled
+from sts.util.precompute_cache import PrecomputeCache, PersistentReplayCache, MonotonicReplayCache
+from sts.util.compressed_files import compression_suffix, split_compression_suffix
 from sts.replay_event import *
-from sts.event_dag import EventDag, split_list
+from sts.event_dag import EventDag, EventDagView, AtomicInput, split_list
 import sts.input_traces.log_parser as log_parser
 from sts.input_traces.input_logger import InputLogger
 from sts.control_flow.base import ControlFlow
 from sts.control_flow.replayer import Replayer
+from sts.control_flow.event_scheduler import TimeoutModel
 from sts.control_flow.peeker import Peeker
+from sts.control_flow.snapshot_utils import Snapshotter, PrefixSnapshot, PrefixSnapshotCache
+from sts.control_flow.partitioners import name_to_partitioner, group_internal_events
 from config.invariant_checks import name_to_invariant_check
 
 from collections import Counter
@@ -40,8 +44,17 @@ import time
 import random
 import logging
 import json
+import hashlib
 import os
 import re
+import signal
+import socket
+import tempfile
+import traceback
+
+class PruneBudgetExhausted(Exception):
+  ''' Raised when MCSFinder runs out of time or replays for pruning '''
+  pass
 
 class MCSFinder(ControlFlow):
   def __init__(self, simulation_cfg, superlog_path_or_dag,
@@ -51,9 +64,92 @@ class MCSFinder(ControlFlow):
                optimized_filtering=False, forker=LocalForker(),
                replay_final_trace=True, strict_assertion_checking=False,
                no_violation_verification_runs=None,
-               **kwargs):
+               max_parallel_replays=1, replay_cache_path=None, resume=False,
+               replay_confidence=None, full_replay_interval=10,
+               max_prefix_snapshots=0,
+               assume_monotonic=False, partitioner="time",
+               max_prune_seconds=None, max_replays=None,
+               minimize_internal_events=False, learn_timeouts=False,
+               timeout_model_path=None, **kwargs):
     ''' Note that you may pass in any keyword argument for Replayer to
-    MCSFinder, except 'bug_signature' and 'invariant_check_name' '''
+    MCSFinder, except 'bug_signature' and 'invariant_check_name'
+
+    If max_parallel_replays is greater than 1, delta debugging replays all
+    subsets (and then all complements) of a given granularity concurrently,
+    with up to max_parallel_replays children running at once. Each child is
+    given its own controller ports.
+
+    If replay_cache_path is not None, the outcome of every subsequence we
+    replay is appended to that file, and subsequences whose outcome is already
+    recorded there (e.g. by an earlier run that crashed) are not replayed
+    again. The file should live outside of the results directory, which is
+    cleaned at the start of every run.
+
+    At the start of every delta debugging recursion, the state needed to
+    continue from that point is written to mcs_checkpoint.json in the results
+    directory. If resume is True, and such a checkpoint exists, simulate()
+    skips the reproducibility check and picks up from the checkpoint. The
+    precompute cache is appended to its own file as it grows, and the runtime
+    stats are only written every checkpoint_stats_interval recursions, so
+    resumed runs may be missing the stats of the last few.
+
+    If replay_confidence is not None (e.g. 0.95), rather than always replaying
+    a subsequence max_replays_per_subsequence times before concluding that it
+    does not reproduce the violation, stop as soon as we are replay_confidence
+    sure of that, judging by the iterations at which violations have shown up
+    so far. Replays cut short can't show a late violation, so only
+    subsequences replayed the full max_replays_per_subsequence times inform
+    that judgement: the reproducibility check, and every
+    full_replay_interval'th replayed subsequence (never, if None).
+
+    If forker reuses its children across replays (e.g. a PreforkForker or
+    RemoteForker), each replay is sent to a child as a bit mask over the
+    original trace, rather than as a closure over the dag to replay. Remote
+    workers must be started with the same config as ours (see
+    tools/rpc_worker.py).
+
+    If max_prefix_snapshots is greater than 0, replays suspend a copy of
+    themselves (simulation and controller, see snapshot_utils) just before
+    each input where delta debugging's current split starts a new chunk, and
+    later replays of subsequences with the same prefix of events continue
+    from the longest such copy rather than starting from scratch. At most
+    max_prefix_snapshots copies are kept around, evicting the least recently
+    used. Requires a single controller that supports snapshots, sequential
+    replays (max_parallel_replays=1) with a LocalForker, and no
+    transform_dag. The replay logs of continued replays only cover the events
+    after the prefix, and repeated replays of a subsequence share its prefix.
+
+    If assume_monotonic is True, we assume that supersets of a subsequence
+    that reproduces the violation also reproduce it, and that subsets of a
+    subsequence that doesn't reproduce it don't either, and skip replays
+    whose outcome follows from the outcomes of earlier replays.
+
+    partitioner decides how delta debugging splits the inputs into chunks:
+    either a Partitioner, or the name of one in
+    sts.control_flow.partitioners.name_to_partitioner (e.g. "switch" or
+    "hybrid"). The default splits by time.
+
+    If max_prune_seconds or max_replays is not None, pruning stops once it
+    has taken that long or that many replays, and the smallest subsequence
+    found to reproduce the violation so far becomes the MCS (which may then
+    not be 1-minimal). Within each granularity, candidates that would prune
+    the most inputs are tried first, so that the budget goes where it shrinks
+    the trace the most.
+
+    If minimize_internal_events is True, once the MCS is found we also delta
+    debug over the classes of its internal events (e.g. all LLDP packet_ins,
+    or all echo requests, see partitioners.internal_event_class), and drop
+    every class that isn't needed to reproduce the violation from
+    mcs.trace.notimeouts, so that later replays of it don't wait for them.
+    mcs.trace keeps all of the internal events.
+
+    If learn_timeouts is True, replays learn how long to wait for each
+    internal event from how long earlier replays waited for events with the
+    same fingerprint (see event_scheduler.TimeoutModel), rather than always
+    waiting the full epsilon_seconds for events that never show up. If
+    timeout_model_path is also given, what we learn is saved there, and
+    later runs start from it.
+    '''
     super(MCSFinder, self).__init__(simulation_cfg)
     # number of subsequences delta debugging has examined so far, for
     # distingushing runtime stats from different intermediate runs.
@@ -79,11 +175,15 @@ class MCSFinder(ControlFlow):
       # a list of its dependents
       self.dag = EventDag(log_parser.parse_path(self.superlog_path))
     else:
+      self.superlog_path = None
       self.dag = superlog_path_or_dag
 
     if self.simulation_cfg.ignore_interposition:
       filtered_events = [e for e in self.dag.events if type(e) not in all_internal_events]
       self.dag = EventDag(filtered_events)
+    # Every dag we prune to is a view of this one (unless transform_dag
+    # builds new ones)
+    self._original_dag = self.dag
 
     last_invariant_violation = self.dag.get_last_invariant_violation()
     if last_invariant_violation is None:
@@ -118,12 +218,86 @@ class MCSFinder(ControlFlow):
       raise ValueError('''no_violation_verification_runs parameter is deprecated. '''
                        '''Use max_replays_per_subsequence.''')
     self.max_replays_per_subsequence = max_replays_per_subsequence
+    if replay_confidence is not None and not 0 < replay_confidence < 1:
+      raise ValueError("replay_confidence must be between 0 and 1")
+    self.replay_confidence = replay_confidence
+    self.full_replay_interval = full_replay_interval
+    # How many times we have decided how often to replay a subsequence
+    self._replay_budgets_chosen = 0
     self._runtime_stats = RuntimeStats(self.subsequence_id, runtime_stats_path=runtime_stats_path)
     # Whether to try alternate trace splitting techiques besides splitting by time.
     self.optimized_filtering = optimized_filtering
     self.forker = forker
     self.replay_final_trace = replay_final_trace
     self.strict_assertion_checking = strict_assertion_checking
+    self.max_parallel_replays = max_parallel_replays
+    # Where controllers were configured to listen, before children moved them
+    self._controller_base_ports = None
+    self._view_task_registered = False
+    self.replay_cache_path = replay_cache_path
+    self.replay_cache = None
+    self.resume = resume
+    self._checkpoint_path = None
+    self._precompute_checkpoint_path = None
+    self._runtime_stats_checkpoint_path = None
+    self.checkpoint_stats_interval = 10
+    # How many checkpoints we have written
+    self._checkpoints_dumped = 0
+    # Sequences of the precompute cache already appended to
+    # self._precompute_checkpoint_path, and the length of that file
+    self._checkpointed_sequences = set()
+    self._precompute_checkpoint_offset = 0
+    # Pending (non-tail) delta debugging frames enclosing the current one
+    self._ddmin_frames = []
+    if type(partitioner) == str:
+      if partitioner not in name_to_partitioner:
+        raise ValueError("Unknown partitioner %s. Choose from %s" %
+                         (partitioner, sorted(name_to_partitioner.keys())))
+      partitioner = name_to_partitioner[partitioner]()
+    self.partitioner = partitioner
+    # Which strategy split the inputs of the subsequences we are replaying,
+    # for runtime stats
+    self._partition_strategy = None
+    self.max_prune_seconds = max_prune_seconds
+    self.max_replays = max_replays
+    self.minimize_internal_events = minimize_internal_events
+    if timeout_model_path is not None and not learn_timeouts:
+      raise ValueError("timeout_model_path requires learn_timeouts")
+    self.timeout_model = TimeoutModel() if learn_timeouts else None
+    self.timeout_model_path = timeout_model_path
+    self._prune_start_time = None
+    self._prune_start_replays = None
+    # The smallest dag known to reproduce the violation
+    self._best_dag = None
+    # Outcomes of replayed subsequences, from which we infer the outcome of
+    # others if assume_monotonic is set
+    self.monotonic_cache = None
+    if assume_monotonic:
+      self.monotonic_cache = MonotonicReplayCache([ e.label for e in
+                                                    self.dag.input_events ])
+    self._prefix_snapshots = None
+    if max_prefix_snapshots > 0:
+      if (max_parallel_replays > 1 or self.forker.reuses_children or
+          transform_dag is not None):
+        raise ValueError('''Prefix snapshots require sequential replays in '''
+                         '''fork()ed children, without transform_dag''')
+      if len(self.simulation_cfg.controller_configs) != 1:
+        raise ValueError("Only one controller supported for snapshotting")
+      if self.simulation_cfg.controller_configs[0].sync is not None:
+        raise ValueError("STSSyncProto currently incompatible with snapshotting")
+      self._prefix_snapshots = PrefixSnapshotCache(max_prefix_snapshots)
+    # Labels of the inputs that start a chunk of delta debugging's current
+    # split, which replays suspend a prefix snapshot just before
+    self._snapshot_boundaries = set()
+    # Indices of the events the next replay should suspend a prefix snapshot
+    # before (read by the child)
+    self._snapshot_indices = []
+    # Prefix snapshots check that we are still alive
+    self._parent_pid = os.getpid()
+    # Identifies the original trace, before any pruning
+    self._trace_digest = hashlib.sha1(" ".join(
+        "%s:%s:%f" % (e.label, e.__class__.__name__, e.time.as_float())
+        for e in self.dag.input_events)).hexdigest()
 
   def log(self, s):
     ''' Output a message to both self._log and self._extra_log '''
@@ -150,12 +324,17 @@ class MCSFinder(ControlFlow):
     ''' Precondition: results_dir exists, and is clean (preferably
     initialized by experiments/setup.py).'''
     if self._extra_log is None:
-      self._extra_log = open("%s/mcs_finder.log" % results_dir, "w")
+      self._extra_log = open("%s/mcs_finder.log" % results_dir,
+                             "a" if self.resume else "w")
     if self._runtime_stats.get_runtime_stats_path() is None:
       runtime_stats_path = "%s/runtime_stats.json" % results_dir
       self._runtime_stats.set_runtime_stats_path(runtime_stats_path)
     if self.mcs_trace_path is None:
-      self.mcs_trace_path = "%s/mcs.trace" % results_dir
+      # Compress the MCS trace the same way as the original trace
+      suffix = ""
+      if self.superlog_path is not None:
+        suffix = compression_suffix(self.superlog_path)
+      self.mcs_trace_path = "%s/mcs.trace%s" % (results_dir, suffix)
     # TODO(cs): assumes that transform dag is a peeker, not some other
     # transformer
     peeker_exists = self.transform_dag is not None
@@ -163,6 +342,24 @@ class MCSFinder(ControlFlow):
                                          self._runtime_stats,
                                          self.simulation_cfg, peeker_exists)
     self.replay_log_tracker = ReplayLogTracker(results_dir)
+    self._checkpoint_path = os.path.join(results_dir, "mcs_checkpoint.json")
+    self._precompute_checkpoint_path = os.path.join(results_dir,
+                                                    "mcs_checkpoint_precompute_cache.json")
+    self._runtime_stats_checkpoint_path = os.path.join(results_dir,
+                                                       "mcs_checkpoint_runtime_stats.json")
+    if self.replay_cache_path is not None:
+      self.replay_cache = PersistentReplayCache(self.replay_cache_path,
+                                                self._config_fingerprint())
+      self.log("Loaded %d replay outcomes from %s" % (len(self.replay_cache),
+                                                     self.replay_cache_path))
+    if self.timeout_model_path is not None:
+      self.timeout_model.load(self.timeout_model_path)
+
+  def _config_fingerprint(self):
+    ''' Everything besides the input subsequence that determines the outcome
+    of a replay '''
+    return [self._trace_digest, self.invariant_check_name,
+            str(self.bug_signature), str(self.simulation_cfg)]
 
   # N.B. only called in the parent process.
   def simulate(self, check_reproducibility=True):
@@ -177,6 +374,15 @@ class MCSFinder(ControlFlow):
     if len(self.dag) == 0:
       raise RuntimeError("No supported input types?")
 
+    checkpoint = None
+    if self.resume:
+      checkpoint = self._load_checkpoint()
+      if checkpoint is None:
+        self.log("No checkpoint to resume from. Starting from scratch")
+      else:
+        # The checkpointed run already verified the violation
+        check_reproducibility = False
+
     if check_reproducibility:
       # First, run through without pruning to verify that the violation exists
       self._runtime_stats.record_replay_start()
@@ -184,31 +390,58 @@ class MCSFinder(ControlFlow):
       (bug_found, i) = self.replay_max_iterations(self.dag, "reproducibility",
                                                   ignore_runtime_stats=True)
       self._runtime_stats.set_initial_verification_runs_needed(i)
+      if bug_found:
+        self._runtime_stats.record_violation_found(i)
       self._runtime_stats.record_replay_end()
       if not bug_found:
         msg.fail("Unable to reproduce correctness violation!")
         sys.exit(5)
       self.log("Violation reproduced successfully! Proceeding with pruning")
 
-    self._runtime_stats.record_prune_start()
-
-    # Run optimizations.
-    # TODO(cs): Better than a boolean flag: check if
-    # log(len(self.dag)) > number of input types to try
-    if self.optimized_filtering:
-      self._optimize_event_dag()
-    precompute_cache = PrecomputeCache()
-
-    # Invoke delta debugging
-    (dag, total_inputs_pruned) = self._ddmin(self.dag, 2, precompute_cache=precompute_cache)
+    self._prune_start_time = time.time()
+    self._prune_start_replays = self._runtime_stats.total_replays
+    self._best_dag = self.dag
+    try:
+      if checkpoint is None:
+        self._runtime_stats.record_prune_start()
+
+        # Run optimizations.
+        # TODO(cs): Better than a boolean flag: check if
+        # log(len(self.dag)) > number of input types to try
+        if self.optimized_filtering:
+          self._optimize_event_dag()
+        precompute_cache = PrecomputeCache()
+
+        # Invoke delta debugging
+        (dag, total_inputs_pruned) = self._ddmin(self.dag, 2, precompute_cache=precompute_cache)
+      else:
+        self.log("Resuming delta debugging from %s" % self._checkpoint_path)
+        precompute_cache = self._restore_checkpoint(checkpoint)
+        self._best_dag = self._checkpointed_dag(checkpoint["frames"])
+        # The budget only covers this run's replays
+        self._prune_start_replays = self._runtime_stats.total_replays
+        (dag, total_inputs_pruned) = self._resume_ddmin(checkpoint["frames"],
+                                                        precompute_cache=precompute_cache)
+    except PruneBudgetExhausted as e:
+      # N.B. the last checkpoint is left in place, so that a later run with
+      # resume=True can pick up where we stopped.
+      self.log("%s. Returning the smallest violating subsequence found so "
+               "far, which may not be 1-minimal" % e)
+      self._runtime_stats.record_budget_exhausted(str(e))
+      self._ddmin_frames = []
+      dag = self._best_dag
+      total_inputs_pruned = len(self.dag.input_events) - len(dag.input_events)
     # Make sure to track the final iteration size
     self._track_iteration_size(total_inputs_pruned)
     self.dag = dag
 
     self._runtime_stats.record_prune_end()
     self.mcs_log_tracker.dump_runtime_stats()
+    if self.replay_cache is not None:
+      self.replay_cache.close()
+      self.replay_cache = None
 
-    if self.replay_final_trace:
+    if self.replay_final_trace and self._runtime_stats.one_minimal:
       #  Replaying the final trace achieves two goals:
       #  - verifies that the MCS indeed ends in the violation
       #  - allows us to prune internal events that time out
@@ -231,6 +464,10 @@ class MCSFinder(ControlFlow):
                    '''If that still doesn't work, see tools/visualization/visualize1D.html '''
                    '''for debugging''')
 
+    notimeouts_dag = None
+    if self.minimize_internal_events and self._runtime_stats.one_minimal:
+      notimeouts_dag = self._minimize_internal_events(self.dag.filter_timeouts())
+
     self.log("=== Total replays: %d ===" % self._runtime_stats.total_replays)
     self.log("Final MCS (%d elements):" % len(self.dag.input_events))
     for i in self.dag.input_events:
@@ -239,7 +476,10 @@ class MCSFinder(ControlFlow):
     # N.B. dumping the MCS trace must occur after the final replay trace,
     # since we need to infer which events will time out for events.trace.notimeouts
     if self.mcs_trace_path is not None:
-      self.mcs_log_tracker.dump_mcs_trace(self.dag, self)
+      self.mcs_log_tracker.dump_mcs_trace(self.dag, self,
+                                          notimeouts_dag=notimeouts_dag)
+    self._release_prefix_snapshots()
+    self.forker.shutdown()
     return ExitCode(0)
 
   # N.B. always called by the parent process.
@@ -248,9 +488,12 @@ class MCSFinder(ControlFlow):
     # This is the delta-debugging algorithm from:
     #   http://www.st.cs.uni-saarland.de/papers/tse2002/tse2002.pdf,
     # Section 3.2
-    # TODO(cs): we could do much better if we leverage domain knowledge (e.g.,
-    # start by pruning all LinkFailures, or splitting by nodes rather than
-    # time)
+    # N.B. self.partitioner decides how to split, e.g. by time or by node
+    self._dump_checkpoint({ "dag" : [ e.label for e in dag.events ],
+                            "split_ways" : split_ways,
+                            "label_prefix" : label_prefix,
+                            "total_inputs_pruned" : total_inputs_pruned },
+                          precompute_cache=precompute_cache)
     if split_ways > len(dag.input_events):
       self.log("Done")
       return (dag, total_inputs_pruned)
@@ -259,69 +502,313 @@ class MCSFinder(ControlFlow):
     subset_label = lambda label: ".".join(map(str, label_prefix + ( label, )))
     print_subset = lambda label, s: subset_label(label) + ": "+" ".join(map(lambda e: e.label, s))
 
-    subsets = split_list(dag.input_events, split_ways)
+    (self._partition_strategy,
+     subsets) = self.partitioner.partition(dag.input_events, split_ways)
+    self._set_snapshot_boundaries([ s[0].label for s in subsets[1:] if s != [] ])
     self.log("Subsets:\n"+"\n".join(print_subset(local_label(i), s) for i, s in enumerate(subsets)))
-    for i, subset in enumerate(subsets):
-      label = local_label(i)
-      new_dag = dag.input_subset(subset)
+    order = self._candidate_order([ len(dag.input_events) - len(s) for s in subsets ])
+    candidates = ((i, local_label(i), dag.input_subset(subsets[i]))
+                  for i in order)
+    violating = self._find_violating_candidate(candidates, "subset",
+                                               print_subset, subset_label,
+                                               precompute_cache,
+                                               total_inputs_pruned)
+    if violating is not None:
+      (i, label, new_dag) = violating
+      self.log_violation("Subset %s reproduced violation. Subselecting." % subset_label(label))
+      self.mcs_log_tracker.maybe_dump_intermediate_mcs(total_inputs_pruned, new_dag,
+                                                       subset_label(label), self)
+
+      total_inputs_pruned += len(dag.input_events) - len(new_dag.input_events)
+      return self._ddmin(new_dag, 2, precompute_cache=precompute_cache,
+                         label_prefix = label_prefix + (label, ),
+                         total_inputs_pruned=total_inputs_pruned)
+
+    self.log_no_violation("No subsets with violations. Checking complements")
+    order = self._candidate_order([ len(s) for s in subsets ])
+    candidates = ((i, local_label(i, True), dag.input_complement(subsets[i]))
+                  for i in order)
+    violating = self._find_violating_candidate(candidates, "complement",
+                                               print_subset, subset_label,
+                                               precompute_cache,
+                                               total_inputs_pruned)
+    if violating is not None:
+      (i, label, new_dag) = violating
+      prefix = label_prefix + (label, )
+      self.log_violation("Subset %s reproduced violation. Subselecting." % subset_label(label))
+      self.mcs_log_tracker.maybe_dump_intermediate_mcs(total_inputs_pruned, new_dag,
+                                                       subset_label(label), self)
+      total_inputs_pruned += len(dag.input_events) - len(new_dag.input_events)
+      return self._ddmin(new_dag, max(split_ways - 1, 2),
+                         precompute_cache=precompute_cache,
+                         label_prefix=prefix,
+                         total_inputs_pruned=total_inputs_pruned)
+
+    self.log_no_violation("No complements with violations.")
+    if split_ways < len(dag.input_events):
+      self.log("Increasing granularity.")
+      return self._ddmin(dag, min(len(dag.input_events), split_ways*2),
+                         precompute_cache=precompute_cache,
+                         label_prefix=label_prefix,
+                         total_inputs_pruned=total_inputs_pruned)
+    return (dag, total_inputs_pruned)
+
+  # N.B. always called by the parent process.
+  def _resume_ddmin(self, frames, precompute_cache=None):
+    ''' Continue delta debugging from the frames of a checkpoint '''
+    # Our recursion is tail recursive, so there is only ever one frame
+    frame = frames[-1]
+    return self._ddmin(self.dag.restore_view(frame["dag"]), frame["split_ways"],
+                       precompute_cache=precompute_cache,
+                       label_prefix=tuple(frame["label_prefix"]),
+                       total_inputs_pruned=frame["total_inputs_pruned"])
+
+  def _checkpointed_dag(self, frames):
+    ''' Return the dag of the innermost of a checkpoint's frames, which is
+    known to reproduce the violation '''
+    return self.dag.restore_view(frames[-1]["dag"])
+
+  # N.B. always called by the parent process.
+  def _dump_checkpoint(self, frame, precompute_cache=None):
+    ''' Record everything needed to resume delta debugging from the start of
+    the current _ddmin() invocation, whose arguments are given by frame. '''
+    if self._checkpoint_path is None:
+      return
+    precompute_cache_offset = None
+    if precompute_cache is not None:
+      precompute_cache_offset = self._append_precompute_checkpoint(precompute_cache)
+    if self._checkpoints_dumped % self.checkpoint_stats_interval == 0:
+      self._write_atomically(self._runtime_stats_checkpoint_path,
+                             self._runtime_stats.__dict__)
+    self._checkpoints_dumped += 1
+    checkpoint = {
+      "mcs_finder" : self.__class__.__name__,
+      "trace_digest" : self._trace_digest,
+      # The (possibly optimized) dag that delta debugging started from
+      "base_dag" : [ e.label for e in self.dag.events ],
+      "frames" : self._ddmin_frames + [frame],
+      "precompute_cache_offset" : precompute_cache_offset,
+      "subsequence_id" : self.subsequence_id,
+      "replay_log_count" : self.replay_log_tracker.count,
+      "intermediate_mcs_count" : self.mcs_log_tracker.count,
+      "max_inputs_pruned" : self.mcs_log_tracker.max_inputs_pruned,
+    }
+    self._write_atomically(self._checkpoint_path, checkpoint)
+
+  def _write_atomically(self, path, json_object):
+    # Write to a temporary file and rename, so that we never leave a truncated
+    # checkpoint behind if we are killed midway.
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as output:
+      json.dump(json_object, output)
+    os.rename(tmp_path, path)
+
+  def _append_precompute_checkpoint(self, precompute_cache):
+    ''' Append the sequences added to precompute_cache since the last
+    checkpoint to self._precompute_checkpoint_path, one json list of labels
+    per line, and return the resulting length of the file. Only that many
+    bytes of it belong to the checkpoint: anything after was appended by a
+    run that died before its next checkpoint. '''
+    new_sequences = precompute_cache.done_sequences - self._checkpointed_sequences
+    with open(self._precompute_checkpoint_path, "a") as output:
+      output.truncate(self._precompute_checkpoint_offset)
+      for input_sequence in new_sequences:
+        line = json.dumps([ e.label for e in input_sequence ]) + "\n"
+        output.write(line)
+        self._precompute_checkpoint_offset += len(line)
+    self._checkpointed_sequences |= new_sequences
+    return self._precompute_checkpoint_offset
+
+  def _load_checkpoint(self):
+    ''' Return the checkpoint left in the results directory by a previous
+    run, or None if there isn't one for this trace. '''
+    if self._checkpoint_path is None or not os.path.exists(self._checkpoint_path):
+      return None
+    with open(self._checkpoint_path) as input:
+      checkpoint = json.load(input)
+    if (checkpoint["mcs_finder"] != self.__class__.__name__ or
+        checkpoint["trace_digest"] != self._trace_digest):
+      self.log("Checkpoint %s is from a different trace or MCSFinder. Ignoring" %
+               self._checkpoint_path)
+      return None
+    return checkpoint
+
+  def _restore_checkpoint(self, checkpoint):
+    ''' Restore our bookkeeping from checkpoint, and return the restored
+    precompute cache '''
+    # Frames are relative to the dag that delta debugging started from, which
+    # the optimizations in simulate() may have pruned
+    self.dag = self.dag.restore_view(checkpoint["base_dag"])
+    with open(self._runtime_stats_checkpoint_path) as input:
+      self._runtime_stats.load_dict(json.load(input))
+    # We will dump the runtime stats again when we're done
+    runtime_stats_path = self._runtime_stats.get_runtime_stats_path()
+    if runtime_stats_path is not None and os.path.exists(runtime_stats_path):
+      os.remove(runtime_stats_path)
+    self.subsequence_id = checkpoint["subsequence_id"]
+    self.replay_log_tracker.count = checkpoint["replay_log_count"]
+    self.mcs_log_tracker.count = checkpoint["intermediate_mcs_count"]
+    self.mcs_log_tracker.max_inputs_pruned = checkpoint["max_inputs_pruned"]
+    if checkpoint["precompute_cache_offset"] is None:
+      return None
+    precompute_cache = PrecomputeCache()
+    with open(self._precompute_checkpoint_path) as input:
+      lines = input.read(checkpoint["precompute_cache_offset"]).splitlines()
+    for line in lines:
+      precompute_cache.update(tuple(self.dag.restore_view(json.loads(line)).events))
+    self._checkpointed_sequences = set(precompute_cache.done_sequences)
+    self._precompute_checkpoint_offset = checkpoint["precompute_cache_offset"]
+    return precompute_cache
+
+  # N.B. always called by the parent process.
+  def _find_violating_candidate(self, candidates, kind, print_subset,
+                                subset_label, precompute_cache,
+                                total_inputs_pruned):
+    ''' Replay each (subset index, label, dag) tuple in candidates, and return
+    the first tuple that reproduces the violation, or None.
+
+    If self.max_parallel_replays > 1, candidates are replayed concurrently,
+    as many at a time as the remaining replay budget allows. The first violating candidate is still the one with the
+    lowest index, so the outcome does not depend on scheduling.
+
+    precompute_cache may be None, in which case every candidate is replayed.
+    '''
+    if self.max_parallel_replays > 1:
+      return self._find_violating_candidate_parallel(candidates, kind,
+                                                     print_subset, subset_label,
+                                                     precompute_cache,
+                                                     total_inputs_pruned)
+    for (i, label, new_dag) in candidates:
       input_sequence = tuple(new_dag.input_events)
-      self.log("Current subset: %s" % print_subset(label, input_sequence))
-      if precompute_cache.already_done(input_sequence):
-        self.log("Already computed. Skipping")
-        continue
-      precompute_cache.update(input_sequence)
+      self.log("Current %s: %s" % (kind, print_subset(label, input_sequence)))
+      if precompute_cache is not None:
+        if precompute_cache.already_done(input_sequence):
+          self.log("Already computed. Skipping")
+          continue
+        precompute_cache.update(input_sequence)
       if input_sequence == ():
-        self.log("Subset after pruning dependencies was empty. Skipping")
+        self.log("Subset %s after pruning dependencies was empty. Skipping" %
+                 subset_label(label))
         continue
 
+      self._check_budget()
       self._track_iteration_size(total_inputs_pruned)
-      violation = self._check_violation(new_dag, i, label)
-      if violation:
-        self.log_violation("Subset %s reproduced violation. Subselecting." % subset_label(label))
-        self.mcs_log_tracker.maybe_dump_intermediate_mcs(total_inputs_pruned, new_dag,
-                                                         subset_label(label), self)
-
-        total_inputs_pruned += len(dag.input_events) - len(new_dag.input_events)
-        return self._ddmin(new_dag, 2, precompute_cache=precompute_cache,
-                           label_prefix = label_prefix + (label, ),
-                           total_inputs_pruned=total_inputs_pruned)
+      if self._check_violation(new_dag, i, label):
+        self._record_violating_dag(new_dag)
+        return (i, label, new_dag)
+    return None
 
-    self.log_no_violation("No subsets with violations. Checking complements")
-    for i, subset in enumerate(subsets):
-      label = local_label(i, True)
-      prefix = label_prefix + (label, )
-      new_dag = dag.input_complement(subset)
+  # N.B. always called by the parent process.
+  def _find_violating_candidate_parallel(self, candidates, kind, print_subset,
+                                         subset_label, precompute_cache,
+                                         total_inputs_pruned):
+    # Filter out candidates we have already checked before replaying any of
+    # them. Note that we only add candidates to precompute_cache once we know
+    # their outcome, since cancelled replays don't tell us anything.
+    to_replay = []
+    in_flight = set()
+    for (i, label, new_dag) in candidates:
       input_sequence = tuple(new_dag.input_events)
-      self.log("Current complement: %s" % print_subset(label, input_sequence))
-      if precompute_cache.already_done(input_sequence):
+      self.log("Current %s: %s" % (kind, print_subset(label, input_sequence)))
+      if ((precompute_cache is not None and
+           precompute_cache.already_done(input_sequence)) or
+          input_sequence in in_flight):
         self.log("Already computed. Skipping")
         continue
-      precompute_cache.update(input_sequence)
-
       if input_sequence == ():
-        self.log("Subset %s after pruning dependencies was empty. Skipping", subset_label(label))
+        self.log("Subset %s after pruning dependencies was empty. Skipping" %
+                 subset_label(label))
         continue
+      in_flight.add(input_sequence)
+      to_replay.append((i, label, new_dag))
+
+    if to_replay == []:
+      return None
 
+    outcomes = []
+    for (_, _, d) in to_replay:
+      outcomes.append(self._cached_outcome(d))
+      if outcomes[-1] is not None and outcomes[-1][0]:
+        break
+    outcomes += [None] * (len(to_replay) - len(outcomes))
+    # Candidates after the first known violation can't change the outcome
+    first_cached_violation = find_index(lambda o: o is not None and o[0],
+                                        outcomes)
+    if first_cached_violation is None:
+      first_cached_violation = len(to_replay)
+    uncached = [ j for j in xrange(first_cached_violation)
+                 if outcomes[j] is None ]
+    while uncached != []:
+      self._check_budget()
+      batch = uncached[:self._parallel_batch_size(len(uncached))]
+      uncached = uncached[len(batch):]
+      self.log("Replaying %d %ss in parallel" % (len(batch), kind))
+      replayed = self.replay_max_iterations_parallel([ to_replay[j][2] for j in batch ],
+                                                     [ to_replay[j][1] for j in batch ])
+      for j, outcome in zip(batch, replayed):
+        outcomes[j] = outcome
+        if outcome is not None:
+          self._record_outcome(to_replay[j][2], *outcome)
+      if any(o is not None and o[0] for o in replayed):
+        # The rest of uncached have higher indices, so can't change the outcome
+        break
+    violating = None
+    for candidate, outcome in zip(to_replay, outcomes):
+      if outcome is None:
+        # Cancelled, since a candidate with a lower index already violated
+        continue
+      (i, label, new_dag) = candidate
+      (bug_found, iteration) = outcome
+      if precompute_cache is not None:
+        precompute_cache.update(tuple(new_dag.input_events))
       self._track_iteration_size(total_inputs_pruned)
-      violation = self._check_violation(new_dag, i, label)
-      if violation:
-        self.log_violation("Subset %s reproduced violation. Subselecting." % subset_label(label))
-        self.mcs_log_tracker.maybe_dump_intermediate_mcs(total_inputs_pruned, new_dag,
-                                                         subset_label(label), self)
-        total_inputs_pruned += len(dag.input_events) - len(new_dag.input_events)
-        return self._ddmin(new_dag, max(split_ways - 1, 2),
-                           precompute_cache=precompute_cache,
-                           label_prefix=prefix,
-                           total_inputs_pruned=total_inputs_pruned)
+      if bug_found:
+        self.log_violation("Violation! Considering %d'th" % i)
+        if violating is None:
+          violating = candidate
+          self._record_violating_dag(new_dag)
+      else:
+        self.log_no_violation("No violation in %d'th..." % i)
+    return violating
 
-    self.log_no_violation("No complements with violations.")
-    if split_ways < len(dag.input_events):
-      self.log("Increasing granularity.")
-      return self._ddmin(dag, min(len(dag.input_events), split_ways*2),
-                         precompute_cache=precompute_cache,
-                         label_prefix=label_prefix,
-                         total_inputs_pruned=total_inputs_pruned)
-    return (dag, total_inputs_pruned)
+  # N.B. always called by the parent process.
+  def _candidate_order(self, reductions):
+    ''' Given how many inputs each candidate would prune, return the indices
+    of the candidates in the order to try them '''
+    if self.max_prune_seconds is None and self.max_replays is None:
+      return range(len(reductions))
+    # Largest reduction first. N.B. sorted() is stable
+    return sorted(range(len(reductions)), key=lambda i: -reductions[i])
+
+  # N.B. always called by the parent process.
+  def _check_budget(self):
+    ''' Raise PruneBudgetExhausted if we may not start any more replays '''
+    if (self.max_replays is not None and
+        self._runtime_stats.total_replays - self._prune_start_replays >=
+        self.max_replays):
+      raise PruneBudgetExhausted("Replay budget of %d exhausted" %
+                                 self.max_replays)
+    if (self.max_prune_seconds is not None and
+        time.time() - self._prune_start_time >= self.max_prune_seconds):
+      raise PruneBudgetExhausted("Time budget of %d seconds exhausted" %
+                                 self.max_prune_seconds)
+
+  # N.B. always called by the parent process.
+  def _parallel_batch_size(self, num_candidates):
+    ''' Return how many of num_candidates to replay at once without
+    overshooting the replay budget by more than one candidate's worth '''
+    if self.max_replays is None:
+      return num_candidates
+    remaining = (self.max_replays - (self._runtime_stats.total_replays -
+                                     self._prune_start_replays))
+    per_candidate = max(1, self._next_replay_budget()[0])
+    return max(1, min(num_candidates, remaining / per_candidate))
+
+  # N.B. always called by the parent process.
+  def _record_violating_dag(self, new_dag):
+    if (self._best_dag is None or
+        len(new_dag.input_events) < len(self._best_dag.input_events)):
+      self._best_dag = new_dag
 
   # N.B. always called by the parent process.
   def _track_iteration_size(self, total_inputs_pruned):
@@ -330,21 +817,109 @@ class MCSFinder(ControlFlow):
   # N.B. always called by the parent process.
   def _check_violation(self, new_dag, subset_index, label):
     ''' Check if there were violations '''
-    (bug_found, i) = self.replay_max_iterations(new_dag, label)
+    (bug_found, _) = self._replay_max_iterations_cached(new_dag, label)
     # Violation in the subset
     if bug_found:
       self.log_violation("Violation! Considering %d'th" % subset_index)
-      self._runtime_stats.record_violation_found(i)
       return True
     else:
       # No violation!
       self.log_no_violation("No violation in %d'th..." % subset_index)
       return False
 
+  # N.B. always called by the parent process.
+  def _cached_outcome(self, new_dag):
+    ''' If a previous replay (possibly from an earlier run) already determined
+    whether new_dag reproduces the violation, return (bug found, None).
+    Otherwise return None.
+
+    N.B. the iteration is always None: only replays run in this process
+    inform _replays_needed. '''
+    input_labels = [ e.label for e in new_dag.input_events ]
+    if self.monotonic_cache is not None:
+      bug_found = self.monotonic_cache.infer(input_labels)
+      if bug_found is not None:
+        # Replaying would have taken at least one replay if the violation
+        # showed up, and all of them otherwise
+        self._runtime_stats.record_monotonic_inference(
+          1 if bug_found else self._replays_needed())
+        return (bug_found, None)
+    if self.replay_cache is None:
+      return None
+    outcome = self.replay_cache.lookup(input_labels)
+    if outcome is None:
+      return None
+    # A negative outcome only counts if we replayed at least as many times as
+    # we are currently configured to.
+    if (not outcome.violation_found and
+        outcome.replays < self._replays_needed()):
+      return None
+    new_dag.set_events_as_timed_out(outcome.timed_out_internal)
+    self._runtime_stats.record_replay_cache_hit()
+    if self.monotonic_cache is not None:
+      self.monotonic_cache.update(input_labels, outcome.violation_found)
+    return (outcome.violation_found, None)
+
+  # N.B. always called by the parent process.
+  def _record_outcome(self, new_dag, bug_found, iteration):
+    if self.monotonic_cache is not None:
+      self.monotonic_cache.update([ e.label for e in new_dag.input_events ],
+                                  bug_found)
+    if self.replay_cache is None:
+      return
+    timed_out_internal = [ e.label for e in new_dag.events if e.timed_out ]
+    self.replay_cache.update([ e.label for e in new_dag.input_events ],
+                             bug_found, iteration + 1, timed_out_internal)
+
+  def _replay_max_iterations_cached(self, new_dag, label):
+    ''' replay_max_iterations, but consult self.replay_cache first '''
+    cached = self._cached_outcome(new_dag)
+    if cached is not None:
+      self.log("Outcome of %s already known. Skipping" % label)
+      return cached
+    (bug_found, i) = self.replay_max_iterations(new_dag, label)
+    self._record_outcome(new_dag, bug_found, i)
+    return (bug_found, i)
+
+  def _replay_budget(self):
+    ''' Return how many times to replay the next subsequence(s), and whether
+    that is the full max_replays_per_subsequence '''
+    budget = self._next_replay_budget()
+    self._replay_budgets_chosen += 1
+    return budget
+
+  def _next_replay_budget(self):
+    ''' Return what the next call to _replay_budget() will return '''
+    if (self.full_replay_interval is not None and
+        (self._replay_budgets_chosen + 1) % self.full_replay_interval == 0):
+      return (self.max_replays_per_subsequence, True)
+    max_replays = self._replays_needed()
+    return (max_replays, max_replays == self.max_replays_per_subsequence)
+
+  def _replays_needed(self):
+    ''' Return how many replays without a violation it takes to be
+    self.replay_confidence sure that a subsequence does not reproduce it '''
+    if self.replay_confidence is None:
+      return self.max_replays_per_subsequence
+    # { 0-indexed iteration -> # of subsequences whose violation showed up
+    # then, out of those replayed the full max_replays_per_subsequence times }
+    found_in_run = self._runtime_stats.violation_found_in_run
+    total = sum(found_in_run.values())
+    for replays in range(1, self.max_replays_per_subsequence):
+      # Estimate the probability that a violation shows up only after this
+      # many replays. We add one to be conservative when we have seen few
+      # violations so far.
+      later = sum(count for iteration, count in found_in_run.iteritems()
+                  if iteration >= replays)
+      if float(later + 1) / (total + 1) <= 1 - self.replay_confidence:
+        return replays
+    return self.max_replays_per_subsequence
+
   def replay_max_iterations(self, new_dag, label, ignore_runtime_stats=False):
     '''
     Attempt to reproduce the bug up to self.max_replays_per_subsequence
-    times.
+    times (or fewer, if self.replay_confidence is set and we are not
+    ignoring runtime stats).
 
     Returns a tuple (bug found, 0-indexed iteration at which bug was found)
     '''
@@ -353,91 +928,728 @@ class MCSFinder(ControlFlow):
       new_dag = self.transform_dag(new_dag)
       log.info("Proceeding with normal replay")
 
-    for i in range(0, self.max_replays_per_subsequence):
+    max_replays = self.max_replays_per_subsequence
+    full_budget = False
+    if not ignore_runtime_stats:
+      (max_replays, full_budget) = self._replay_budget()
+    for i in range(0, max_replays):
+      if not ignore_runtime_stats:
+        self._runtime_stats.record_strategy_replays(self._partition_strategy, 1)
       bug_found = self.replay(new_dag, label,
                               ignore_runtime_stats=ignore_runtime_stats)
       if bug_found:
         break
+    if bug_found and full_budget:
+      self._runtime_stats.record_violation_found(i)
     return (bug_found, i)
 
+  def replay_max_iterations_parallel(self, new_dags, labels,
+                                     ignore_runtime_stats=False,
+                                     stop_on_violation=True):
+    '''
+    Parallel version of replay_max_iterations: attempt to reproduce the bug up
+    to self.max_replays_per_subsequence times (or fewer, see
+    replay_max_iterations) for each dag in new_dags.
+
+    Returns a list with one entry per dag: either a tuple (bug found, 0-indexed
+    iteration at which bug was found), or None if we stopped replaying the
+    dag because a dag with a lower index already reproduced the bug. If
+    stop_on_violation is False, we never stop early, and there are no None
+    entries.
+    '''
+    if self.transform_dag:
+      log.info("Transforming dags")
+      new_dags = [ self.transform_dag(d) for d in new_dags ]
+      log.info("Proceeding with normal replay")
+
+    # { dag index -> iteration at which bug was found }
+    found_in_iteration = {}
+    live = range(len(new_dags))
+    max_replays = self.max_replays_per_subsequence
+    full_budget = False
+    if not ignore_runtime_stats:
+      (max_replays, full_budget) = self._replay_budget()
+    for i in range(0, max_replays):
+      if not ignore_runtime_stats:
+        self._runtime_stats.record_strategy_replays(self._partition_strategy,
+                                                    len(live))
+      violations = self.replay_parallel([ new_dags[j] for j in live ],
+                                        [ labels[j] for j in live ],
+                                        ignore_runtime_stats=ignore_runtime_stats,
+                                        stop_on_violation=stop_on_violation)
+      for j, violation_found in zip(live, violations):
+        if violation_found:
+          found_in_iteration[j] = i
+      if not stop_on_violation:
+        live = [ j for j in live if j not in found_in_iteration ]
+      elif found_in_iteration != {}:
+        # Only dags with a lower index than the first violating dag can still
+        # change the outcome.
+        first = min(found_in_iteration.keys())
+        live = [ j for j in live if j < first and j not in found_in_iteration ]
+      if live == []:
+        break
+
+    if not stop_on_violation:
+      outcomes = [ (True, found_in_iteration[j]) if j in found_in_iteration
+                   else (False, i) for j in range(len(new_dags)) ]
+    else:
+      first = min(found_in_iteration.keys()) if found_in_iteration else len(new_dags)
+      outcomes = []
+      for j in range(len(new_dags)):
+        if j < first:
+          outcomes.append((False, i))
+        elif j == first:
+          outcomes.append((True, found_in_iteration[j]))
+        else:
+          outcomes.append(None)
+    if full_budget:
+      for outcome in outcomes:
+        if outcome is not None and outcome[0]:
+          self._runtime_stats.record_violation_found(outcome[1])
+    return outcomes
+
   def replay(self, new_dag, label, ignore_runtime_stats=False):
     # Run the simulation forward
     self._runtime_stats.record_replay_stats(len(new_dag.input_events))
 
     # N.B. this function is run as a child process.
     def play_forward(results_dir, subsequence_id):
-      # TODO(cs): need to serialize the parameters to Replayer rather than
-      # wrapping them in a closure... otherwise, can't use RemoteForker
-      # TODO(aw): MCSFinder needs to configure Simulation to always let DataplaneEvents pass through
-      create_clean_python_dir(results_dir)
-
-      # Copy stdout and stderr to a file "replay.out"
-      tee = Tee(open(os.path.join(results_dir, "replay.out"), "w"))
-      tee.tee_stdout()
-      tee.tee_stderr()
+      return self._play_forward(new_dag, results_dir, subsequence_id)
 
-      # Set up replayer.
-      input_logger = InputLogger()
-      replayer = Replayer(self.simulation_cfg, new_dag,
-                          input_logger=input_logger,
-                          bug_signature=self.bug_signature,
-                          invariant_check_name=self.invariant_check_name,
-                          **self.kwargs)
-      replayer.init_results(results_dir)
-      self._runtime_stats = RuntimeStats(subsequence_id)
-      simulation = None
-      try:
-        simulation = replayer.simulate()
-        self._track_new_internal_events(simulation, replayer)
-      except SystemExit:
-        # One of the invariant checks bailed early. Oddly, this is not an
-        # error for us, it just means that there were no violations...
-        # [this logic is arguably broken]
-        # Return no violations, and let Forker handle system exit for us.
-        simulation.violation_found = False
-      finally:
-        input_logger.close(replayer, self.simulation_cfg, skip_mcs_cfg=True)
-        if simulation is not None:
-          simulation.clean_up()
-        tee.close()
-      if self.strict_assertion_checking:
-        test_serialize_response(violations, self._runtime_stats.client_dict())
-      timed_out_internal = [ e.label for e in new_dag.events if e.timed_out ]
-      return (simulation.violation_found, self._runtime_stats.client_dict(), timed_out_internal)
-
-    # TODO(cs): once play_forward() is no longer a closure, register it only once
-    self.forker.register_task("play_forward", play_forward)
     results_dir = self.replay_log_tracker.get_replay_logger_dir(label)
     self.subsequence_id += 1
-    (violation_found, client_runtime_stats,
-                 timed_out_internal) = self.forker.fork("play_forward",
-                                                        results_dir,
-                                                        self.subsequence_id)
+    view_args = self._view_task_args([new_dag])
+    if view_args is not None:
+      (mask, migrations) = view_args[0][0]
+      child_return = self.forker.fork("play_forward_view", self._trace_digest,
+                                      results_dir, self.subsequence_id, None,
+                                      mask, migrations, view_args[1],
+                                      view_args[2])
+    else:
+      child_return = None
+      prefix_snapshot = self._plan_prefix_snapshots(new_dag)
+      while prefix_snapshot is not None:
+        child_return = self._replay_from_prefix_snapshot(new_dag, prefix_snapshot,
+                                                         results_dir)
+        if child_return is not None:
+          break
+        # That snapshot went away. Try the next longest one
+        prefix_snapshot = self._plan_prefix_snapshots(new_dag)
+      if child_return is None:
+        # TODO(cs): once play_forward() is no longer a closure, register it only once
+        self.forker.register_task("play_forward", play_forward)
+        child_return = self.forker.fork("play_forward", results_dir,
+                                        self.subsequence_id)
+    (violation_found, client_runtime_stats, timed_out_internal,
+     new_snapshots) = child_return
     new_dag.set_events_as_timed_out(timed_out_internal)
+    self._add_prefix_snapshots(new_dag, new_snapshots)
 
+    self._learn_timeouts(client_runtime_stats)
     if not ignore_runtime_stats:
       self._runtime_stats.merge_client_dict(client_runtime_stats)
 
     return violation_found
 
+  def replay_parallel(self, new_dags, labels, ignore_runtime_stats=False,
+                      stop_on_violation=True):
+    ''' Replay each dag in new_dags once, in concurrent child processes.
+
+    Returns a list of whether each replay found the violation. If
+    stop_on_violation is True, once a replay finds the violation, replays of
+    dags with a higher index are cancelled, and their entry is None. '''
+    for new_dag in new_dags:
+      self._runtime_stats.record_replay_stats(len(new_dag.input_events))
+
+    # N.B. this function is run as a child process.
+    def play_forward_parallel(results_dir, subsequence_id, dag_index):
+      self._assign_controller_ports(dag_index)
+      return self._play_forward(new_dags[dag_index], results_dir, subsequence_id)
+
+    view_args = self._view_task_args(new_dags)
+    if view_args is not None:
+      task_name = "play_forward_view"
+    else:
+      task_name = "play_forward_parallel"
+      self.forker.register_task(task_name, play_forward_parallel)
+    args_list = []
+    for dag_index, label in enumerate(labels):
+      results_dir = self.replay_log_tracker.get_replay_logger_dir(label)
+      self.subsequence_id += 1
+      args = (results_dir, self.subsequence_id, dag_index)
+      if view_args is not None:
+        (mask, migrations) = view_args[0][dag_index]
+        args = (self._trace_digest,) + args + (mask, migrations, view_args[1],
+                                               view_args[2])
+      args_list.append(args)
+    stop_on = None
+    if stop_on_violation:
+      stop_on = lambda child_return: child_return[0]
+    child_returns = self.forker.fork_many(task_name, args_list,
+                                          max_parallel=self.max_parallel_replays,
+                                          stop_on=stop_on)
+
+    violations = []
+    for new_dag, child_return in zip(new_dags, child_returns):
+      if child_return is None:
+        violations.append(None)
+        continue
+      (violation_found, client_runtime_stats, timed_out_internal, _) = child_return
+      new_dag.set_events_as_timed_out(timed_out_internal)
+      self._learn_timeouts(client_runtime_stats)
+      if not ignore_runtime_stats:
+        self._runtime_stats.merge_client_dict(client_runtime_stats)
+      violations.append(violation_found)
+    return violations
+
+  # N.B. always called by the parent process.
+  def _learn_timeouts(self, client_runtime_stats):
+    ''' Feed how long a replay waited for its internal events into
+    self.timeout_model. The raw waits are too bulky to keep in our own
+    runtime stats, which summarize the model instead. '''
+    event_waits = client_runtime_stats.pop('event_waits', {})
+    if self.timeout_model is None:
+      return
+    for waits in event_waits.values():
+      self.timeout_model.update(waits)
+    self._runtime_stats.record_timeout_model(self.timeout_model.summary())
+    if self.timeout_model_path is not None:
+      self.timeout_model.save(self.timeout_model_path)
+
+  def _view_task_args(self, new_dags):
+    ''' If our forker's children outlive a replay, and all of new_dags are
+    views of the original trace, return ([(mask, migrations)] for each dag,
+    labels of the currently timed out events, self.timeout_model as a dict
+    or None) to send to the play_forward_view task. Otherwise return None. '''
+    if not self.forker.reuses_children:
+      return None
+    views = [ self._view_of_original(new_dag) for new_dag in new_dags ]
+    if None in views:
+      return None
+    if not self._view_task_registered:
+      # Registered only once, so that the forker's children stay warm
+      global view_replayer
+      view_replayer = self
+      self.forker.register_task("play_forward_view", play_forward_view)
+      self._view_task_registered = True
+    # A fork()ed child would have inherited these
+    timed_out = [ e.label for e in self._original_dag.events if e.timed_out ]
+    timeout_model = None
+    if self.timeout_model is not None:
+      timeout_model = self.timeout_model.to_dict()
+    return (views, timed_out, timeout_model)
+
+  def _view_of_original(self, new_dag):
+    ''' Return (mask, migrations) for the EventDagView of the original trace
+    that new_dag is, or None if it isn't one '''
+    if new_dag is self._original_dag:
+      return (new_dag._mask, {})
+    if (isinstance(new_dag, EventDagView) and
+        new_dag._parent is self._original_dag):
+      return (new_dag._mask, new_dag._migrations)
+    return None
+
+  def init_remote_worker(self):
+    ''' Prepare this process to replay for an MCSFinder with the same config
+    in another process, through play_forward_view(). '''
+    global view_replayer
+    # As in simulate()
+    self.dag.mark_invalid_input_sequences()
+    view_replayer = self
+
+  # N.B. always called within a child process.
+  def _play_forward_view(self, results_dir, subsequence_id, dag_index, mask,
+                         migrations, timed_out_event_labels, timeout_model=None):
+    ''' Replay the EventDagView of the original trace given by mask and
+    migrations. dag_index is as for play_forward_parallel, or None for
+    sequential replays. timeout_model is the parent's TimeoutModel as a
+    dict, if it has one. '''
+    self._original_dag.set_events_as_timed_out(timed_out_event_labels)
+    if timeout_model is not None:
+      if self.timeout_model is None:
+        self.timeout_model = TimeoutModel()
+      self.timeout_model.load_dict(timeout_model)
+    # This child may have run a replay with other ports before
+    self._assign_controller_ports(dag_index)
+    new_dag = EventDagView(self._original_dag, mask, migrations)
+    return self._play_forward(new_dag, results_dir, subsequence_id)
+
+  # N.B. always called within a child process.
+  def _assign_controller_ports(self, dag_index):
+    ''' Move each controller onto its own port range, so that concurrent
+    replays don't compete for the same OpenFlow ports. A dag_index of None
+    moves the controllers back to their configured ports. '''
+    if self._controller_base_ports is None:
+      self._controller_base_ports = [ c.port for c in
+                                      self.simulation_cfg.controller_configs ]
+    for (c, base_port) in zip(self.simulation_cfg.controller_configs,
+                              self._controller_base_ports):
+      if base_port is None:
+        # Unix domain socket
+        continue
+      if dag_index is None:
+        c.port = base_port
+      else:
+        base_port += 100 * (dag_index + 1)
+        c.port = find_port(xrange(base_port, base_port + 100))
+      c._server_info = (c.address, c.port)
+
+  # N.B. always called within a child process.
+  def _play_forward(self, new_dag, results_dir, subsequence_id):
+    # N.B. with a RemoteForker, the parameters to Replayer come from the
+    # worker's own config (see play_forward_view())
+    # TODO(aw): MCSFinder needs to configure Simulation to always let DataplaneEvents pass through
+    (tee, input_logger) = self._open_replay_results(results_dir)
+
+    # Set up replayer.
+    kwargs = dict(self.kwargs)
+    if self.timeout_model is not None:
+      kwargs['timeout_model'] = self.timeout_model
+    replayer = Replayer(self.simulation_cfg, new_dag,
+                        input_logger=input_logger,
+                        bug_signature=self.bug_signature,
+                        invariant_check_name=self.invariant_check_name,
+                        **kwargs)
+    replayer.init_results(results_dir)
+    return self._run_replay(replayer, replayer.simulate, new_dag, tee,
+                            input_logger, subsequence_id,
+                            self._snapshot_indices)
+
+  # N.B. always called within a child process.
+  def _open_replay_results(self, results_dir):
+    ''' Return (tee, input_logger) for a replay logging to results_dir '''
+    create_clean_python_dir(results_dir)
+
+    # Copy stdout and stderr to a file "replay.out"
+    tee = Tee(open(os.path.join(results_dir, "replay.out"), "w"))
+    tee.tee_stdout()
+    tee.tee_stderr()
+    # Prefix snapshots fork()ed from this replay stop copying to it
+    self._replay_tee = tee
+    return (tee, InputLogger())
+
+  # N.B. always called within a child process.
+  def _run_replay(self, replayer, run, new_dag, tee, input_logger,
+                  subsequence_id, snapshot_indices):
+    ''' Replay new_dag by invoking run(), which returns the simulation, and
+    return the outcome to send to the parent: (violation found, runtime
+    stats, labels of timed out internal events, [(index, address, pid)] of
+    the prefix snapshots suspended before each of snapshot_indices) '''
+    self._runtime_stats = RuntimeStats(subsequence_id)
+    new_snapshots = []
+    # N.B. overrides the hook of the replay a prefix snapshot was taken from
+    replayer.before_event_hook = None
+    if snapshot_indices:
+      snapshot_indices = set(snapshot_indices)
+      def before_event(index):
+        if index in snapshot_indices:
+          new_snapshots.append(self._suspend_prefix_snapshot(replayer, index))
+      replayer.before_event_hook = before_event
+    simulation = None
+    try:
+      simulation = run()
+      self._track_new_internal_events(simulation, replayer)
+      if replayer.early_exit_index is not None:
+        self._runtime_stats.record_early_exit_index(replayer.early_exit_index)
+    except SystemExit:
+      # One of the invariant checks bailed early. Oddly, this is not an
+      # error for us, it just means that there were no violations...
+      # [this logic is arguably broken]
+      # Return no violations, and let Forker handle system exit for us.
+      simulation.violation_found = False
+    finally:
+      input_logger.close(replayer, self.simulation_cfg, skip_mcs_cfg=True)
+      if simulation is None:
+        # run() raised, e.g. ChildCancelled because the parent no longer
+        # needs this replay. Still kill the controllers it booted.
+        simulation = getattr(replayer, "simulation", None)
+      if simulation is not None:
+        simulation.clean_up()
+      tee.close()
+    if self.strict_assertion_checking:
+      test_serialize_response(violations, self._runtime_stats.client_dict())
+    timed_out_internal = [ e.label for e in new_dag.events if e.timed_out ]
+    return (simulation.violation_found, self._runtime_stats.client_dict(),
+            timed_out_internal, new_snapshots)
+
+  # N.B. always called by the parent process.
+  def _set_snapshot_boundaries(self, input_labels):
+    if self._prefix_snapshots is not None:
+      self._snapshot_boundaries = set(input_labels)
+
+  # N.B. always called by the parent process.
+  def _plan_prefix_snapshots(self, new_dag):
+    ''' Decide where the replay of new_dag should suspend prefix snapshots,
+    and return (length, PrefixSnapshot) for the longest cached prefix of
+    new_dag to start from, or None. '''
+    self._snapshot_indices = []
+    if self._prefix_snapshots is None or self._view_of_original(new_dag) is None:
+      return None
+    labels = [ e.label for e in new_dag.events ]
+    cached = self._prefix_snapshots.longest_prefix(labels)
+    start = 0 if cached is None else cached[0]
+    self._snapshot_indices = [ i for i in xrange(start + 1, len(labels))
+                               if (labels[i] in self._snapshot_boundaries and
+                                   isinstance(new_dag.events[i], InputEvent) and
+                                   labels[:i] not in self._prefix_snapshots) ]
+    return cached
+
+  # N.B. always called by the parent process.
+  def _replay_from_prefix_snapshot(self, new_dag, (length, snapshot), results_dir):
+    ''' Have the simulation suspended in snapshot replay the rest of new_dag.
+    Returns the same as play_forward, or None if the snapshot has gone away.
+    '''
+    self.log("Continuing from the prefix snapshot after %d events" % length)
+    (mask, migrations) = self._view_of_original(new_dag)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+      sock.connect(snapshot.address)
+      send_pickled(sock, ("replay", results_dir, self.subsequence_id, mask,
+                          migrations, self._snapshot_indices))
+      response = recv_pickled(sock)
+    except socket.error as e:
+      self._log.warn("Prefix snapshot %s failed: %s" % (snapshot.address, e))
+      response = None
+    finally:
+      sock.close()
+    if response is None:
+      self._prefix_snapshots.remove([ e.label for e in new_dag.events[:length] ])
+      self._release_prefix_snapshot(snapshot)
+      return None
+    (ok, child_return) = response
+    if not ok:
+      raise ReplayException(child_return)
+    self._runtime_stats.record_prefix_snapshot_hit(length)
+    return child_return
+
+  # N.B. always called by the parent process.
+  def _add_prefix_snapshots(self, new_dag, new_snapshots):
+    for (index, address, pid) in new_snapshots:
+      # Killed along with our other children if we are interrupted
+      LocalForker._active_pids.add(pid)
+      prefix_labels = [ e.label for e in new_dag.events[:index] ]
+      for evicted in self._prefix_snapshots.insert(prefix_labels,
+                                                   PrefixSnapshot(address, pid)):
+        self._release_prefix_snapshot(evicted)
+
+  # N.B. always called by the parent process.
+  def _release_prefix_snapshot(self, snapshot):
+    LocalForker._active_pids.discard(snapshot.pid)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+      sock.connect(snapshot.address)
+      send_pickled(sock, ("exit",))
+    except socket.error:
+      try:
+        os.kill(snapshot.pid, signal.SIGTERM)
+      except OSError:
+        # Already dead
+        pass
+    finally:
+      sock.close()
+
+  # N.B. always called by the parent process.
+  def _release_prefix_snapshots(self):
+    if self._prefix_snapshots is not None:
+      for snapshot in self._prefix_snapshots.clear():
+        self._release_prefix_snapshot(snapshot)
+
+  # N.B. always called within a child process.
+  def _suspend_prefix_snapshot(self, replayer, index):
+    ''' Fork a copy of this replay, with its own copy of the controller, that
+    waits just before event index for the parent to send it other dags with
+    the same first index events to replay. Returns (index, address, pid) of
+    the copy. '''
+    address = os.path.join(tempfile.gettempdir(), "sts_prefix_snapshot_%d_%d" %
+                           (os.getpid(), index))
+    if os.path.exists(address):
+      os.unlink(address)
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(address)
+    listener.listen(1)
+    simulation = replayer.simulation
+    snapshotter = Snapshotter(simulation,
+                              simulation.controller_manager.controllers[0])
+    snapshotter.snapshot_controller()
+    # Don't let the copy flush our buffered output a second time
+    sys.stdout.flush()
+    sys.stderr.flush()
+    pid = os.fork()
+    if pid == 0:
+      self._serve_prefix_snapshot(replayer, snapshotter, index, listener,
+                                  address)
+    listener.close()
+    snapshotter.snapshot_continue()
+    return (index, address, pid)
+
+  # N.B. always called within a prefix snapshot. Never returns.
+  def _serve_prefix_snapshot(self, replayer, snapshotter, index, listener,
+                             address):
+    # Each request is replayed in a fork()ed copy of ourselves, so that we
+    # stay just before event index
+    current_child = [None]
+    def exit_snapshot(*args):
+      snapshotter.snapshot_discard()
+      if current_child[0] is not None:
+        try:
+          os.kill(current_child[0], signal.SIGKILL)
+        except OSError:
+          pass
+      if os.path.exists(address):
+        os.unlink(address)
+      os._exit(0)
+    signal.signal(signal.SIGINT, exit_snapshot)
+    signal.signal(signal.SIGTERM, exit_snapshot)
+    # Don't hold on to the port of the replay's RPC server
+    if getattr(self.forker, "server", None) is not None:
+      self.forker.server.server_close()
+
+    listener.settimeout(5.0)
+    while True:
+      try:
+        (conn, _) = listener.accept()
+      except socket.timeout:
+        try:
+          os.kill(self._parent_pid, 0)
+        except OSError:
+          # Our MCSFinder went away without releasing us
+          exit_snapshot()
+        continue
+      conn.settimeout(None)
+      request = recv_pickled(conn)
+      if request is None or request[0] == "exit":
+        conn.close()
+        exit_snapshot()
+      (_, results_dir, subsequence_id, mask, migrations, snapshot_indices) = request
+      # Wake up our copy of the controller, and suspend another copy of it for
+      # the next request
+      snapshotter.snapshot_proceed()
+      next_snapshotter = Snapshotter(snapshotter.simulation,
+                                     snapshotter.controller)
+      next_snapshotter.snapshot_controller()
+      sys.stdout.flush()
+      sys.stderr.flush()
+      pid = os.fork()
+      if pid == 0:
+        try:
+          listener.close()
+          signal.signal(signal.SIGINT, signal.SIG_DFL)
+          signal.signal(signal.SIGTERM, signal.SIG_DFL)
+          next_snapshotter.snapshot_continue()
+          new_dag = EventDagView(self._original_dag, mask, migrations)
+          try:
+            response = (True, self._continue_replay(replayer, new_dag, index,
+                                                    results_dir, subsequence_id,
+                                                    snapshot_indices))
+          except Exception:
+            response = (False, traceback.format_exc())
+          send_pickled(conn, response)
+        finally:
+          os._exit(0)
+      current_child[0] = pid
+      conn.close()
+      os.waitpid(pid, 0)
+      current_child[0] = None
+      snapshotter = next_snapshotter
+
+  # N.B. always called within a child of a prefix snapshot.
+  def _continue_replay(self, replayer, new_dag, start_index, results_dir,
+                       subsequence_id, snapshot_indices):
+    # Stop copying our output to the replay we were suspended from
+    self._replay_tee.close()
+    (tee, input_logger) = self._open_replay_results(results_dir)
+    replayer.switch_dag(new_dag, input_logger=input_logger)
+    replayer.init_results(results_dir)
+    def run():
+      replayer.run_simulation_forward(start_index=start_index)
+      return replayer.simulation
+    return self._run_replay(replayer, run, new_dag, tee, input_logger,
+                            subsequence_id, snapshot_indices)
+
   def _optimize_event_dag(self):
     ''' Employs domain knowledge of event classes to reduce the size of event
-    dag. Currently prunes event types.'''
-    # TODO(cs): Another approach for later: split by nodes
+    dag. Currently prunes event types.
+
+    We first try pruning each event type on its own (concurrently, if
+    max_parallel_replays > 1), then all of the types whose pruning still
+    reproduced the violation at once. If the combination doesn't reproduce
+    the violation, we fall back to pruning those types one after another.'''
+    self._partition_strategy = "event_type"
     event_types = [TrafficInjection, DataplaneDrop, SwitchFailure,
                    SwitchRecovery, LinkFailure, LinkRecovery, HostMigration,
                    ControllerFailure, ControllerRecovery, PolicyChange, ControlChannelBlock,
                    ControlChannelUnblock]
+    # [(event type, its inputs, dag without them)]
+    removals = []
     for event_type in event_types:
-      pruned = [e for e in self.dag.input_events if not isinstance(e, event_type)]
-      if len(pruned)==len(self.dag.input_events):
+      removed = [e for e in self.dag.input_events if isinstance(e, event_type)]
+      pruned_dag = self.dag.input_complement(removed)
+      # N.B. recoveries are only pruned along with their failures
+      if len(pruned_dag.input_events) == len(self.dag.input_events):
         self.log("\t** No events pruned for event type %s. Next!" % event_type)
         continue
-      pruned_dag = self.dag.input_complement(pruned)
-      (bug_found, i) = self.replay_max_iterations(pruned_dag, "opt_%s" % event_type.__name__)
+      removals.append((event_type, removed, pruned_dag))
+    if removals == []:
+      return
+
+    self._check_budget()
+    outcomes = self._replay_all_cached([ d for (_, _, d) in removals ],
+                                       [ "opt_%s" % t.__name__ for (t, _, _) in removals ])
+    prunable = []
+    for (event_type, removed, pruned_dag), (bug_found, _) in zip(removals, outcomes):
+      if bug_found:
+        self.log("\t** VIOLATION for pruning event type %s!" % event_type)
+        self._record_violating_dag(pruned_dag)
+        prunable.append((event_type, removed, pruned_dag))
+    if prunable == []:
+      return
+
+    (event_type, _, pruned_dag) = prunable[0]
+    if len(prunable) > 1:
+      combined_dag = self.dag.input_complement(sum([ r for (_, r, _) in prunable ], []))
+      self._check_budget()
+      (bug_found, _) = self._replay_max_iterations_cached(combined_dag, "opt_combined")
+      if bug_found:
+        self.log("\t** VIOLATION for pruning event types %s at once! Resizing original dag" %
+                 [ t.__name__ for (t, _, _) in prunable ])
+        self.dag = combined_dag
+        self._record_violating_dag(combined_dag)
+        return
+      self.log("\t** No violation for pruning those event types at once. "
+               "Pruning them one after another")
+    self.log("\t** Resizing original dag without event type %s" % event_type)
+    self.dag = pruned_dag
+    for (event_type, removed, _) in prunable[1:]:
+      pruned_dag = self.dag.input_complement(removed)
+      self._check_budget()
+      (bug_found, i) = self._replay_max_iterations_cached(pruned_dag,
+                                                          "opt_%s" % event_type.__name__)
       if bug_found:
         self.log("\t** VIOLATION for pruning event type %s! Resizing original dag" % event_type)
         self.dag = pruned_dag
+        self._record_violating_dag(pruned_dag)
+
+  # N.B. always called by the parent process.
+  def _minimize_internal_events(self, dag):
+    ''' Delta debug over the classes of dag's internal events, and return a
+    view of dag without the classes that aren't needed to reproduce the
+    violation.
+
+    N.B. replays of views with the same inputs are indistinguishable to
+    self.replay_cache and self.monotonic_cache, so we bypass them. '''
+    groups = group_internal_events(dag.events)
+    if groups == []:
+      return dag
+    self.log("Minimizing %d classes of internal events" % len(groups))
+    self._partition_strategy = "internal_event_class"
+    # Restored at the end, for mcs.trace
+    timed_out = [ e.label for e in self.dag.events if e.timed_out ]
+    precompute_cache = PrecomputeCache()
+    # Indices of the classes we still keep
+    kept = range(len(groups))
+    # The violation may not depend on any of them
+    if self._find_violating_classes(dag, groups, [[]], ["internal_none"],
+                                    precompute_cache) is not None:
+      kept = []
+    split_ways = 2
+    while split_ways <= len(kept):
+      chunks = split_list(kept, split_ways)
+      labels = [ "internal_%d/%d" % (j, split_ways) for j in range(split_ways) ]
+      violating = self._find_violating_classes(dag, groups, chunks, labels,
+                                               precompute_cache)
+      if violating is not None:
+        kept = chunks[violating]
+        split_ways = 2
+        continue
+      complements = [ [ i for i in kept if i not in chunk ] for chunk in chunks ]
+      labels = [ "internal_~%d/%d" % (j, split_ways) for j in range(split_ways) ]
+      violating = self._find_violating_classes(dag, groups, complements, labels,
+                                               precompute_cache)
+      if violating is not None:
+        kept = complements[violating]
+        split_ways = max(split_ways - 1, 2)
+        continue
+      if split_ways == len(kept):
+        break
+      split_ways = min(len(kept), split_ways * 2)
+    self.dag.set_events_as_timed_out(timed_out)
+    pruned = [ klass for i, (klass, _) in enumerate(groups) if i not in kept ]
+    minimized = self._without_classes(dag, groups, kept)
+    self.log("Pruned %d of %d classes of internal events: %s" %
+             (len(pruned), len(groups), pruned))
+    self._runtime_stats.record_internal_event_minimization(
+      len([ e for e in dag.events if isinstance(e, InternalEvent) ]),
+      len([ e for e in minimized.events if isinstance(e, InternalEvent) ]),
+      pruned)
+    return minimized
+
+  @staticmethod
+  def _without_classes(dag, groups, kept):
+    ''' Return a view of dag with only the internal events of the classes in
+    groups whose index is in kept '''
+    kept = set(kept)
+    removed = []
+    for i, (_, events) in enumerate(groups):
+      if i not in kept:
+        removed += events
+    return dag.internal_complement(removed)
+
+  # N.B. always called by the parent process.
+  def _find_violating_classes(self, dag, groups, candidates, labels,
+                              precompute_cache):
+    ''' Replay dag with only the internal event classes in each of candidates
+    (lists of indices into groups), concurrently if max_parallel_replays > 1,
+    and return the index of the first one that reproduces the violation, or
+    None. '''
+    to_replay = [ j for j, candidate in enumerate(candidates)
+                  if not precompute_cache.already_done(tuple(candidate)) ]
+    if to_replay == []:
+      return None
+    new_dags = [ self._without_classes(dag, groups, candidates[j]) for j in to_replay ]
+    if self.max_parallel_replays > 1:
+      outcomes = self.replay_max_iterations_parallel(new_dags,
+                                                     [ labels[j] for j in to_replay ])
+    else:
+      outcomes = []
+      for j, new_dag in zip(to_replay, new_dags):
+        outcomes.append(self.replay_max_iterations(new_dag, labels[j]))
+        if outcomes[-1][0]:
+          break
+    # Candidates we didn't get to (or cancelled) tell us nothing
+    for j, outcome in zip(to_replay, outcomes):
+      if outcome is not None:
+        precompute_cache.update(tuple(candidates[j]))
+    violating = find_index(lambda o: o is not None and o[0], outcomes)
+    if violating is None:
+      self.log_no_violation("No violation for internal event classes %s" %
+                            [ labels[j] for j in to_replay ])
+      return None
+    self.log_violation("Internal event classes %s reproduced violation" %
+                       labels[to_replay[violating]])
+    return to_replay[violating]
+
+  # N.B. always called by the parent process.
+  def _replay_all_cached(self, new_dags, labels):
+    ''' _replay_max_iterations_cached for each of new_dags, concurrently if
+    max_parallel_replays > 1. Returns a list of (bug found, 0-indexed
+    iteration at which bug was found) '''
+    outcomes = [ self._cached_outcome(d) for d in new_dags ]
+    uncached = [ j for j in range(len(new_dags)) if outcomes[j] is None ]
+    if uncached == []:
+      return outcomes
+    if self.max_parallel_replays > 1:
+      self.log("Replaying %d dags in parallel" % len(uncached))
+      replayed = self.replay_max_iterations_parallel([ new_dags[j] for j in uncached ],
+                                                     [ labels[j] for j in uncached ],
+                                                     stop_on_violation=False)
+    else:
+      replayed = [ self.replay_max_iterations(new_dags[j], labels[j])
+                   for j in uncached ]
+    for j, outcome in zip(uncached, replayed):
+      outcomes[j] = outcome
+      self._record_outcome(new_dags[j], *outcome)
+    return outcomes
 
   # N.B. always called within a child process.
   def _track_new_internal_events(self, simulation, replayer):
@@ -469,9 +1681,26 @@ class MCSFinder(ControlFlow):
     self._runtime_stats.record_early_internal_events(replayer.early_state_changes)
     self._runtime_stats.record_timed_out_events(replayer.event_scheduler_stats.get_timeouts_dict())
     self._runtime_stats.record_matched_events(replayer.event_scheduler_stats.get_matches_dict())
+    if self.timeout_model is not None:
+      self._runtime_stats.record_event_waits(replayer.event_scheduler_stats.get_waits_dict())
 
 
 # TODO(cs): Hack alert. Shouldn't be a subclass
+# The MCSFinder whose original trace play_forward_view() replays views of.
+# Forked children inherit it from the parent, and remote workers set it up
+# through init_remote_worker().
+view_replayer = None
+
+# N.B. always called within a child process.
+def play_forward_view(trace_digest, *args):
+  ''' Module-level, so that RemoteForker can ship it to its workers. See
+  MCSFinder._play_forward_view. '''
+  if view_replayer is None:
+    raise RuntimeError("No MCSFinder to replay for. Was the worker started with -c?")
+  if trace_digest != view_replayer._trace_digest:
+    raise ValueError("Worker was configured with a different trace")
+  return view_replayer._play_forward_view(*args)
+
 class EfficientMCSFinder(MCSFinder):
   ''' Exactly the same functionality as MCSFinder, but assumes that
   indeterminate results cannot occur. Worst-case runtime of O(n) as opposed to
@@ -488,6 +1717,12 @@ class EfficientMCSFinder(MCSFinder):
     if type(carryover_inputs) == int:
       carryover_inputs = []
 
+    self._dump_checkpoint({ "dag" : [ e.label for e in dag.events ],
+                            "carryover_inputs" : atomic_input_labels(carryover_inputs),
+                            "recursion_level" : recursion_level,
+                            "label_prefix" : label_prefix,
+                            "total_inputs_pruned" : total_inputs_pruned })
+
     local_label = lambda i: "%s/%d" % ("l" if i == 0 else "r", recursion_level)
     subset_label = lambda label: ".".join(map(str, label_prefix + ( label, )))
     print_subset = lambda label, s: subset_label(label) + ": "+" ".join(map(lambda e: e.label, s))
@@ -498,54 +1733,131 @@ class EfficientMCSFinder(MCSFinder):
       self.log("Base case %s" % str(dag.input_events))
       return (dag, total_inputs_pruned)
 
-    (left, right) = split_list(dag.atomic_input_events, 2)
+    (self._partition_strategy,
+     (left, right)) = self.partitioner.partition(dag.atomic_input_events, 2)
+    self._set_snapshot_boundaries(atomic_input_labels(right)[:1])
     self.log("Subsets:\n"+"\n".join(print_subset(local_label(i), s)
                                     for i, s in enumerate([left,right])))
     # This is: [dag.input_subset(left), dag.input_subset(right)]
-    left_right_dag = []
-
-    for i, subsequence in enumerate([left, right]):
-      label = local_label(i)
+    left_right_dag = [ dag.atomic_input_subset(left),
+                       dag.atomic_input_subset(right) ]
+
+    def candidates():
+      for i in self._candidate_order([len(right), len(left)]):
+        # We test on subsequence U carryover_inputs
+        yield (i, local_label(i),
+               left_right_dag[i].insert_atomic_inputs(carryover_inputs))
+
+    violating = self._find_violating_candidate(candidates(), "subset",
+                                               print_subset, subset_label,
+                                               None, total_inputs_pruned)
+    if violating is not None:
+      (i, label, _) = violating
       prefix = label_prefix + (label, )
-      new_dag = dag.atomic_input_subset(subsequence)
-      self.log("Current subset: %s" % print_subset(label,
-                                                   new_dag.atomic_input_events))
-      left_right_dag.append(new_dag)
-      # We test on subsequence U carryover_inputs
-      test_dag = new_dag.insert_atomic_inputs(carryover_inputs)
-      self._track_iteration_size(total_inputs_pruned)
-      violation = self._check_violation(test_dag, i, label)
-      if violation:
-        self.log("Violation found in %dth half. Recursing" % i)
-        total_inputs_pruned += len(dag.input_events) - len(new_dag.input_events)
-        self.mcs_log_tracker.maybe_dump_intermediate_mcs(total_inputs_pruned, new_dag, "", self)
-        return self._ddmin(new_dag, carryover_inputs,
-                           recursion_level=recursion_level+1,
-                           label_prefix=prefix,
-                           total_inputs_pruned=total_inputs_pruned)
+      new_dag = left_right_dag[i]
+      self.log("Violation found in %dth half. Recursing" % i)
+      total_inputs_pruned += len(dag.input_events) - len(new_dag.input_events)
+      self.mcs_log_tracker.maybe_dump_intermediate_mcs(total_inputs_pruned, new_dag, "", self)
+      return self._ddmin(new_dag, carryover_inputs,
+                         recursion_level=recursion_level+1,
+                         label_prefix=prefix,
+                         total_inputs_pruned=total_inputs_pruned)
 
     self.log("Interference")
     (left_dag, right_dag) = left_right_dag
-    self.log("Recursing on left half")
-    prefix = label_prefix + ("il/%d" % recursion_level,)
-    (left_result,
-     total_inputs_pruned) = self._ddmin(left_dag,
-                                        right_dag.insert_atomic_inputs(carryover_inputs).atomic_input_events,
-                                        recursion_level=recursion_level+1,
-                                        label_prefix=prefix,
-                                        total_inputs_pruned=total_inputs_pruned)
+    return self._ddmin_interference(left_dag, right_dag, carryover_inputs,
+                                    recursion_level, label_prefix,
+                                    total_inputs_pruned)
+
+  def _ddmin_interference(self, left_dag, right_dag, carryover_inputs,
+                          recursion_level, label_prefix, total_inputs_pruned,
+                          left_result=None, resume_frames=None):
+    ''' Recurse on each half, carrying over the other half.
+
+    When resuming from a checkpoint, resume_frames are the checkpointed frames
+    of the recursive call that was in progress, and left_result is the
+    result of the left half if that call was for the right half. '''
+    # Unlike the rest of the recursion, this frame is not a tail call, so it
+    # needs to be part of any checkpoint taken within it
+    frame = { "left_dag" : [ e.label for e in left_dag.events ],
+              "right_dag" : [ e.label for e in right_dag.events ],
+              "carryover_inputs" : atomic_input_labels(carryover_inputs),
+              "recursion_level" : recursion_level,
+              "label_prefix" : label_prefix,
+              "left_result" : None }
+    self._ddmin_frames.append(frame)
+
+    if left_result is None:
+      self.log("Recursing on left half")
+      if resume_frames is not None:
+        (left_result, total_inputs_pruned) = self._resume_ddmin(resume_frames)
+        resume_frames = None
+      else:
+        prefix = label_prefix + ("il/%d" % recursion_level,)
+        (left_result,
+         total_inputs_pruned) = self._ddmin(left_dag,
+                                            right_dag.insert_atomic_inputs(carryover_inputs).atomic_input_events,
+                                            recursion_level=recursion_level+1,
+                                            label_prefix=prefix,
+                                            total_inputs_pruned=total_inputs_pruned)
+    frame["left_result"] = [ e.label for e in left_result.events ]
+
     self.log("Recursing on right half")
-    prefix = label_prefix + ("ir/%d" % recursion_level,)
-    (right_result,
-     total_inputs_pruned) = self._ddmin(right_dag,
-                                        left_dag.insert_atomic_inputs(carryover_inputs).atomic_input_events,
-                                        recursion_level=recursion_level+1,
-                                        label_prefix=prefix,
-                                        total_inputs_pruned=total_inputs_pruned)
+    if resume_frames is not None:
+      (right_result, total_inputs_pruned) = self._resume_ddmin(resume_frames)
+    else:
+      prefix = label_prefix + ("ir/%d" % recursion_level,)
+      (right_result,
+       total_inputs_pruned) = self._ddmin(right_dag,
+                                          left_dag.insert_atomic_inputs(carryover_inputs).atomic_input_events,
+                                          recursion_level=recursion_level+1,
+                                          label_prefix=prefix,
+                                          total_inputs_pruned=total_inputs_pruned)
+    self._ddmin_frames.pop()
 
     return (left_result.insert_atomic_inputs(right_result.atomic_input_events),
             total_inputs_pruned)
 
+  def _checkpointed_dag(self, frames):
+    # Each recursion's inputs reproduce the violation together with its
+    # carried over inputs
+    restore = self.dag.restore_view
+    frame = frames[-1]
+    carryover_inputs = restore(frame["carryover_inputs"]).atomic_input_events
+    return restore(frame["dag"]).insert_atomic_inputs(carryover_inputs)
+
+  def _resume_ddmin(self, frames, precompute_cache=None):
+    frame = frames[0]
+    restore = self.dag.restore_view
+    carryover_inputs = restore(frame["carryover_inputs"]).atomic_input_events
+    label_prefix = tuple(frame["label_prefix"])
+    if len(frames) == 1:
+      return self._ddmin(restore(frame["dag"]), carryover_inputs,
+                         recursion_level=frame["recursion_level"],
+                         label_prefix=label_prefix,
+                         total_inputs_pruned=frame["total_inputs_pruned"])
+    left_result = None
+    if frame["left_result"] is not None:
+      left_result = restore(frame["left_result"])
+    # total_inputs_pruned is restored from the innermost frame
+    return self._ddmin_interference(restore(frame["left_dag"]),
+                                    restore(frame["right_dag"]),
+                                    carryover_inputs, frame["recursion_level"],
+                                    label_prefix, None,
+                                    left_result=left_result,
+                                    resume_frames=frames[1:])
+
+def atomic_input_labels(atomic_inputs):
+  ''' Labels of the input events making up atomic_inputs '''
+  labels = []
+  for e in atomic_inputs:
+    if type(e) == AtomicInput:
+      labels.append(e.failure.label)
+      labels += [ recovery.label for recovery in e.recoveries ]
+    else:
+      labels.append(e.label)
+  return labels
+
 
 class ReplayLogTracker(object):
   ''' Logs intermediate and final replay traces chosen by delta debugging'''
@@ -594,17 +1906,24 @@ class MCSLogTracker(object):
       self.dump_runtime_stats(os.path.join(dst,
           os.path.basename(self.runtime_stats.get_runtime_stats_path())))
 
-  def dump_mcs_trace(self, dag, control_flow, mcs_trace_path=None):
+  def dump_mcs_trace(self, dag, control_flow, mcs_trace_path=None,
+                     notimeouts_dag=None):
+    ''' notimeouts_dag is what to write to mcs.trace.notimeouts, if not dag
+    without its timed out events '''
     if mcs_trace_path is None:
       mcs_trace_path = self.mcs_trace_path
-    for extension in ["", ".notimeouts"]:
-      output_path = mcs_trace_path + extension
+    if notimeouts_dag is None:
+      notimeouts_dag = dag.filter_timeouts()
+    # mcs.trace.notimeouts.gz rather than mcs.trace.gz.notimeouts, so the
+    # compression suffix still selects how it is read
+    (mcs_trace_path, suffix) = split_compression_suffix(mcs_trace_path)
+    for extension, events in [("", dag.events),
+                              (".notimeouts", notimeouts_dag.events)]:
+      output_path = mcs_trace_path + extension + suffix
       input_logger = InputLogger()
       input_logger.open(os.path.dirname(output_path),
-                        output_filename="mcs.trace" + extension)
-      for e in dag.events:
-        if extension == ".notimeouts" and e.timed_out:
-          continue
+                        output_filename=os.path.basename(output_path))
+      for e in events:
         input_logger.log_input_event(e)
       input_logger.close(control_flow, self.simulation_cfg, skip_mcs_cfg=True)
 
@@ -613,7 +1932,8 @@ class RuntimeStats(object):
 
   child_fields = ['new_internal_events',
                   'early_internal_events', 'timed_out_events',
-                  'matched_events', 'buffered_message_receipts']
+                  'matched_events', 'buffered_message_receipts',
+                  'early_exit_indices', 'event_waits']
   child_counters = []
 
   def __init__(self, subsequence_id, runtime_stats_path=None):
@@ -636,6 +1956,13 @@ class RuntimeStats(object):
     self.timed_out_events = {}
     # { replay iteration -> { event type -> successful matches } }
     self.matched_events = {}
+    # { replay iteration -> index of the event after which the violation was
+    #                       detected, if replay stopped early }
+    self.early_exit_indices = {}
+    # { replay iteration -> { event fingerprint -> [[latency, wait budget,
+    #                                                default wait budget]] } }
+    # Only sent to the parent, which folds it into its TimeoutModel.
+    self.event_waits = {}
     # -------------------- Stats set by parent process -------------------- #
     # { delta debugging subseqence # -> count of remaining events }
     self.iteration_size = {}
@@ -657,6 +1984,31 @@ class RuntimeStats(object):
     self.config = ""
     self.total_replays = 0
     self.total_inputs_replayed = 0
+    # Number of subsequences whose outcome was found in the persistent replay
+    # cache, rather than by replaying
+    self.replay_cache_hits = 0
+    # Number of replays that continued from a prefix snapshot, and the number
+    # of events they skipped by doing so
+    self.prefix_snapshot_hits = 0
+    self.prefix_snapshot_events_skipped = 0
+    # Number of subsequences whose outcome we inferred assuming monotonicity,
+    # and the number of replays that saved
+    self.monotonic_inferences = 0
+    self.replays_saved_by_monotonicity = 0
+    # Why pruning stopped early, if it did. The MCS is then the smallest
+    # violating subsequence found by that point, and may not be 1-minimal
+    self.budget_exhausted = None
+    self.one_minimal = True
+    # { partitioning strategy -> # of replays of subsequences it produced }
+    self.replays_per_partitioner = {}
+    # Number of internal events in the MCS before and after minimizing them,
+    # and the classes of internal events that were pruned
+    self.internal_events_before_minimization = 0
+    self.internal_events_after_minimization = 0
+    self.pruned_internal_event_classes = []
+    # { event fingerprint -> predicted wait vs. observed latencies, see
+    #   TimeoutModel.summary() }
+    self.timeout_model = {}
     # { % of inferred fingerprints that were ambiguous ->
     #   # of replays where this % occurred }
     self.ambiguous_counts = {}
@@ -683,6 +2035,19 @@ class RuntimeStats(object):
   def set_runtime_stats_path(self, runtime_stats_path):
     self._runtime_stats_path = runtime_stats_path
 
+  def load_dict(self, d):
+    ''' Restore fields from json.loads() of our __dict__, e.g. as stored in a
+    checkpoint '''
+    for field, value in d.iteritems():
+      if field == "_runtime_stats_path":
+        continue
+      if type(value) == dict:
+        # json turns integer keys into strings
+        value = dict((int(k) if k.isdigit() else k, v)
+                     for k, v in value.iteritems())
+      setattr(self, str(field), value)
+    self.violation_found_in_run = Counter(self.violation_found_in_run)
+
   def get_runtime_stats_path(self):
     return self._runtime_stats_path
 
@@ -732,6 +2097,36 @@ class RuntimeStats(object):
     self.total_replays += 1
     self.total_inputs_replayed += number_inputs_replayed
 
+  def record_replay_cache_hit(self):
+    self.replay_cache_hits += 1
+
+  def record_budget_exhausted(self, reason):
+    self.budget_exhausted = reason
+    self.one_minimal = False
+
+  def record_strategy_replays(self, strategy, replays):
+    if strategy is None:
+      return
+    self.replays_per_partitioner[strategy] = \
+      self.replays_per_partitioner.get(strategy, 0) + replays
+
+  def record_internal_event_minimization(self, before, after, pruned_classes):
+    self.internal_events_before_minimization = before
+    self.internal_events_after_minimization = after
+    self.pruned_internal_event_classes = [ " ".join(map(str, klass))
+                                           for klass in pruned_classes ]
+
+  def record_monotonic_inference(self, replays_saved):
+    self.monotonic_inferences += 1
+    self.replays_saved_by_monotonicity += replays_saved
+
+  def record_prefix_snapshot_hit(self, events_skipped):
+    self.prefix_snapshot_hits += 1
+    self.prefix_snapshot_events_skipped += events_skipped
+
+  def record_timeout_model(self, summary):
+    self.timeout_model = summary
+
   def record_iteration_size(self, iteration_size):
     self.iteration_size[self._iteration] = iteration_size
     self._iteration += 1
@@ -758,6 +2153,12 @@ class RuntimeStats(object):
   def record_matched_events(self, matched_events):
     self.matched_events[self.subsequence_id] = matched_events
 
+  def record_event_waits(self, event_waits):
+    self.event_waits[self.subsequence_id] = event_waits
+
+  def record_early_exit_index(self, early_exit_index):
+    self.early_exit_indices[self.subsequence_id] = early_exit_index
+
   # -------------------- RPC helper methods -------------------- #
 
   def client_dict(self):
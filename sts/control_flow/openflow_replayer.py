@@ -43,9 +43,7 @@ from sts.control_flow.base import *
 from sts.controller_manager import *
 from sts.util.console import msg
 from sts.util.convenience import is_flow_mod
-
-# TODO(cs): need to virtualize time for the software switches to capture flow
-# entry timeouts. Currently they call time.time() to get the current time.
+from sts.util.virtual_clock import VirtualClock
 
 # TODO(cs): dump new event traces post-filtering.
 
@@ -58,7 +56,13 @@ class OpenFlowReplayer(ControlFlow):
   Replays OpenFlow messages and filters out messages that are not of interest,
   producing a new event trace file as output.
   '''
-  def __init__(self, simulation_cfg, superlog_path_or_dag, ignore_trailing_flow_mod_deletes=True):
+  def __init__(self, simulation_cfg, superlog_path_or_dag, ignore_trailing_flow_mod_deletes=True,
+               virtual_time=False):
+    '''
+    If virtual_time is True, replay on a virtual clock that jumps to the
+    recorded timestamp of each message, so that flow entries time out as
+    they did in the original run, without waiting in real time.
+    '''
     # TODO(cs): allow the user to specify a stop point in the event dag, in
     # case the point they are interested in occurs before the end of the trace.
     self.simulation_cfg = simulation_cfg
@@ -75,10 +79,15 @@ class OpenFlowReplayer(ControlFlow):
                         if type(e) == ControlMessageReceive
                         and type(e.get_packet()) != ofp_packet_out ]
     self.ignore_trailing_flow_mod_deletes = ignore_trailing_flow_mod_deletes
+    self.virtual_time = virtual_time
 
   def initialize_simulation(self):
+    virtual_clock = None
+    if self.virtual_time and self.event_list != []:
+      virtual_clock = VirtualClock(start_time=self.event_list[0].time.as_float())
     simulation = self.simulation_cfg.bootstrap(self.sync_callback,
-                                               boot_controllers=boot_mock_controllers)
+                                               boot_controllers=boot_mock_controllers,
+                                               virtual_clock=virtual_clock)
     # Setup mock connections
     connect_to_mock_controllers(simulation)
     return simulation
@@ -94,6 +103,8 @@ class OpenFlowReplayer(ControlFlow):
     # Reproduce the routing table state.
     all_flow_mods = []
     for next_event in self.event_list:
+      if simulation.virtual_clock is not None:
+        simulation.advance_virtual_time(next_event.time.as_float())
       if is_flow_mod(next_event):
         msg.special_event("Injecting %r" % next_event)
         all_flow_mods.append(next_event)
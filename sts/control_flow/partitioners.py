@@ -0,0 +1,218 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''
+Strategies for splitting the inputs of a trace into chunks for delta
+debugging, and for grouping its internal events into classes that are
+pruned together.
+
+Splitting by time (the default) ignores what the inputs touch. When a bug
+only involves part of the topology, splitting by the switch, link, host, or
+controller an input affects tends to find the inputs that matter in fewer
+replays, since unrelated inputs are pruned together.
+'''
+
+from sts.replay_event import *
+from sts.event_dag import AtomicInput, split_list
+
+class Partitioner(object):
+  ''' Splits inputs by time. Base class for all partitioners. '''
+  name = "time"
+
+  def partition(self, inputs, split_ways):
+    '''
+    Split inputs (a time-ordered list of input events or AtomicInputs) into
+    split_ways non-empty lists, each in time order.
+
+    Returns a tuple (name of the strategy that was used, lists)
+
+    Pre: 0 < split_ways <= len(inputs)
+    '''
+    return (self.name, split_list(inputs, split_ways))
+
+class DomainPartitioner(Partitioner):
+  '''
+  Groups inputs by key(), and distributes the groups over the chunks,
+  balancing the number of inputs per chunk. If there are fewer groups than
+  chunks, the largest chunks are split further by time.
+  '''
+  def key(self, event):
+    ''' Return what event affects, or None if it doesn't affect anything in
+    our domain (inputs with a key of None are grouped together). '''
+    raise NotImplementedError()
+
+  def groups(self, inputs):
+    ''' Return lists of the indices of inputs with the same key, in order of
+    first occurrence '''
+    key2group = {}
+    groups = []
+    for i, event in enumerate(inputs):
+      if isinstance(event, AtomicInput):
+        event = event.failure
+      key = self.key(event)
+      if key not in key2group:
+        key2group[key] = []
+        groups.append(key2group[key])
+      key2group[key].append(i)
+    return groups
+
+  def partition(self, inputs, split_ways):
+    return (self.name, self._chunks(inputs, self.groups(inputs), split_ways))
+
+  @staticmethod
+  def _chunks(inputs, groups, split_ways):
+    if len(groups) >= split_ways:
+      # Largest group first into the chunk with the fewest inputs so far
+      chunks = [ [] for _ in xrange(split_ways) ]
+      for group in sorted(groups, key=len, reverse=True):
+        min(chunks, key=len).extend(group)
+    else:
+      chunks = [ list(group) for group in groups ]
+      while len(chunks) < split_ways:
+        largest = max(chunks, key=len)
+        chunks.remove(largest)
+        chunks.extend(split_list(sorted(largest), 2))
+    chunks = sorted(sorted(chunk) for chunk in chunks)
+    return [ [ inputs[i] for i in chunk ] for chunk in chunks ]
+
+class SwitchPartitioner(DomainPartitioner):
+  ''' Splits inputs by the switch they affect. Links are keyed by the lower
+  of their two dpids. '''
+  name = "switch"
+
+  def key(self, event):
+    if isinstance(event, (LinkFailure, LinkRecovery)):
+      return min(event.start_dpid, event.end_dpid)
+    if isinstance(event, HostMigration):
+      return event.old_ingress_dpid
+    return getattr(event, "dpid", None)
+
+class LinkPartitioner(DomainPartitioner):
+  ''' Splits link failures and recoveries by link '''
+  name = "link"
+
+  def key(self, event):
+    if isinstance(event, (LinkFailure, LinkRecovery)):
+      return tuple(sorted([(event.start_dpid, event.start_port_no),
+                           (event.end_dpid, event.end_port_no)]))
+    return None
+
+class HostPartitioner(DomainPartitioner):
+  ''' Splits traffic injections and host migrations by host '''
+  name = "host"
+
+  def key(self, event):
+    if isinstance(event, (TrafficInjection, HostMigration)):
+      return event.host_id
+    return None
+
+class ControllerPartitioner(DomainPartitioner):
+  ''' Splits inputs by the controller(s) they affect '''
+  name = "controller"
+
+  def key(self, event):
+    if isinstance(event, (BlockControllerPair, UnblockControllerPair)):
+      return tuple(sorted([event.cid1, event.cid2]))
+    return getattr(event, "controller_id", None)
+
+class EventTypePartitioner(DomainPartitioner):
+  ''' Splits inputs by type. Recoveries go with the failures they undo. '''
+  name = "event_type"
+
+  _recovery_to_failure = {
+    SwitchRecovery : SwitchFailure,
+    LinkRecovery : LinkFailure,
+    ControllerRecovery : ControllerFailure,
+    ControlChannelUnblock : ControlChannelBlock,
+    UnblockControllerPair : BlockControllerPair,
+  }
+
+  def key(self, event):
+    return self._recovery_to_failure.get(type(event), type(event)).__name__
+
+class HybridPartitioner(Partitioner):
+  ''' Uses the first of partitioners that has at least as many groups as
+  chunks to fill, and splits by time otherwise. '''
+  name = "hybrid"
+
+  def __init__(self, partitioners=None):
+    if partitioners is None:
+      partitioners = [SwitchPartitioner(), HostPartitioner(),
+                      ControllerPartitioner()]
+    self.partitioners = partitioners
+
+  def partition(self, inputs, split_ways):
+    for partitioner in self.partitioners:
+      groups = partitioner.groups(inputs)
+      if len(groups) >= split_ways:
+        return (partitioner.name,
+                partitioner._chunks(inputs, groups, split_ways))
+    return (Partitioner.name, split_list(inputs, split_ways))
+
+def _packet_class(dp_fingerprint):
+  ''' lldp, arp, ipv4, or the ethernet type of other packets '''
+  field2value = dp_fingerprint._field2value
+  if "class" in field2value:
+    return field2value["class"]
+  if "nw_src" in field2value:
+    return "ipv4"
+  return "dl_type %s" % str(field2value.get("dl_type"))
+
+def internal_event_class(event):
+  '''
+  Return a key for the class of internal events that event belongs to: its
+  type, and the type of message or packet it carries (e.g. all LLDP
+  packet_ins, or all echo requests), regardless of which switch or
+  controller it involves.
+  '''
+  fingerprint = event.fingerprint
+  if isinstance(event, ControlMessageBase):
+    field2value = fingerprint[1]._field2value
+    data = field2value.get("data")
+    if isinstance(data, Fingerprint):
+      return (fingerprint[0], field2value["class"], _packet_class(data))
+    return (fingerprint[0], field2value["class"])
+  if isinstance(event, DataplanePermit):
+    return (fingerprint[0], _packet_class(fingerprint[1]))
+  if isinstance(event, ControllerStateChange):
+    # The format string passed to the controller's logging library
+    return tuple(fingerprint[:2])
+  if isinstance(event, DeterministicValue):
+    return (fingerprint[0], event.name)
+  return fingerprint
+
+def group_internal_events(events):
+  ''' Return [(class, [internal events of that class])] for the internal
+  events among events, in order of first occurrence '''
+  class2events = {}
+  classes = []
+  for event in events:
+    if not isinstance(event, InternalEvent):
+      continue
+    klass = internal_event_class(event)
+    if klass not in class2events:
+      class2events[klass] = []
+      classes.append(klass)
+    class2events[klass].append(event)
+  return [ (klass, class2events[klass]) for klass in classes ]
+
+name_to_partitioner = {
+  "time" : Partitioner,
+  "switch" : SwitchPartitioner,
+  "link" : LinkPartitioner,
+  "host" : HostPartitioner,
+  "controller" : ControllerPartitioner,
+  "event_type" : EventTypePartitioner,
+  "hybrid" : HybridPartitioner,
+}
@@ -74,9 +74,16 @@ class Peeker(object):
 
 class SnapshotPeeker(Peeker):
   ''' O(n) peeker that takes controller snapshots at each input, peeks
-  forward, then restarts the snapshot up until the next input'''
+  forward, then restarts the snapshot up until the next input
+
+  Each peek() runs in a child forked by forker (a LocalForker by default).
+  Since the child must inherit the simulation as it is at the time of the
+  peek(), a forker that reuses its children (e.g. PreforkForker) forks a
+  fresh one for each peek(), but saves the XML-RPC round trip. Give such a
+  forker max_tasks_per_worker=1, so that its children don't hold on to the
+  simulation's sockets between peeks.'''
   def __init__(self, simulation_cfg, default_wait_time_seconds=0.05,
-               epsilon_time=0.05, **kwargs):
+               epsilon_time=0.05, forker=None, **kwargs):
     if len(simulation_cfg.controller_configs) != 1:
       raise ValueError("Only one controller supported for snapshotting")
     if simulation_cfg.controller_configs[0].sync is not None:
@@ -84,7 +91,9 @@ class SnapshotPeeker(Peeker):
     super(SnapshotPeeker, self).__init__(simulation_cfg,
                                          default_wait_time_seconds=default_wait_time_seconds,
                                          epsilon_time=epsilon_time)
-    self.forker = LocalForker()
+    if forker is None:
+      forker = LocalForker()
+    self.forker = forker
     if 'default_dp_permit' in kwargs and not kwargs['default_dp_permit']:
       raise ValueError('''Non-default DP Permit not currently supported '''
                        '''Please implement the TODO near the sleep() call '''
@@ -221,7 +230,7 @@ class SnapshotPeeker(Peeker):
     def play_forward_and_marshal():
       # Can't marshal the simulation object, so use this method as a closure
       # instead.
-      # N.B. depends on LocalForker() -- cannot be used with RemoteForker().
+      # N.B. depends on a local forker -- cannot be used with RemoteForker().
       # TODO(cs): even though DataplaneDrops are technically InputEvents, they
       # may time out, and we might do well to try to infer this somehow.
       found_events = play_forward(simulation, inject_input, wait_time_seconds)
@@ -36,7 +36,7 @@ import signal
 import logging
 import time
 import sys
-from collections import defaultdict
+from collections import defaultdict, Counter, deque
 
 log = logging.getLogger("Replayer")
 
@@ -51,6 +51,9 @@ class Replayer(ControlFlow):
   # Interpolated time parameter. *not* the event scheduling epsilon:
   time_epsilon_microseconds = 500
 
+  # When ignoring interposition, how many events to log to the trace at once
+  input_log_batch_size = 1000
+
   kwargs = EventScheduler.kwargs | set(['create_event_scheduler', 'print_buffers',
                 'wait_on_deterministic_values', 'default_dp_permit',
                 'fail_to_interactive', 'fail_to_interactive_on_persistent_violations',
@@ -60,7 +63,8 @@ class Replayer(ControlFlow):
                 'pass_through_whitelisted_messages',
                 'delay_flow_mods', 'invariant_check_name',
                 'bug_signature', 'end_wait_seconds',
-                'transform_dag', 'pass_through_sends'])
+                'transform_dag', 'pass_through_sends',
+                'early_exit', 'early_exit_round_interval'])
 
   def __init__(self, simulation_cfg, superlog_path_or_dag, create_event_scheduler=None,
                print_buffers=True, wait_on_deterministic_values=False, default_dp_permit=False,
@@ -72,6 +76,7 @@ class Replayer(ControlFlow):
                delay_flow_mods=False, invariant_check_name="",
                bug_signature="", end_wait_seconds=0.5,
                transform_dag=None, pass_through_sends=False,
+               early_exit=False, early_exit_round_interval=None,
                **kwargs):
     '''
      - If invariant_check_name is not None, check it at the end for the
@@ -79,6 +84,12 @@ class Replayer(ControlFlow):
      - If bug_signature is not None, check whether this particular signature
        appears in the output of the invariant check at the end of the
        execution
+     - If early_exit is True, also check the invariant after every
+       CheckInvariants event in the trace, and every early_exit_round_interval
+       rounds (if not None). As soon as bug_signature appears (or any
+       violation, if there is no bug_signature), stop replaying. The index of
+       the last event replayed is then stored in self.early_exit_index.
+       Note that this treats transient violations as if they were persistent.
     '''
     ControlFlow.__init__(self, simulation_cfg)
     # Label uniquely identifying this replay, set in init_results()
@@ -102,14 +113,6 @@ class Replayer(ControlFlow):
 
     self.default_dp_permit = default_dp_permit
     self.dp_checker = self._setup_dp_checker(default_dp_permit)
-    if self.default_dp_permit:
-      # Set DataplanePermit and DataplaneDrop to passive if permit is set
-      # to default
-      # TODO(cs): rather than setting these to passive (which still causes them to
-      # be scheduled as regular events) should these just be removed from the
-      # event dag altogether?
-      for event in [ e for e in self.dag.events if type(e) in dp_events ]:
-        event.passive = default_dp_permit
 
     self.print_buffers_flag = print_buffers
 
@@ -135,9 +138,19 @@ class Replayer(ControlFlow):
     # statistics purposes.
     self.passed_unexpected_messages = []
     self.delay_flow_mods = delay_flow_mods
+    # Expected messages within expected_message_round_window rounds of the
+    # event we are replaying, for _check_unexpected_cp_messages
+    self._expected_messages = None
     self.end_wait_seconds = end_wait_seconds
     self.transform_dag = transform_dag
     self.bug_signature = bug_signature
+    self.early_exit = early_exit
+    self.early_exit_round_interval = early_exit_round_interval
+    self.early_exit_index = None
+    self._last_early_check_round = None
+    # If not None, called with the index of each event (besides the first one
+    # replayed) just before it is scheduled, e.g. to snapshot the simulation
+    self.before_event_hook = None
     self.invariant_check_name = invariant_check_name
     self.invariant_check = None
     if self.invariant_check_name:
@@ -147,10 +160,7 @@ class Replayer(ControlFlow):
                          self.invariant_check_name)
       self.invariant_check = name_to_invariant_check[self.invariant_check_name]
 
-    if self.pass_through_whitelisted_messages:
-      for event in self.dag.events:
-        if hasattr(event, "ignore_whitelisted_packets"):
-          event.ignore_whitelisted_packets = True
+    self._prepare_events()
 
     if create_event_scheduler:
       self.create_event_scheduler = create_event_scheduler
@@ -167,6 +177,40 @@ class Replayer(ControlFlow):
     if self.simulation_cfg.ignore_interposition:
       self._ignore_interposition()
 
+  def _prepare_events(self):
+    if self.default_dp_permit:
+      # Set DataplanePermit and DataplaneDrop to passive if permit is set
+      # to default
+      # TODO(cs): rather than setting these to passive (which still causes them to
+      # be scheduled as regular events) should these just be removed from the
+      # event dag altogether?
+      for event in [ e for e in self.dag.events if type(e) in dp_events ]:
+        event.passive = self.default_dp_permit
+    if self.pass_through_whitelisted_messages:
+      for event in self.dag.events:
+        if hasattr(event, "ignore_whitelisted_packets"):
+          event.ignore_whitelisted_packets = True
+
+  def switch_dag(self, dag, input_logger=None):
+    '''
+    Replay the rest of dag rather than the rest of self.dag, e.g. in a copy of
+    a simulation that was suspended part of the way through self.dag. The
+    events replayed so far must be a prefix of dag.
+
+    Pre: simulate() was called, and transform_dag is None
+    '''
+    self.dag = dag
+    self._input_logger = input_logger
+    self.unexpected_state_changes = []
+    self.early_state_changes = []
+    self.passed_unexpected_messages = []
+    self.dp_checker = self._setup_dp_checker(self.default_dp_permit)
+    self._prepare_events()
+    if self.pass_through_sends:
+      self.set_pass_through_sends(self.simulation)
+    if self.simulation_cfg.ignore_interposition:
+      self._ignore_interposition()
+
   def _log_input_event(self, event, **kws):
     if self._input_logger is not None:
       self._input_logger.log_input_event(event, **kws)
@@ -263,7 +307,8 @@ class Replayer(ControlFlow):
     for p in self.sync_callback.pending_state_changes():
       log.debug("- %s", p)
 
-  def run_simulation_forward(self, post_bootstrap_hook=None):
+  def run_simulation_forward(self, post_bootstrap_hook=None, start_index=0):
+    ''' Replay self.dag from its event at start_index onwards '''
     event_scheduler = self.create_event_scheduler(self.simulation)
     event_scheduler.set_input_logger(self._input_logger)
     self.event_scheduler_stats = event_scheduler.stats
@@ -276,28 +321,31 @@ class Replayer(ControlFlow):
       self.old_interrupt = None
       raise KeyboardInterrupt()
     self.old_interrupt = signal.signal(signal.SIGINT, interrupt)
+    self.early_exit_index = None
+    if self.early_exit and start_index < len(self.dag.events):
+      self._last_early_check_round = self.dag.events[start_index].round
+
+    if self.simulation_cfg.ignore_interposition:
+      replay_event = self._replay_input
+      if self._input_logger is not None:
+        self._input_logger.batch_writes(self.input_log_batch_size)
+    else:
+      replay_event = self._replay_event
 
     try:
-      for i, event in enumerate(self.dag.events):
+      for i, event in enumerate(self.dag.events[start_index:], start_index):
         try:
-          self.compute_interpolated_time(event)
-          if self.default_dp_permit:
-            self.dp_checker.check_dataplane(i, self.simulation)
-          if isinstance(event, InputEvent):
-            self._check_early_state_changes(self.dag, i, event)
-          self._check_new_state_changes(self.dag, i)
-          self._check_unexpected_cp_messages(self.dag, i)
-          # TODO(cs): quasi race-condition here. If unexpected state change
-          # happens *while* we're waiting for event, we basically have a
-          # deadlock (if controller logging is set to blocking) until the
-          # timeout occurs
-          # TODO(cs): we don't actually allow new internal message events
-          # through.. we only let new state changes through. Should experiment
-          # with whether we would get better fidelity if we let them through.
-          event_scheduler.schedule(event)
+          if self.before_event_hook is not None and i > start_index:
+            self.before_event_hook(i)
+          replay_event(event_scheduler, i, event)
           if self.logical_time != event.round:
             self.logical_time = event.round
             self.increment_round()
+          if self._should_check_early(event) and self._check_invariant(early=True):
+            msg.success("Stopping replay early, after event %d of %d" %
+                        (i, len(self.dag.events)))
+            self.early_exit_index = i
+            break
         except KeyboardInterrupt:
           interactive = Interactive(self.simulation_cfg,
                                     input_logger=self._input_logger)
@@ -310,7 +358,7 @@ class Replayer(ControlFlow):
                        % (str(event), self.replay_id))
           raise
 
-      if self.invariant_check:
+      if self.invariant_check and self.early_exit_index is None:
         # Wait a bit in case the bug takes awhile to happen
         # TODO(cs): may be redundant with WaitTime events at the end of the
         # trace.
@@ -319,22 +367,9 @@ class Replayer(ControlFlow):
 
         # TODO(cs): this does not verify whether the violation is persistent
         # or transient. Perhaps it should?
-        violations = self.invariant_check(self.simulation)
-        self.simulation.violation_found = False
-        if violations != []:
-          self._log_input_event(InvariantViolation(violations))
-          msg.fail("Violations at end of trace: %s" % str(violations))
-          if self.bug_signature:
-            if self.bug_signature in violations:
-              self.simulation.violation_found = True
-              msg.success("Violation found %s" % self.bug_signature)
-            else:
-              msg.fail("Violation does not match violation signature!")
-          else:
-            self.simulation.violation_found = True
-        else:
-          msg.success("No correctness violations!")
+        self._check_invariant()
     finally:
+      event_scheduler.close()
       if self.old_interrupt:
         signal.signal(signal.SIGINT, self.old_interrupt)
       msg.event(color.B_BLUE+"Event Stats: %s" % str(event_scheduler.stats))
@@ -344,6 +379,70 @@ class Replayer(ControlFlow):
       interactive = Interactive(self.simulation_cfg, input_logger=self._input_logger)
       interactive.simulate(self.simulation, bound_objects=( ('replayer', self), ))
 
+  def _replay_event(self, event_scheduler, i, event):
+    self.compute_interpolated_time(event)
+    if self.default_dp_permit:
+      self.dp_checker.check_dataplane(i, self.simulation)
+    if isinstance(event, InputEvent):
+      self._check_early_state_changes(self.dag, i, event)
+    self._check_new_state_changes(self.dag, i)
+    self._check_unexpected_cp_messages(self.dag, i)
+    # TODO(cs): quasi race-condition here. If unexpected state change
+    # happens *while* we're waiting for event, we basically have a
+    # deadlock (if controller logging is set to blocking) until the
+    # timeout occurs
+    # TODO(cs): we don't actually allow new internal message events
+    # through.. we only let new state changes through. Should experiment
+    # with whether we would get better fidelity if we let them through.
+    event_scheduler.schedule(event)
+
+  def _replay_input(self, event_scheduler, i, event):
+    ''' Fast path of _replay_event when ignoring interposition: the dag only
+    holds input events, and every internal event passes straight through, so
+    there are no pending state changes or messages to check for. We still
+    forward buffered dataplane packets. '''
+    self.compute_interpolated_time(event)
+    self.dp_checker.check_dataplane(i, self.simulation)
+    event_scheduler.schedule(event)
+
+  def _should_check_early(self, event):
+    if not self.early_exit or self.invariant_check is None:
+      return False
+    if (type(event) == CheckInvariants or
+        (self.early_exit_round_interval is not None and
+         event.round - self._last_early_check_round >= self.early_exit_round_interval)):
+      self._last_early_check_round = event.round
+      return True
+    return False
+
+  def _check_invariant(self, early=False):
+    ''' Run the invariant check, and set simulation.violation_found
+    accordingly. Return whether the violation was found.
+
+    If early, we are still in the middle of the trace, so stay quiet unless
+    the violation was found. '''
+    violations = self.invariant_check(self.simulation)
+    if self.bug_signature:
+      violation_found = self.bug_signature in violations
+    else:
+      violation_found = violations != []
+    if early and not violation_found:
+      return False
+
+    self.simulation.violation_found = violation_found
+    if violations != []:
+      self._log_input_event(InvariantViolation(violations))
+      msg.fail("Violations %s: %s" % ("before end of trace" if early else "at end of trace",
+                                      str(violations)))
+      if self.bug_signature:
+        if violation_found:
+          msg.success("Violation found %s" % self.bug_signature)
+        else:
+          msg.fail("Violation does not match violation signature!")
+    else:
+      msg.success("No correctness violations!")
+    return violation_found
+
   def _check_early_state_changes(self, dag, current_index, input):
     ''' Check whether any pending state change that were supposed to come
     *after* the current input have occured. If so, we have violated causality.'''
@@ -399,26 +498,18 @@ class Replayer(ControlFlow):
     # Currently it appears that this method is too liberal, and ends up
     # causing timouts as a result of letting messages through.
 
-    # First, build a set of expected ControlMessageSends/Receives fingerprints
+    # First, find the expected ControlMessageSends/Receives fingerprints
     # within the next expected_message_round_window rounds.
-    start_round = dag.events[current_index].round
-    expected_receive_fingerprints = set()
-    expected_send_fingerprints = set()
-    for i in xrange(current_index, len(dag.events)):
-      event = dag.events[i]
-      if event.round - start_round > self.expected_message_round_window:
-        break
-      if type(event) == ControlMessageReceive:
-        (_, of_fingerprint, dpid, cid) = event.fingerprint
-        expected_receive_fingerprints.add((of_fingerprint, dpid, cid))
-      if type(event) == ControlMessageSend:
-        (_, of_fingerprint, dpid, cid) = event.fingerprint
-        expected_send_fingerprints.add((of_fingerprint, dpid, cid))
+    if (self._expected_messages is None or
+        self._expected_messages.events is not dag.events):
+      self._expected_messages = ExpectedMessageWindow(dag.events,
+                                                      self.expected_message_round_window)
+    self._expected_messages.advance(current_index)
 
     # Now check pending messages.
     for expected_fingerprints, messages in [
-         (expected_receive_fingerprints, self.simulation.openflow_buffer.pending_receives),
-         (expected_send_fingerprints, self.simulation.openflow_buffer.pending_sends)]:
+         (self._expected_messages.receives, self.simulation.openflow_buffer.pending_receives),
+         (self._expected_messages.sends, self.simulation.openflow_buffer.pending_sends)]:
       for pending_message in messages:
         fingerprint = (pending_message.fingerprint,
                        pending_message.dpid,
@@ -437,6 +528,52 @@ class Replayer(ControlFlow):
           self.passed_unexpected_messages.append(repr(log_event))
           self._log_input_event(log_event)
 
+class ExpectedMessageWindow(object):
+  ''' Multisets of the (OFFingerprint, dpid, controller id) of the
+  ControlMessageReceives and ControlMessageSends within round_window rounds
+  of the replay cursor, maintained incrementally as the cursor advances
+  through events, rather than rebuilt for every event. '''
+  def __init__(self, events, round_window):
+    self.events = events
+    self.round_window = round_window
+    self.receives = Counter()
+    self.sends = Counter()
+    # The window is events[self._start:self._end]
+    self._start = 0
+    self._end = 0
+
+  def advance(self, index):
+    ''' Move the cursor to events[index] '''
+    start_round = self.events[index].round
+    if (index < self._start or
+        (self._start < self._end and start_round < self.events[self._start].round)):
+      # Rounds only go backwards in hand-edited traces. Start over
+      self.receives.clear()
+      self.sends.clear()
+      self._start = self._end = index
+    while self._start < index:
+      if self._start < self._end:
+        self._update(self.events[self._start], -1)
+      self._start += 1
+    self._end = max(self._end, self._start)
+    while (self._end < len(self.events) and
+           self.events[self._end].round - start_round <= self.round_window):
+      self._update(self.events[self._end], 1)
+      self._end += 1
+
+  def _update(self, event, delta):
+    if type(event) == ControlMessageReceive:
+      counter = self.receives
+    elif type(event) == ControlMessageSend:
+      counter = self.sends
+    else:
+      return
+    (_, of_fingerprint, dpid, cid) = event.fingerprint
+    key = (of_fingerprint, dpid, cid)
+    counter[key] += delta
+    if counter[key] == 0:
+      del counter[key]
+
 class AlwaysAllowDataplane(object):
   ''' A dataplane checker that always allows through events. Should not be
   used if there are any DataplaneDrops in the trace; in that case, use
@@ -473,13 +610,27 @@ class DataplaneChecker(object):
     # in the pruned run.
     self.events = list(event_dag.events)
     self.stats = DataplaneCheckerStats(self.events)
-    # The current sequence of dataplane events we expect within the current
-    # window
-    self.current_dp_fingerprints = []
-    # Mapping from fingerprint in current_dp_fingerprints to the index of the
-    # event in self.events
-    self.fingerprint_2_event_idx = {}
     self.slop_buffer = slop_buffer
+    # The fingerprint of each dataplane event in self.events without its class
+    # name (i.e. as computed for dp_events), or None for other events
+    self._dp_fingerprints = [ e.fingerprint[1:] if type(e) in dp_events else None
+                              for e in self.events ]
+    # Whether each event was already matched with a dp_event. We mark them
+    # rather than removing them from self.events, so that indices stay put
+    self._matched = bytearray(len(self.events))
+    # { round - self._min_round -> index of the first event at or after that round }
+    self._min_round = self.events[0].round if self.events != [] else 0
+    self._round_to_index = []
+    for i, event in enumerate(self.events):
+      while self._min_round + len(self._round_to_index) <= event.round:
+        self._round_to_index.append(i)
+    # The dataplane events we expect within the current window,
+    # self.events[self._head:self._tail]:
+    # { dp fingerprint -> deque of indices of unmatched events with that
+    #   fingerprint, in order }
+    self.current_dp_fingerprints = {}
+    self._head = 0
+    self._tail = 0
 
   def decide_drop(self, dp_event):
     ''' Returns True if this event should be dropped, False otherwise '''
@@ -489,43 +640,73 @@ class DataplaneChecker(object):
     # rate fuzzer_params
     dp_fingerprint = (DPFingerprint.from_pkt(dp_event.packet),
                       dp_event.node.dpid, dp_event.port.port_no)
+    return self.decide_drop_fingerprint(dp_fingerprint)
 
-    # Skip over the class name (first element of the tuple)
-    event_fingerprint = find(lambda f: f[1:] == dp_fingerprint,
-                             self.current_dp_fingerprints)
-    if event_fingerprint is None:
+  def decide_drop_fingerprint(self, dp_fingerprint):
+    ''' decide_drop, given the (DPFingerprint, dpid, port no) of the dp_event '''
+    indices = self.current_dp_fingerprints.get(dp_fingerprint)
+    if indices is None:
       # Default to permit if we didn't expect this dp event
       return False
-    # Flush this event from both our current window and our events list, so
-    # that we don't accidentally conflate distinct dp_events with the same
-    # fingerprint
-    self.current_dp_fingerprints.remove(event_fingerprint)
-    event_idx = self.fingerprint_2_event_idx[event_fingerprint].pop()
-    self.events.pop(event_idx)
+    # Flush the first such event from our current window, and mark it as
+    # matched, so that we don't accidentally conflate distinct dp_events with
+    # the same fingerprint
+    event_idx = indices.popleft()
+    if len(indices) == 0:
+      del self.current_dp_fingerprints[dp_fingerprint]
+    self._matched[event_idx] = 1
+    event_fingerprint = self.events[event_idx].fingerprint
     # First element of the tuple is the Event class name
     if event_fingerprint[0] == "DataplanePermit":
       return False
     self.stats.record_drop(event_fingerprint)
     return True # DataplaneDrop
 
+  def _index_of_round(self, round):
+    ''' Return the index of the first event at or after round '''
+    offset = round - self._min_round
+    if offset <= 0:
+      return 0
+    if offset >= len(self._round_to_index):
+      return len(self.events)
+    return self._round_to_index[offset]
+
   def update_window(self, current_round):
-    ''' Update the current slop buffer ("the dp_events we expect to see") '''
-    self.current_dp_fingerprints = []
-    self.fingerprint_2_event_idx = defaultdict(list)
-    # TODO(cs): O(n) operation
-    head_idx = find_index(lambda e: e.round == current_round - self.slop_buffer,
-                          self.events)
-    head_idx = max(head_idx, 0)
-    tail_idx = find_index(lambda e: e.round == current_round + self.slop_buffer,
-                          self.events)
-    if tail_idx is None:
-      tail_idx = len(self.events)
-    for i in xrange(head_idx, tail_idx):
-      if (type(self.events[i]) == DataplanePermit or
-          type(self.events[i]) == DataplaneDrop):
-        fingerprint = self.events[i].fingerprint
-        self.current_dp_fingerprints.append(fingerprint)
-        self.fingerprint_2_event_idx[fingerprint].append(i)
+    ''' Update the current slop buffer ("the dp_events we expect to see").
+    Moving the window forward takes time proportional to the number of events
+    that enter or leave it. '''
+    head = self._index_of_round(current_round - self.slop_buffer)
+    tail = self._index_of_round(current_round + self.slop_buffer)
+    if head < self._head or tail < self._tail:
+      # We went backwards. Start over
+      self.current_dp_fingerprints = {}
+      self._head = self._tail = head
+    while self._head < head:
+      if self._head < self._tail:
+        self._leave_window(self._head)
+      self._head += 1
+    self._tail = max(self._tail, self._head)
+    while self._tail < tail:
+      self._enter_window(self._tail)
+      self._tail += 1
+
+  def _enter_window(self, i):
+    dp_fingerprint = self._dp_fingerprints[i]
+    if dp_fingerprint is None or self._matched[i]:
+      return
+    if dp_fingerprint not in self.current_dp_fingerprints:
+      self.current_dp_fingerprints[dp_fingerprint] = deque()
+    self.current_dp_fingerprints[dp_fingerprint].append(i)
+
+  def _leave_window(self, i):
+    dp_fingerprint = self._dp_fingerprints[i]
+    if dp_fingerprint is None or self._matched[i]:
+      return
+    # Events leave in order, so i is the first unmatched one left
+    indices = self.current_dp_fingerprints[dp_fingerprint]
+    indices.popleft()
+    if len(indices) == 0:
+      del self.current_dp_fingerprints[dp_fingerprint]
 
   def check_dataplane(self, current_round, simulation):
     ''' Check dataplane events for before playing then next event.
@@ -20,7 +20,10 @@ protocol description.
 '''
 
 from sts.util.io_master import IOMaster
+from collections import OrderedDict, namedtuple
 import errno
+import os
+import signal
 import socket
 import logging
 log = logging.getLogger("snapshotter")
@@ -88,6 +91,16 @@ class IOWorkerCloner(object):
     self.io_worker.receive_buf = self.receive_buf
     self.io_worker.send_buf = self.send_buf
 
+  def restore_buffers(self):
+    '''
+    Bring the buffers back to the same state as they were in at the time
+    drain_buffers() was invoked, keeping the wrapped io_worker's socket.
+
+    Pre: drain_buffers has been called exactly once before.
+    '''
+    self.io_worker.receive_buf = self.receive_buf
+    self.io_worker.send_buf = self.send_buf
+
 class Snapshotter(object):
   ''' Handles snapshotting of a controller.
 
@@ -98,6 +111,8 @@ class Snapshotter(object):
     self.simulation = simulation
     self.controller = controller
     self.io_worker_cloner = None
+    # pid of the suspended copy of the controller
+    self.snapshot_pid = None
 
   def snapshot_controller(self):
     '''
@@ -109,7 +124,7 @@ class Snapshotter(object):
     io_worker = demuxer.true_io_worker
     self.io_worker_cloner = IOWorkerCloner(io_worker)
     self.io_worker_cloner.drain_buffers()
-    self.controller.snapshot()
+    self.snapshot_pid = self.controller.snapshot()
 
   def snapshot_proceed(self):
     '''
@@ -122,3 +137,97 @@ class Snapshotter(object):
     new_socket = self.controller.snapshot_proceed()
     self.io_worker_cloner.repopulate_buffers(new_socket)
 
+  def snapshot_continue(self):
+    '''
+    Keep going with the controller we snapshotted (e.g. in a fork()ed copy of
+    the simulation), leaving the suspended copy for later.
+
+    pre: snapshot_controller has been invoked
+    '''
+    self.io_worker_cloner.restore_buffers()
+    self.controller.snapshot_forget()
+
+  def snapshot_discard(self):
+    '''
+    Kill the suspended copy of the controller.
+
+    pre: snapshot_controller has been invoked, but not snapshot_proceed
+    '''
+    try:
+      os.kill(self.snapshot_pid, signal.SIGKILL)
+    except OSError:
+      # Already dead
+      pass
+    self.controller.snapshot_forget()
+
+# Where to find a simulation that was suspended after replaying a prefix of
+# the events of some trace: the domain socket it takes requests on, and its
+# pid.
+PrefixSnapshot = namedtuple('PrefixSnapshot', ['address', 'pid'])
+
+class PrefixSnapshotCache(object):
+  ''' Holds up to max_entries PrefixSnapshots, keyed by the labels of the
+  events they replayed. When full, the least recently used entry is evicted.
+  '''
+  def __init__(self, max_entries):
+    if max_entries < 1:
+      raise ValueError("max_entries must be at least 1")
+    self.max_entries = max_entries
+    # { hash of prefix -> (tuple of labels in prefix, PrefixSnapshot) },
+    # in order of last use
+    self._entries = OrderedDict()
+
+  def __len__(self):
+    return len(self._entries)
+
+  @staticmethod
+  def _prefix_hashes(labels):
+    ''' Return the hashes of every prefix of labels, shortest first (starting
+    with the empty prefix), computing each from the previous one so that
+    this takes linear time. '''
+    hashes = [ hash(()) ]
+    for label in labels:
+      hashes.append(hash((hashes[-1], label)))
+    return hashes
+
+  def longest_prefix(self, labels):
+    ''' Return (length, PrefixSnapshot) for the longest cached proper prefix
+    of labels, or None. '''
+    hashes = self._prefix_hashes(labels)
+    for length in xrange(len(labels) - 1, 0, -1):
+      entry = self._entries.get(hashes[length])
+      if entry is not None and entry[0] == tuple(labels[:length]):
+        # Mark as most recently used
+        del self._entries[hashes[length]]
+        self._entries[hashes[length]] = entry
+        return (length, entry[1])
+    return None
+
+  def __contains__(self, prefix_labels):
+    entry = self._entries.get(self._prefix_hashes(prefix_labels)[-1])
+    return entry is not None and entry[0] == tuple(prefix_labels)
+
+  def insert(self, prefix_labels, snapshot):
+    ''' Cache snapshot as having replayed prefix_labels. Returns a list of
+    the PrefixSnapshots evicted to make room for it (including any previous
+    entry for prefix_labels), which the caller should release. '''
+    key = self._prefix_hashes(prefix_labels)[-1]
+    evicted = []
+    if key in self._entries:
+      evicted.append(self._entries.pop(key)[1])
+    self._entries[key] = (tuple(prefix_labels), snapshot)
+    while len(self._entries) > self.max_entries:
+      (_, (_, old)) = self._entries.popitem(last=False)
+      evicted.append(old)
+    return evicted
+
+  def remove(self, prefix_labels):
+    key = self._prefix_hashes(prefix_labels)[-1]
+    if key in self._entries:
+      del self._entries[key]
+
+  def clear(self):
+    ''' Empty the cache, and return all of the PrefixSnapshots it held '''
+    snapshots = [ snapshot for (_, snapshot) in self._entries.values() ]
+    self._entries.clear()
+    return snapshots
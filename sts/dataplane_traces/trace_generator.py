@@ -25,14 +25,17 @@ from pox.lib.packet.arp import *
 import sts.topology as topo
 from collections import defaultdict
 import pickle
+from sts.util.compressed_files import open_compressed
 from sts.dataplane_traces.trace import DataplaneEvent
 
 def write_trace_log(dataplane_events, filename):
   '''
   Given a list of DataplaneEvents and a log filename, writes out a log.
-  For manual trace generation rather than replay logging
+  For manual trace generation rather than replay logging. The log is
+  compressed if filename ends in a compressed_files suffix.
   '''
-  pickle.dump(dataplane_events, file(filename, "w"))
+  with open_compressed(filename, "wb") as output:
+    pickle.dump(dataplane_events, output)
 
 def generate_example_trace():
   trace = []
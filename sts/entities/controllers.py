@@ -349,6 +349,9 @@ class Controller(ControllerAbstractClass):
     self.host_device = None
     self.welcome_msg = " =====> Starting Controller <===== "
     self.snapshot_socket = None
+    # (pid, snapshot socket) of the fork()ed controller from our last
+    # snapshot(), until snapshot_proceed()
+    self._pending_snapshot = None
 
   @property
   @deprecated
@@ -497,10 +500,39 @@ class Controller(ControllerAbstractClass):
 
   def snapshot(self):
     """
-    Causes the controller to fork() a (suspended) copy of itself.
+    Causes the controller to fork() a (suspended) copy of itself, and
+    returns the pid of the copy.
+
+    Each copy listens for commands on its own snapshot socket, so several
+    copies (e.g. held by different fork()ed simulations) can be suspended at
+    once.
     """
     self.log.info("Initiating snapshot")
     self.snapshot_socket.send("SNAPSHOT")
+    # Check that the fork()ed controller is ready
+    self.log.debug("Checking READY")
+    # N.B. snapshot_socket is blocking
+    response = self.snapshot_socket.recv(100)
+    match = re.match(r"READY (?P<pid>\d+)", response)
+    if not match:
+      raise ValueError("Unknown response %s" % response)
+    pid = int(match.group('pid'))
+    self.log.debug("Connecting to snapshot socket of %d" % pid)
+    snapshot_socket = connect_socket_with_backoff(
+      address="%s.%d" % (self.config.snapshot_address, pid))
+    self._pending_snapshot = (pid, snapshot_socket)
+    return pid
+
+  def snapshot_forget(self):
+    """
+    Close our connection to the suspended copy from the last snapshot(),
+    e.g. since a fork()ed simulation is holding on to it instead.
+
+    Pre: snapshot() has been invoked
+    """
+    (_, snapshot_socket) = self._pending_snapshot
+    self._pending_snapshot = None
+    snapshot_socket.close()
 
   def snapshot_proceed(self):
     """
@@ -519,14 +551,8 @@ class Controller(ControllerAbstractClass):
     Pre: snapshot() has been invoked
     """
     self.log.info("Initiating snapshot proceed")
-    # Check that the fork()ed controller is ready
-    self.log.debug("Checking READY")
-    # N.B. snapshot_socket is blocking
-    response = self.snapshot_socket.recv(100)
-    match = re.match(r"READY (?P<pid>\d+)", response)
-    if not match:
-      raise ValueError("Unknown response %s" % response)
-    pid = int(match.group('pid'))
+    (pid, snapshot_socket) = self._pending_snapshot
+    self._pending_snapshot = None
 
     # De-registers the old controller process and registers the new controller
     # process.
@@ -534,9 +560,12 @@ class Controller(ControllerAbstractClass):
     self.process = SnapshotPopen(pid)
     self._register_proc(self.process)
 
-    # Send PROCEED
+    # Send PROCEED. From now on the woken controller takes further snapshot
+    # commands on its own snapshot socket
     self.log.debug("Sending PROCEED")
-    self.snapshot_socket.send("PROCEED")
+    snapshot_socket.send("PROCEED")
+    self.snapshot_socket.close()
+    self.snapshot_socket = snapshot_socket
 
     # Reconnect
     self.log.debug("Connecting new mux socket")
@@ -57,21 +57,39 @@ class AtomicInput(object):
     return "AtomicInput:%r%r" % (self.failure, self.recoveries)
 
 class EventDagView(object):
-  def __init__(self, parent, events_list):
-    ''' subset is a list '''
+  def __init__(self, parent, mask, migrations=None):
+    ''' mask is a bit mask over the indices of parent's events (bit i is set
+    iff parent.events[i] is in the view). migrations maps the indices of host
+    migrations that were rewritten for this view to their replacements. '''
     self._parent = parent
-    self._events_list = list(events_list)
-    self._events_set = set(self._events_list)
+    self._mask = mask
+    if migrations is None:
+      migrations = {}
+    self._migrations = migrations
+    # Materialized lazily, since most views are only inspected for their
+    # input events
+    self._events_list = None
+    self._input_events = None
+    self._len = None
+    self._next_state_changes = None
 
   @property
   def events(self):
     '''Return the events in the DAG'''
+    if self._events_list is None:
+      self._events_list = self._parent._materialize(self._mask, self._migrations)
     return self._events_list
 
+  @property
+  def _events_set(self):
+    return set(self.events)
+
   @property
   def input_events(self):
-    # TODO(cs): memoize?
-    return [ e for e in self._events_list if isinstance(e, InputEvent) and e.prunable ]
+    if self._input_events is None:
+      self._input_events = self._parent._materialize(self._mask & self._parent._input_mask,
+                                                     self._migrations)
+    return self._input_events
 
   @property
   def atomic_input_events(self):
@@ -86,16 +104,19 @@ class EventDagView(object):
     return self._parent.atomic_input_subset(subset)
 
   def input_complement(self, subset):
-    return self._parent.input_complement(subset, self._events_list)
+    return self._parent.input_complement(subset, self._mask, self._migrations)
 
   def insert_atomic_inputs(self, inputs):
-    return self._parent.insert_atomic_inputs(inputs, events_list=self._events_list)
+    return self._parent.insert_atomic_inputs(inputs, self._mask, self._migrations)
 
   def add_inputs(self, inputs):
-    return self._parent.add_inputs(inputs, self._events_list)
+    return self._parent.add_inputs(inputs, self.events)
 
   def next_state_change(self, index):
-    return self._parent.next_state_change(index, events=self.events)
+    if self._next_state_changes is None:
+      self._next_state_changes = next_state_change_indices(self.events)
+    i = self._next_state_changes[index]
+    return None if i is None else self.events[i]
 
   def get_original_index_for_event(self, event):
     return self._parent.get_original_index_for_event(event)
@@ -107,10 +128,18 @@ class EventDagView(object):
     return self._parent.set_events_as_timed_out(timed_out_event_labels)
 
   def filter_timeouts(self):
-    return self._parent.filter_timeouts(events_list=self._events_list)
+    return self._parent.filter_timeouts(self._mask, self._migrations)
+
+  def internal_complement(self, subset):
+    return self._parent.internal_complement(subset, self._mask, self._migrations)
+
+  def restore_view(self, labels):
+    return self._parent.restore_view(labels)
 
   def __len__(self):
-    return len(self._events_list)
+    if self._len is None:
+      self._len = bin(self._mask).count("1")
+    return self._len
 
 # TODO(cs): move these somewhere else
 def migrations_per_host(events):
@@ -120,21 +149,50 @@ def migrations_per_host(events):
       host2migrations[e.host_id].append(e)
   return host2migrations
 
-def replace_migration(replacee, old_location, new_location, event_list):
+def rewrite_migration(replacee, old_location, new_location):
   # `replacee' is the migration to be replaced
   # Don't mutate replacee -- instead, replace it
-  new_migration = HostMigration(old_location[0], old_location[1],
-                                new_location[0], new_location[1],
-                                host_id=replacee.host_id,
-                                time=replacee.time, label=replacee.label)
+  return HostMigration(old_location[0], old_location[1],
+                       new_location[0], new_location[1],
+                       host_id=replacee.host_id,
+                       time=replacee.time, label=replacee.label)
+
+def replace_migration(replacee, old_location, new_location, event_list):
+  new_migration = rewrite_migration(replacee, old_location, new_location)
   # TODO(cs): O(n^2)
   index = event_list.index(replacee)
   event_list[index] = new_migration
   return new_migration
 
+def next_state_change_indices(events):
+  ''' Return a list whose i'th entry is the index of the first
+  ControllerStateChange in events at or after i, or None '''
+  indices = [None] * (len(events) + 1)
+  next_index = None
+  for i in xrange(len(events) - 1, -1, -1):
+    if type(events[i]) == ControllerStateChange:
+      next_index = i
+    indices[i] = next_index
+  return indices
+
+def mask_indices(mask):
+  ''' Return the indices of the set bits of mask, in increasing order '''
+  # bin() is much faster than testing bits one at a time
+  bits = bin(mask)[:1:-1]
+  indices = []
+  i = bits.find("1")
+  while i != -1:
+    indices.append(i)
+    i = bits.find("1", i + 1)
+  return indices
+
 class EventDag(object):
   '''A collection of Event objects. EventDags are primarily used to present a
-  view of the underlying events with some subset of the input events pruned
+  view of the underlying events with some subset of the input events pruned.
+
+  Views are represented as bit masks over the indices of our events, so that
+  computing subsets and complements doesn't require walking the whole trace
+  in python.
   '''
 
   # We peek ahead this many seconds after the timestamp of the subseqeunt
@@ -175,6 +233,22 @@ class EventDag(object):
       for host, migrations in migrations_per_host(self._events_list).iteritems()
     }
     self._last_violation = None
+    self._mask = (1 << len(self._events_list)) - 1
+    self._migrations = {}
+    self._input_indices = [ i for i, e in enumerate(self._events_list)
+                            if isinstance(e, InputEvent) and e.prunable ]
+    self._input_events = [ self._events_list[i] for i in self._input_indices ]
+    self._input_mask = self._indices_mask(self._input_indices)
+    self._recovery_mask = self._events_mask(e for e in self._events_list
+                                            if type(e) in self._recovery_types)
+    self._migration_mask = self._events_mask(e for e in self._events_list
+                                             if type(e) == HostMigration)
+    # [(index of event with dependents, mask of its dependents)], computed
+    # lazily since dependents are filled in by mark_invalid_input_sequences()
+    self._dependents_masks = None
+    # { index -> index of the next ControllerStateChange at or after it },
+    # computed lazily
+    self._next_state_changes = None
 
   @property
   def events(self):
@@ -183,13 +257,51 @@ class EventDag(object):
 
   @property
   def input_events(self):
-    # TODO(cs): memoize?
-    return [ e for e in self._events_list if isinstance(e, InputEvent) and e.prunable ]
+    return self._input_events
 
   @property
   def atomic_input_events(self):
     return self._atomic_input_events(self.input_events)
 
+  def _indices_mask(self, indices):
+    ''' Return a mask with the given bits set '''
+    if self._events_list == []:
+      return 0
+    # Building a long bit by bit is quadratic, so build its binary string
+    bits = bytearray("0" * len(self._events_list))
+    for i in indices:
+      bits[i] = "1"
+    bits.reverse()
+    return int(str(bits), 2)
+
+  def _events_mask(self, events):
+    ''' Return a mask of our indices of the given events. Events that aren't
+    ours are ignored. '''
+    return self._indices_mask(self._event2idx[e] for e in events
+                              if e in self._event2idx)
+
+  def _materialize(self, mask, migrations):
+    ''' Return the list of events in mask '''
+    events = self._events_list
+    if migrations == {}:
+      return [ events[i] for i in mask_indices(mask) ]
+    return [ migrations[i] if i in migrations else events[i]
+             for i in mask_indices(mask) ]
+
+  def _get_dependents_masks(self):
+    if self._dependents_masks is None:
+      self._dependents_masks = []
+      for i, event in enumerate(self._events_list):
+        if event.dependent_labels == []:
+          continue
+        # Dependents that precede their dependee are never pruned along with
+        # it, since we walk the trace in order
+        dependents = [ self._event2idx[self._label2event[label]]
+                       for label in event.dependent_labels ]
+        self._dependents_masks.append(
+          (i, self._indices_mask(j for j in dependents if j > i)))
+    return self._dependents_masks
+
   def _get_event(self, label):
     if label not in self._label2event:
       raise ValueError("Unknown label %s" % str(label))
@@ -227,32 +339,24 @@ class EventDag(object):
     return inputs
 
   def filter_unsupported_input_types(self):
-    return EventDagView(self, (e for e in self._events_list
-                               if type(e) not in self._ignored_input_types))
-
-  def compute_remaining_input_events(self, ignored_portion, events_list=None):
-    ''' ignore all input events in ignored_inputs,
-    as well all of their dependent input events'''
-    if events_list is None:
-      events_list = self.events
-    remaining = []
-    for event in events_list:
-      if event not in ignored_portion:
-        remaining.append(event)
-      else:
-        # Add dependent to ignored_portion
-        for label in event.dependent_labels:
-          # Note that recoveries will be a dependent of preceding failures
-          dependent_event = self._label2event[label]
-          ignored_portion.add(dependent_event)
-
-    # Update the migration locations in remaining
-    self.update_migrations(remaining, ignored_portion, events_list)
-    return remaining
-
-  def update_migrations(self, remaining, ignored_portion, events_list):
-    ''' Walk through remaining input events, and update the source location of
-    the host migration. For example, if one host migrates twice:
+    ignored = self._events_mask(e for e in self._events_list
+                                if type(e) in self._ignored_input_types)
+    return EventDagView(self, self._mask & ~ignored)
+
+  def _prune(self, ignored, mask, migrations):
+    ''' Return a view of mask, with all input events in ignored as well as
+    all of their dependent input events pruned'''
+    ignored &= mask
+    for i, dependents in self._get_dependents_masks():
+      if (ignored >> i) & 1:
+        ignored |= dependents
+    remaining = mask & ~ignored
+    migrations = self._update_migrations(remaining, ignored, mask, migrations)
+    return EventDagView(self, remaining, migrations)
+
+  def _update_migrations(self, remaining, ignored, mask, migrations):
+    ''' Walk through the host migrations in mask, and update the source
+    location of those in remaining. For example, if one host migrates twice:
 
     location A -> location B -> location C
 
@@ -261,21 +365,24 @@ class EventDag(object):
 
     location A -> location C
 
-    Note: mutates remaining
+    Return the rewritten migrations of remaining.
     '''
     # TODO(cs): this should be moved outside of EventDag
-    # TODO(cs): this algorithm could be simplified substantially by invoking
-    # migrations_per_host()
+    remaining_migrations = dict((i, m) for i, m in migrations.iteritems()
+                                if (remaining >> i) & 1)
+    if ignored & self._migration_mask == 0:
+      return remaining_migrations
 
     # keep track of the most recent location of the host that did not involve
     # a pruned HostMigration event
     # location is: (ingress dpid, ingress port no)
     currentloc2unprunedloc = {}
 
-    for m in [e for e in events_list if type(e) == HostMigration]:
+    for i in mask_indices(mask & self._migration_mask):
+      m = migrations.get(i, self._events_list[i])
       src = m.old_location
       dst = m.new_location
-      if m in ignored_portion:
+      if (ignored >> i) & 1:
         if src in currentloc2unprunedloc:
           # There was a prior migration in ignored_portion
           # Update the new dst to point back to the unpruned location
@@ -293,103 +400,86 @@ class EventDag(object):
           # last unpruned location
           unpruned_loc = currentloc2unprunedloc[src]
           del currentloc2unprunedloc[src]
-          new_loc = dst
-          replace_migration(m, unpruned_loc, new_loc, remaining)
+          remaining_migrations[i] = rewrite_migration(m, unpruned_loc, dst)
+    return remaining_migrations
 
-  def _ignored_except_internals_and_recoveries(self, ignored_portion):
+  def input_subset(self, subset):
+    ''' Return a view of the dag with only the subset and subset dependents
+    remaining'''
     # Note that dependent_labels only contains dependencies between input
     # events. Dependencies with internal events are inferred by EventScheduler.
     # Also note that we treat failure/recovery as an atomic pair, so we don't prune
     # recovery events on their own.
-    return set(e for e in ignored_portion
-               if (isinstance(e, InputEvent) and e.prunable and
-                   type(e) not in self._recovery_types))
-
-  def _ignored_except_internals(self, ignored_portion):
-    return set(e for e in ignored_portion if isinstance(e, InputEvent) and
-               e.prunable)
-
-  def input_subset(self, subset):
-    ''' Return a view of the dag with only the subset and subset dependents
-    remaining'''
-    ignored = self._events_set - set(subset)
-    ignored = self._ignored_except_internals_and_recoveries(ignored)
-    remaining_events = self.compute_remaining_input_events(ignored)
-    return EventDagView(self, remaining_events)
+    ignored = self._input_mask & ~self._recovery_mask & ~self._events_mask(subset)
+    return self._prune(ignored, self._mask, {})
 
   def atomic_input_subset(self, subset):
     ''' Return a view of the dag with only the subset remaining, where
     dependent input pairs remain together'''
-    # Relatively simple: expand atomic pairs into individual inputs, take
-    # all input events in result, and compute_remaining_input_events as normal
+    # Relatively simple: expand atomic pairs into individual inputs, and
+    # prune all other input events as normal
     subset = self._expand_atomics(subset)
-    ignored = self._events_set - set(subset)
-    ignored = self._ignored_except_internals(ignored)
-    remaining_events = self.compute_remaining_input_events(ignored)
-    return EventDagView(self, remaining_events)
+    ignored = self._input_mask & ~self._events_mask(subset)
+    return self._prune(ignored, self._mask, {})
 
-  def input_complement(self, subset, events_list=None):
+  def input_complement(self, subset, mask=None, migrations=None):
     ''' Return a view of the dag with everything except the subset and
     subset dependencies'''
-    subset = self._ignored_except_internals_and_recoveries(subset)
-    remaining_events = self.compute_remaining_input_events(subset, events_list)
-    return EventDagView(self, remaining_events)
+    if mask is None:
+      mask = self._mask
+      migrations = {}
+    ignored = self._events_mask(subset) & self._input_mask & ~self._recovery_mask
+    return self._prune(ignored, mask, migrations)
 
-  def _straighten_inserted_migrations(self, remaining_events):
+  def _straighten_inserted_migrations(self, mask, migrations):
     ''' This is a bit hairy: when migrations are added back in, there may be
     gaps in host locations. We need to straighten out those gaps -- i.e. make
     the series of host migrations for any given host a line.
 
-    Pre: remaining_events is sorted in the same relative order as the original
-    trace
+    Return the rewritten migrations of mask.
     '''
-    host2migrations = migrations_per_host(remaining_events)
-    for host, migrations in host2migrations.iteritems():
-      # Prime the loop with the initial location
-      previous_location = self._host2initial_location[host]
-      for m in migrations:
-        if m.old_location != previous_location:
-          replacement = replace_migration(m, previous_location,
-                                          m.new_location, remaining_events)
-        else:
-          replacement = m
-        previous_location = replacement.new_location
-    return remaining_events
-
-  def insert_atomic_inputs(self, atomic_inputs, events_list=None):
-    '''Insert inputs into events_list in the same relative order as the
-    original events list. This method is needed because set union as used in
-    delta debugging does not make sense for event sequences (events are ordered)'''
-    # Note: events_list should never be None (I think), since it does not make
+    straightened = {}
+    # Prime the loop with the initial locations
+    previous_location = dict(self._host2initial_location)
+    for i in mask_indices(mask & self._migration_mask):
+      m = migrations.get(i, self._events_list[i])
+      if m.old_location != previous_location[m.host_id]:
+        m = rewrite_migration(m, previous_location[m.host_id], m.new_location)
+      if m is not self._events_list[i]:
+        straightened[i] = m
+      previous_location[m.host_id] = m.new_location
+    return straightened
+
+  def insert_atomic_inputs(self, atomic_inputs, mask=None, migrations=None):
+    '''Insert inputs into the view given by mask in the same relative order as
+    the original events list. This method is needed because set union as used
+    in delta debugging does not make sense for event sequences (events are
+    ordered)'''
+    # Note: mask should never be None (I think), since it does not make
     # sense to insert inputs into the original sequence that are already present
-    if events_list is None:
+    if mask is None:
       raise ValueError("Shouldn't be adding inputs to the original trace")
 
     inputs = self._expand_atomics(atomic_inputs)
 
     if not all(e in self._event2idx for e in inputs):
       raise ValueError("Not all inputs present in original events list %s" %
-                       [e for e in input if e not in self._event2idx])
-    if not all(e in self._event2idx for e in events_list):
-      raise ValueError("Not all events in original events list %s" %
-                       [e for e in events_list if e not in self._event2idx])
-
-    result = []
-    for _, successor in enumerate(events_list):
-      orig_successor_idx = self._event2idx[successor]
-      while len(inputs) > 0 and orig_successor_idx > self._event2idx[inputs[0]]:
-        # If the current successor did in fact come after the next input in the
-        # original trace, insert next input here
-        input = inputs.pop(0)
-        result.append(input)
-      result.append(successor)
-
-    # Any remaining inputs should be appended at the end -- they had no
-    # successors
-    result += inputs
+                       [e for e in inputs if e not in self._event2idx])
+
+    # Since views are masks over the original events list, union preserves
+    # the original order
+    result = mask | self._events_mask(inputs)
     # Deal with newly added host migrations
-    result = self._straighten_inserted_migrations(result)
-    return EventDagView(self, result)
+    migrations = self._straighten_inserted_migrations(result, migrations)
+    return EventDagView(self, result, migrations)
+
+  def restore_view(self, labels):
+    ''' Return a view of the dag with exactly the events with the given labels,
+    e.g. as previously recorded from view.events in a checkpoint.'''
+    mask = self._events_mask(self._get_event(label) for label in labels)
+    # Views may contain rewritten host migrations
+    return EventDagView(self, mask,
+                        self._straighten_inserted_migrations(mask, {}))
 
   def mark_invalid_input_sequences(self):
     '''Fill in domain knowledge about valid input
@@ -420,17 +510,16 @@ class EventDag(object):
         #elif type(event) in self._ignored_input_types:
         #  raise RuntimeError("No support for %s dependencies" %
         #                      type(event).__name__)
+    self._dependents_masks = None
 
-  def next_state_change(self, index, events=None):
+  def next_state_change(self, index):
     ''' Return the next ControllerStateChange that occurs at or after
     index.'''
-    if events is None:
-      events = self.events
     # TODO(cs): for now, assumes a single controller
-    for event in events[index:]:
-      if type(event) == ControllerStateChange:
-        return event
-    return None
+    if self._next_state_changes is None:
+      self._next_state_changes = next_state_change_indices(self._events_list)
+    i = self._next_state_changes[index]
+    return None if i is None else self._events_list[i]
 
   def get_original_index_for_event(self, event):
     return self._event2idx[event]
@@ -455,8 +544,19 @@ class EventDag(object):
     for label in timed_out_event_labels:
       self._get_event(label).timed_out = True
 
-  def filter_timeouts(self, events_list=None):
-    if events_list is None:
-      events_list = self._events_list
-    no_timeouts = [ e for e in events_list if not e.timed_out ]
-    return EventDagView(self, no_timeouts)
+  def filter_timeouts(self, mask=None, migrations=None):
+    if mask is None:
+      mask = self._mask
+      migrations = {}
+    timed_out = self._indices_mask(i for i in mask_indices(mask)
+                                   if migrations.get(i, self._events_list[i]).timed_out)
+    return EventDagView(self, mask & ~timed_out, migrations)
+
+  def internal_complement(self, subset, mask=None, migrations=None):
+    ''' Return a view of the dag without the internal events in subset.
+    Input events in subset are ignored. '''
+    if mask is None:
+      mask = self._mask
+      migrations = {}
+    ignored = self._events_mask(e for e in subset if isinstance(e, InternalEvent))
+    return EventDagView(self, mask & ~ignored, migrations)
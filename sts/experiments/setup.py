@@ -41,12 +41,17 @@ def setup_experiment(args, config):
     now = timestamp_string()
     config.results_dir += "_" + str(now)
 
-  # Set up results directory
+  # Set up results directory. When resuming, keep the previous run's results
+  # (including its checkpoint)
   create_python_dir("./experiments")
-  create_clean_python_dir(config.results_dir)
+  if args.resume:
+    create_python_dir(config.results_dir)
+  else:
+    create_clean_python_dir(config.results_dir)
 
   # Copy stdout and stderr to a file "simulator.out"
-  tee = Tee(open(os.path.join(config.results_dir, "simulator.out"), "w"))
+  tee = Tee(open(os.path.join(config.results_dir, "simulator.out"),
+                 "a" if args.resume else "w"))
   tee.tee_stdout()
   tee.tee_stderr()
 
@@ -30,7 +30,7 @@ class Fingerprint(object):
   def to_dict(self):
     flattened = {}
     for field, value in self._field2value.iteritems():
-      if 'to_dict' in dir(value):
+      if hasattr(value, 'to_dict'):
         flattened[field] = value.to_dict()
       else:
         flattened[field] = value
@@ -0,0 +1,228 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''
+Indexed binary superlogs, with random access to events by label, round and
+class.
+
+`btrace' format (files ending in BINARY_TRACE_EXTENSION):
+  header:  MAGIC
+  records: one per event, in trace order. Each is a 4 byte big-endian
+           length followed by the event's json hash, exactly as it would
+           appear on a line of a json superlog (without the newline).
+  index:   a marshalled dict:
+             'labels':  label -> record offset
+             'rounds':  round -> (offset of the round's first record,
+                                  offset just past its last record)
+             'classes': class name -> [record offsets, in trace order]
+  trailer: 8 byte big-endian offset of the index, then MAGIC
+
+Since the records are the json lines themselves, converting between the
+two formats is lossless in both directions. btrace files are never
+compressed, since reading them means seeking.
+'''
+
+import json
+import marshal
+import struct
+import sts.replay_event as event
+from sts.util.compressed_files import open_compressed
+
+BINARY_TRACE_EXTENSION = ".btrace"
+MAGIC = "STSBTRC1"
+
+_record_header = struct.Struct(">I")
+_trailer = struct.Struct(">Q%ds" % len(MAGIC))
+
+name_to_class = {
+  klass.__name__ : klass
+  for klass in event.all_events
+}
+
+def is_binary_trace_path(path):
+  return path.endswith(BINARY_TRACE_EXTENSION)
+
+class BinaryTraceWriter(object):
+  '''
+  Writes records to a btrace file, and the index once closed. Nothing can be
+  read from the file until it has been closed.
+  '''
+  def __init__(self, path):
+    self.path = path
+    self._output = open(path, 'wb')
+    self._output.write(MAGIC)
+    self._offset = len(MAGIC)
+    self._labels = {}
+    self._rounds = {}
+    self._classes = {}
+
+  @property
+  def closed(self):
+    return self._output.closed
+
+  def write_record(self, json_line, label, round, class_name):
+    ''' Append one event's json hash, plus the keys it is indexed by '''
+    if label in self._labels:
+      raise RuntimeError("Event label %s already exists!" % label)
+    if type(json_line) == unicode:
+      json_line = json_line.encode('utf-8')
+    record_offset = self._offset
+    self._output.write(_record_header.pack(len(json_line)))
+    self._output.write(json_line)
+    self._offset += _record_header.size + len(json_line)
+    self._labels[label] = record_offset
+    if round in self._rounds:
+      self._rounds[round] = (self._rounds[round][0], self._offset)
+    else:
+      self._rounds[round] = (record_offset, self._offset)
+    self._classes.setdefault(class_name, []).append(record_offset)
+
+  def write_event(self, event):
+    self.write_record(event.to_json(), event.label, event.round,
+                      type(event).__name__)
+
+  def write_json_line(self, json_line):
+    json_hash = json.loads(json_line)
+    self.write_record(json_line, json_hash['label'], json_hash.get('round', -1),
+                      json_hash['class'])
+
+  def close(self):
+    if self.closed:
+      return
+    index = {'labels': self._labels,
+             'rounds': self._rounds,
+             'classes': self._classes}
+    self._output.write(marshal.dumps(index, 2))
+    self._output.write(_trailer.pack(self._offset, MAGIC))
+    self._output.close()
+
+class BinaryTraceReader(object):
+  ''' Reads a btrace file. Only the index is loaded up front. '''
+  def __init__(self, path):
+    self.path = path
+    self._input = open(path, 'rb')
+    if self._input.read(len(MAGIC)) != MAGIC:
+      self._input.close()
+      raise ValueError("%s is not a binary trace" % path)
+    self._input.seek(-_trailer.size, 2)
+    (self._index_offset, magic) = _trailer.unpack(self._input.read(_trailer.size))
+    if magic != MAGIC:
+      self._input.close()
+      raise ValueError("%s is truncated (was it closed?)" % path)
+    self._input.seek(self._index_offset)
+    index = marshal.loads(self._input.read())
+    self._labels = index['labels']
+    self._rounds = index['rounds']
+    self._classes = index['classes']
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+  def close(self):
+    self._input.close()
+
+  def __len__(self):
+    return len(self._labels)
+
+  def _read_record(self, offset):
+    self._input.seek(offset)
+    (length,) = _record_header.unpack(self._input.read(_record_header.size))
+    return self._input.read(length)
+
+  def _iter_records(self, start, end):
+    ''' Generate (offset, json line) for each record in [start, end) '''
+    offset = start
+    while offset < end:
+      json_line = self._read_record(offset)
+      yield (offset, json_line)
+      offset += _record_header.size + len(json_line)
+
+  def iter_json_lines(self):
+    ''' Generate the json hash of every event in the trace, in order '''
+    for (_, json_line) in self._iter_records(len(MAGIC), self._index_offset):
+      yield json_line
+
+  @property
+  def labels(self):
+    return self._labels.keys()
+
+  @property
+  def rounds(self):
+    return sorted(self._rounds.keys())
+
+  @property
+  def class_names(self):
+    return self._classes.keys()
+
+  def event_with_label(self, label):
+    ''' Return the event labeled label, or None if there isn't one '''
+    if label not in self._labels:
+      return None
+    return decode_event(self._read_record(self._labels[label]))
+
+  def events_in_round(self, round):
+    ''' Return the events of the given round, in trace order '''
+    if round not in self._rounds:
+      return []
+    (start, end) = self._rounds[round]
+    events = []
+    for (_, json_line) in self._iter_records(start, end):
+      e = decode_event(json_line)
+      if e is not None and e.round == round:
+        events.append(e)
+    return events
+
+  def events_of_class(self, class_name, predicate=lambda e: True):
+    ''' Return the events of the named class (optionally, only those for
+    which predicate is true), in trace order. e.g.:
+      reader.events_of_class("ControllerStateChange",
+                             lambda e: e.controller_id == "c1") '''
+    events = []
+    for offset in self._classes.get(class_name, []):
+      e = decode_event(self._read_record(offset))
+      if e is not None and predicate(e):
+        events.append(e)
+    return events
+
+def decode_event(json_line):
+  ''' Parse one record into an event, without any of log_parser's trace-wide
+  sanity checks. Returns None for unknown classes. '''
+  json_hash = json.loads(json_line)
+  if json_hash['class'] not in name_to_class:
+    return None
+  if "round" not in json_hash:
+    json_hash['round'] = -1
+  return name_to_class[json_hash['class']].from_json(json_hash)
+
+def json_to_binary(json_path, binary_path):
+  ''' Convert a (possibly compressed) json superlog to a btrace file '''
+  writer = BinaryTraceWriter(binary_path)
+  try:
+    with open_compressed(json_path) as json_input:
+      for line in json_input:
+        line = line.rstrip()
+        if line != "":
+          writer.write_json_line(line)
+  finally:
+    writer.close()
+
+def binary_to_json(binary_path, json_path):
+  ''' Convert a btrace file to a (possibly compressed) json superlog '''
+  with BinaryTraceReader(binary_path) as reader:
+    with open_compressed(json_path, 'w') as json_output:
+      for json_line in reader.iter_json_lines():
+        json_output.write(json_line + '\n')
@@ -20,6 +20,8 @@ import logging
 from sts.replay_event import WaitTime
 from sts.syncproto.base import SyncTime
 from sts.util.convenience import timestamp_string
+from sts.input_traces.binary_trace import is_binary_trace_path, BinaryTraceWriter
+from sts.util.compressed_files import open_compressed
 import sts.dataplane_traces.trace_generator as tg
 
 # N.B. invoking replay_config.py should not overwrite the original
@@ -103,16 +105,28 @@ control_flow = EfficientMCSFinder(simulation_config, "%s",
 log = logging.getLogger("input_logger")
 
 class InputLogger(object):
-  '''Log input events injected by a control_flow.Fuzzer'''
+  '''Log input events injected by a control_flow.Fuzzer
 
-  def __init__(self):
+  Events are logged as a json superlog, or as an indexed binary superlog if
+  the output filename ends in binary_trace.BINARY_TRACE_EXTENSION. json
+  superlogs are compressed if the output filename ends in one of
+  compressed_files.COMPRESSION_SUFFIXES, e.g. InputLogger("events.trace.gz").'''
+
+  def __init__(self, output_filename="events.trace"):
+    self.output_filename = output_filename
     self.last_time = SyncTime.now()
     self._disallow_timeouts = False
     self._events_after_close = []
     self.output = None
     self.output_path = ""
-
-  def open(self, results_dir=None, output_filename="events.trace"):
+    # Serialized events not yet written to self.output. For binary output,
+    # (json line, label, round, class name) tuples
+    self._pending_lines = []
+    self._batch_size = 1
+
+  def open(self, results_dir=None, output_filename=None):
+    if output_filename is None:
+      output_filename = self.output_filename
     if results_dir is not None:
       self.output_path = results_dir + "/" + output_filename
       self.replay_cfg_path = results_dir + "/replay_config.py"
@@ -121,7 +135,10 @@ class InputLogger(object):
       self.openflow_replay_cfg_path = results_dir + "/openflow_replay_config.py"
     else:
       raise ValueError("Default results_dir currently not supported")
-    self.output = open(self.output_path, 'w')
+    if is_binary_trace_path(self.output_path):
+      self.output = BinaryTraceWriter(self.output_path)
+    else:
+      self.output = open_compressed(self.output_path, 'w')
 
   def disallow_timeouts(self):
     self._disallow_timeouts = True
@@ -129,13 +146,26 @@ class InputLogger(object):
   def allow_timeouts(self):
     self._disallow_timeouts = False
 
-  def _serialize_event(self, event, output):
+  def batch_writes(self, batch_size):
+    ''' Write logged events to the trace batch_size at a time, rather than
+    one at a time. Events are still serialized as soon as they are logged. '''
+    self._batch_size = batch_size
+
+  def _serialize_event(self, event):
     if self._disallow_timeouts and hasattr(event, "disallow_timeouts"):
       event.timeout_disallowed = True
     self.last_time = event.time
-    json_hash = event.to_json()
-    log.debug("logging event %r" % event)
-    output.write(json_hash + '\n')
+    log.debug("logging event %r", event)
+    return event.to_json() + '\n'
+
+  def _flush_pending(self):
+    if self._pending_lines != []:
+      if isinstance(self.output, BinaryTraceWriter):
+        for (line, label, round, class_name) in self._pending_lines:
+          self.output.write_record(line, label, round, class_name)
+      else:
+        self.output.write("".join(self._pending_lines))
+      self._pending_lines = []
 
   def log_input_event(self, event):
     '''
@@ -144,21 +174,29 @@ class InputLogger(object):
     if not self.output:
       raise Exception("Not opened -- call InputLogger.open")
     if not self.output.closed:
-      self._serialize_event(event, self.output)
+      line = self._serialize_event(event)
+      if isinstance(self.output, BinaryTraceWriter):
+        self._pending_lines.append((line[:-1], event.label, event.round,
+                                    type(event).__name__))
+      else:
+        self._pending_lines.append(line)
+      if len(self._pending_lines) >= self._batch_size:
+        self._flush_pending()
     else:
       self._events_after_close.append(event)
 
   def dump_buffered_events(self, events):
     ''' If there were un-acknowledge message receives or state changes at the
-    end of the run, dump them to a separate input trace ".unacked" '''
+    end of the run, dump them to a separate (json) input trace ".unacked" '''
     with open(self.output_path + ".unacked", 'w') as output:
       for event in events + self._events_after_close:
-        self._serialize_event(event, output)
+        output.write(self._serialize_event(event))
 
   def close(self, control_flow, simulation_cfg, skip_mcs_cfg=False):
     # First, insert a WaitTime, in case there was a controller crash
     self.log_input_event(WaitTime(1.0, time=self.last_time))
     # Flush the json input log
+    self._flush_pending()
     self.output.close()
 
     # Write the config files
@@ -13,7 +13,8 @@
 # limitations under the License.
 
 '''
-Parses `superlog's and returns a list of sts.event.Event objects
+Parses `superlog's and returns a list of sts.event.Event objects, or
+generates them one at a time (iter_parse)
 
 `superlog' format: Each line is a json hash representing either an internal
 event or an external input event.
@@ -28,10 +29,16 @@ Hashes may have additional custom keys. For example, external input events
 must the following key:
   'dependent_labels': list of dependent labels (internal events that will not occur if this
                       event is pruned)
+
+Paths ending in binary_trace.BINARY_TRACE_EXTENSION are parsed as indexed
+binary superlogs instead (see sts/input_traces/binary_trace.py). json
+superlogs may be compressed (see sts/util/compressed_files.py).
 '''
 
 import json
 import sts.replay_event as event
+from sts.input_traces.binary_trace import is_binary_trace_path, BinaryTraceReader
+from sts.util.compressed_files import open_compressed
 import logging
 log = logging.getLogger("superlog_parser")
 
@@ -50,6 +57,50 @@ special_event_name_to_class = {
   for klass in event.all_special_events
 }
 
+class LabelSet(object):
+  '''
+  The set of event labels seen so far in a trace. Labels are a one letter
+  prefix followed by an integer id, so they are stored as one bit per id in
+  a bitmap per prefix, rather than as one string per label.
+  '''
+  def __init__(self):
+    self._prefix2bits = {}
+    # Any labels not of that form
+    self._other_labels = set()
+
+  @staticmethod
+  def _split(label):
+    try:
+      label_id = int(label[1:])
+    except (TypeError, ValueError):
+      return (None, None)
+    if label_id < 0:
+      return (None, None)
+    return (label[0], label_id)
+
+  def __contains__(self, label):
+    (prefix, label_id) = self._split(label)
+    if prefix is None:
+      return label in self._other_labels
+    bits = self._prefix2bits.get(prefix)
+    if bits is None or (label_id >> 3) >= len(bits):
+      return False
+    return bool(bits[label_id >> 3] & (1 << (label_id & 7)))
+
+  def add(self, label):
+    (prefix, label_id) = self._split(label)
+    if prefix is None:
+      self._other_labels.add(label)
+      return
+    if prefix not in self._prefix2bits:
+      self._prefix2bits[prefix] = bytearray()
+    bits = self._prefix2bits[prefix]
+    index = label_id >> 3
+    if index >= len(bits):
+      # Grow geometrically
+      bits.extend(bytearray(max(index + 1 - len(bits), len(bits))))
+    bits[index] |= 1 << (label_id & 7)
+
 def check_unique_label(event_label, existing_event_labels):
   '''Check to make sure that event_label is not in existing_event_labels.
   Throw an exception if this invariant does not hold.
@@ -66,7 +117,7 @@ def sanity_check_external_input_event(existing_event_labels, dependent_labels,
   dependent_labels'''
   dependents = set(json_hash['dependent_labels'])
   # can't have dependents that have already happened!
-  assert(dependents.isdisjoint(existing_event_labels))
+  assert(not any(label in existing_event_labels for label in dependents))
   dependent_labels.update(dependents)
   # External input events can be dependents too (e.g. link recoveries are
   # dependents of link failures)
@@ -85,8 +136,7 @@ def parse_path(logfile_path):
   Output: A list of all the internal and external events in the order in which
   they exist in the logfile. Each internal event is annotated with the set of
   source events that are necessary conditions for its occurence.'''
-  with open(logfile_path) as logfile:
-    return parse(logfile)
+  return list(iter_parse_path(logfile_path))
 
 def check_legacy_format(json_hash):
   if (hasattr(json_hash, 'controller_id') and
@@ -103,11 +153,32 @@ def parse(logfile):
   Output: A list of all the internal and external events in the order in which
   they exist in the logfile. Each internal event is annotated with the set of
   source events that are necessary conditions for its occurence.'''
+  return list(iter_parse(logfile))
 
-  # the return value of the parsed log
-  trace = []
-  # a set of all event labels
-  event_labels = set()
+def iter_parse_path(logfile_path):
+  '''Input: path to a logfile.
+
+  Output: a generator of the events in the logfile. See iter_parse.'''
+  if is_binary_trace_path(logfile_path):
+    with BinaryTraceReader(logfile_path) as reader:
+      for event in iter_parse(reader.iter_json_lines()):
+        yield event
+    return
+  with open_compressed(logfile_path) as logfile:
+    for event in iter_parse(logfile):
+      yield event
+
+def iter_parse(logfile):
+  '''Input: logfile, or any other iterable of json lines.
+
+  Output: a generator of all the internal and external events in the order
+  in which they exist in the logfile, parsed as they are needed. Performs the
+  same sanity checks as parse(), but only keeps one bit per label seen and
+  the set of dependent labels still outstanding, so consumers that look at
+  each event once can process traces that don't fit in memory.'''
+
+  # all event labels seen so far
+  event_labels = LabelSet()
   # dependent labels that must be present somewhere in the log.
   dependent_labels = set()
 
@@ -129,9 +200,7 @@ def parse(logfile):
     else:
       print "Warning: Unknown class type %s" % json_hash['class']
       continue
-    trace.append(event)
+    yield event
 
   # all the foward dependencies should be satisfied!
   assert(len(dependent_labels) == 0)
-
-  return trace
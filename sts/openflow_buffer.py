@@ -116,6 +116,7 @@ class OpenFlowBuffer(EventMixin):
     # { ConnectionId(dpid, controller_id) -> pending send -> [(connection, pending ofp)_1, (connection, pending ofp)_2, ...] }
     self.pending_sends = PendingQueue()
     self._delegate_input_logger = None
+    self._record_pass_through = True
     self.pass_through_whitelisted_packets = False
     self.pass_through_sends = False
 
@@ -126,6 +127,9 @@ class OpenFlowBuffer(EventMixin):
     # TODO(cs): figure out a better way to resolve circular dependency
     import sts.replay_event
     message_id = message_event.pending_message
+    if not self._record_pass_through:
+      self.schedule(message_id)
+      return
     # Record
     if message_event.send_event:
       replay_event_class = sts.replay_event.ControlMessageSend
@@ -145,11 +149,13 @@ class OpenFlowBuffer(EventMixin):
     # Pass through
     self.schedule(message_id)
 
-  def set_pass_through(self, input_logger=None):
+  def set_pass_through(self, input_logger=None, record=True):
     ''' Cause all message receipts to pass through immediately without being
-    buffered'''
+    buffered. If record is False, don't keep track of the messages passed
+    through'''
     self.passed_through_events = []
     self._delegate_input_logger = input_logger
+    self._record_pass_through = record
     self.addListener(PendingMessage, self._pass_through_handler)
 
   def pass_through_sends_only(self):
@@ -20,7 +20,10 @@ events.trace JSON files.
 
 Note about the JSON events.trace format:
 
-All events are serialized to JSON with the Event.to_json() method.
+All events are serialized to JSON with the Event.to_json() method, and
+parsed with each class' from_json() method. Both are generated from the
+_json_fields each class declares (see sts.util.schema), and write fields
+in the declared order.
 
 All events have a fingerprint field, which is used to compute functional
 equivalence between events across different replays of the trace.
@@ -40,8 +43,8 @@ from sts.entities import Link
 from sts.openflow_buffer import PendingReceive, PendingSend, OpenFlowBuffer
 from sts.dataplane_traces.trace import DataplaneEvent
 from sts.fingerprints.messages import *
+from sts.util.schema import Field, merge_fields, make_encoder, make_decoder
 from config.invariant_checks import name_to_invariant_check
-import itertools
 import abc
 import logging
 import time
@@ -62,28 +65,87 @@ def dictify_fingerprint(fingerprint):
       mutable[i] = mutable[i].to_dict()
   return tuple(mutable)
 
+# Field encoders and decoders for the schemas below
+
+def decode_time(time):
+  return SyncTime(time[0], time[1])
+
+def encode_dp_fingerprint(fingerprint):
+  return (fingerprint[0], fingerprint[1].to_dict(), fingerprint[2], fingerprint[3])
+
+def encode_dp_event(dp_event):
+  if dp_event is None:
+    return None
+  return dp_event.to_json()
+
+def encode_traffic_fingerprint(fingerprint):
+  return (fingerprint[0], encode_dp_event(fingerprint[1]), fingerprint[2])
+
+class LabelRegistry(object):
+  '''
+  Allocates the integer ids of event labels. Ids are shared between the
+  'e' and 'i' prefixes.
+
+  Only the next free id is kept, not every id seen so far, so the registry
+  stays the same size however many events are created or parsed.
+  '''
+  def __init__(self, next_id=1):
+    self.next_id = next_id
+
+  def allocate(self):
+    label_id = self.next_id
+    self.next_id += 1
+    return label_id
+
+  def register(self, label_id):
+    ''' Make sure label_id is never allocated to a new event '''
+    if label_id >= self.next_id:
+      self.next_id = label_id + 1
+
 class Event(object):
   ''' Superclass for all event types. '''
   __metaclass__ = abc.ABCMeta
-
-  # Create unique labels for events
-  _label_gen = itertools.count(1)
-  # Ensure globally unique labels
-  _all_label_ids = set()
+  # Traces hold hundreds of thousands of events, so subclasses declare
+  # their fields in __slots__ rather than carrying an instance __dict__.
+  __slots__ = ('label', '_label_id', '_hash', 'round', 'time',
+               'dependent_labels', 'prunable', 'timed_out', 'replay_time')
+
+  # Where new events get their labels from. Explicit labels (e.g. parsed
+  # from a trace) are registered so they are never handed out again.
+  label_registry = LabelRegistry()
+
+  # Bookkeeping slots that are not part of the serialized event
+  _unserialized_fields = frozenset(['_label_id', '_hash'])
+
+  # The fields to_json() writes and from_json() reads. Subclasses declare
+  # their own _json_fields, which come after (or redeclare) these. See
+  # sts.util.schema and json_schema().
+  _json_fields = (Field('label'),
+                  Field('time', decode=decode_time),
+                  Field('round'),
+                  Field('dependent_labels', decoded=False),
+                  Field('prunable', decoded=False),
+                  Field('timed_out', decoded=False),
+                  Field('replay_time', optional=True, decoded=False),
+                  Field('fingerprint', encode=dictify_fingerprint,
+                        decoded=False))
 
   def __init__(self, prefix="e", label=None, round=-1, time=None, dependent_labels=None,
                prunable=True):
     if label is None:
-      label_id = Event._label_gen.next()
+      label_id = Event.label_registry.allocate()
       label = prefix + str(label_id)
-      while label_id in Event._all_label_ids:
-        label_id = Event._label_gen.next()
-        label = prefix + str(label_id)
+    else:
+      label = str(label)
+      label_id = int(label[1:])
+      Event.label_registry.register(label_id)
     if time is None:
       # TODO(cs): compress time for interactive mode?
       time = SyncTime.now()
     self.label = label
-    Event._all_label_ids.add(int(label[1:]))
+    self._label_id = label_id
+    # Assumption: labels are unique, and never change
+    self._hash = hash(label)
     self.round = round
     self.time = time
     # Add on dependent labels to appease log_processing.superlog_parser.
@@ -97,7 +159,19 @@ class Event(object):
 
   @property
   def label_id(self):
-    return int(self.label[1:])
+    return self._label_id
+
+  def _fields(self):
+    ''' Return a dict of the event's attributes that have been set '''
+    fields = {}
+    for klass in type(self).__mro__:
+      for name in klass.__dict__.get('__slots__', ()):
+        if name not in Event._unserialized_fields and hasattr(self, name):
+          fields[name] = getattr(self, name)
+    # Subclasses defined elsewhere (e.g. in tests) may not declare __slots__
+    if hasattr(self, '__dict__'):
+      fields.update(self.__dict__)
+    return fields
 
   @property
   def fingerprint(self):
@@ -114,7 +188,11 @@ class Event(object):
 
   def to_json(self):
     ''' Convert the event to json format '''
-    fields = dict(self.__dict__)
+    encoder = json_encoders.get(type(self))
+    if encoder is not None:
+      return encoder(self)
+    # Subclasses defined elsewhere (e.g. in tests) have no encoder of their own
+    fields = self._fields()
     fields['class'] = self.__class__.__name__
     # fingerprints are accessed through @property, not in __dict__:
     fields['fingerprint'] = dictify_fingerprint(self.fingerprint)
@@ -123,8 +201,7 @@ class Event(object):
     return json.dumps(fields)
 
   def __hash__(self):
-    # Assumption: labels are unique
-    return self.label.__hash__()
+    return self._hash
 
   def __eq__(self, other):
     # Assumption: labels are unique
@@ -151,6 +228,10 @@ class InternalEvent(Event):
   '''An InternalEvent is one that happens within the controller(s) under
   simulation. Derivatives of this class verify that the internal event has
   occured during replay in its proceed method before it returns.'''
+  # new_internal_event is set by Replayer on events it did not expect
+  __slots__ = ('timeout_disallowed', 'new_internal_event')
+  _json_fields = (Field('timeout_disallowed', default=False),
+                  Field('new_internal_event', optional=True, decoded=False))
   def __init__(self, label=None, round=-1, time=None, timeout_disallowed=False,
                prunable=False):
     super(InternalEvent, self).__init__(prefix='i', label=label, round=round, time=time,
@@ -176,6 +257,7 @@ class InputEvent(Event):
 
   `InputEvents' may also be referred to as 'external
   events', elsewhere in documentation or code.'''
+  __slots__ = ()
   def __init__(self, label=None, round=-1, time=None, dependent_labels=None,
                prunable=True):
     super(InputEvent, self).__init__(prefix='e', label=label, round=round, time=time,
@@ -204,6 +286,8 @@ class ConnectToControllers(InputEvent):
   ''' Logged at the beginning of the execution. Causes all switches to open
   TCP connections their their parent controller(s).
   '''
+  __slots__ = ('timeout_disallowed',)
+  _json_fields = (Field('timeout_disallowed', default=False),)
   def __init__(self, label=None, round=-1, time=None,
                timeout_disallowed=True):
     super(ConnectToControllers, self).__init__(label=label, round=round, time=time)
@@ -215,16 +299,12 @@ class ConnectToControllers(InputEvent):
     simulation.connect_to_controllers()
     return True
 
-  @staticmethod
-  def from_json(json_hash):
-    (label, time, round, timeout_disallowed) = extract_base_fields(json_hash)
-    return ConnectToControllers(label=label, time=time, round=round,
-                                timeout_disallowed=timeout_disallowed)
-
 
 class SwitchFailure(InputEvent):
   ''' Crashes a switch, by disconnecting its TCP connection with the
   controller(s).'''
+  __slots__ = ('dpid',)
+  _json_fields = (Field('dpid', decode=int),)
   def __init__(self, dpid, label=None, round=-1, time=None):
     '''
     Parameters:
@@ -244,13 +324,6 @@ class SwitchFailure(InputEvent):
     simulation.topology.crash_switch(software_switch)
     return True
 
-  @staticmethod
-  def from_json(json_hash):
-    (label, time, round) = extract_label_time(json_hash)
-    assert_fields_exist(json_hash, 'dpid')
-    dpid = int(json_hash['dpid'])
-    return SwitchFailure(dpid, label=label, round=round, time=time)
-
   @property
   def fingerprint(self):
     ''' Fingerprint tuple format: (class name, dpid) '''
@@ -259,6 +332,8 @@ class SwitchFailure(InputEvent):
 class SwitchRecovery(InputEvent):
   ''' Recovers a crashed switch, by reconnecting its TCP connection with the
   controller(s).'''
+  __slots__ = ('dpid',)
+  _json_fields = (Field('dpid', decode=int),)
   def __init__(self, dpid, label=None, round=-1, time=None):
     '''
     Parameters:
@@ -286,13 +361,6 @@ class SwitchRecovery(InputEvent):
       log.warn("Timed out on %s" % str(self.fingerprint))
     return True
 
-  @staticmethod
-  def from_json(json_hash):
-    (label, time, round) = extract_label_time(json_hash)
-    assert_fields_exist(json_hash, 'dpid')
-    dpid = int(json_hash['dpid'])
-    return SwitchRecovery(dpid, round=round, label=label, time=time)
-
   @property
   def fingerprint(self):
     ''' Fingerprint tuple format: (class name, dpid) '''
@@ -309,6 +377,11 @@ class LinkFailure(InputEvent):
   ''' Cuts a link between switches. This causes the switch to send an
   ofp_port_status message to its parent(s). All packets forwarded over
   this link will be dropped until a LinkRecovery occurs.'''
+  __slots__ = ('start_dpid', 'start_port_no', 'end_dpid', 'end_port_no')
+  _json_fields = (Field('start_dpid', decode=int),
+                  Field('start_port_no', decode=int),
+                  Field('end_dpid', decode=int),
+                  Field('end_port_no', decode=int))
   def __init__(self, start_dpid, start_port_no, end_dpid, end_port_no,
                label=None, round=-1, time=None):
     '''
@@ -335,18 +408,6 @@ class LinkFailure(InputEvent):
     simulation.topology.sever_link(link)
     return True
 
-  @staticmethod
-  def from_json(json_hash):
-    (label, time, round) = extract_label_time(json_hash)
-    assert_fields_exist(json_hash, 'start_dpid', 'start_port_no', 'end_dpid',
-                        'end_port_no')
-    start_dpid = int(json_hash['start_dpid'])
-    start_port_no = int(json_hash['start_port_no'])
-    end_dpid = int(json_hash['end_dpid'])
-    end_port_no = int(json_hash['end_port_no'])
-    return LinkFailure(start_dpid, start_port_no, end_dpid, end_port_no,
-                       round=round, label=label, time=time)
-
   @property
   def fingerprint(self):
     ''' Fingerprint tuple format:
@@ -358,6 +419,11 @@ class LinkFailure(InputEvent):
 class LinkRecovery(InputEvent):
   ''' Recovers a failed link between switches. This causes the switch to send an
   ofp_port_status message to its parent(s). '''
+  __slots__ = ('start_dpid', 'start_port_no', 'end_dpid', 'end_port_no')
+  _json_fields = (Field('start_dpid', decode=int),
+                  Field('start_port_no', decode=int),
+                  Field('end_dpid', decode=int),
+                  Field('end_port_no', decode=int))
   def __init__(self, start_dpid, start_port_no, end_dpid, end_port_no,
                label=None, round=-1, time=None):
     '''
@@ -384,18 +450,6 @@ class LinkRecovery(InputEvent):
     simulation.topology.repair_link(link)
     return True
 
-  @staticmethod
-  def from_json(json_hash):
-    (label, time, round) = extract_label_time(json_hash)
-    assert_fields_exist(json_hash, 'start_dpid', 'start_port_no', 'end_dpid',
-                        'end_port_no')
-    start_dpid = int(json_hash['start_dpid'])
-    start_port_no = int(json_hash['start_port_no'])
-    end_dpid = int(json_hash['end_dpid'])
-    end_port_no = int(json_hash['end_port_no'])
-    return LinkRecovery(start_dpid, start_port_no, end_dpid, end_port_no,
-                        round=round, label=label, time=time)
-
   @property
   def fingerprint(self):
     ''' Fingerprint tuple format:
@@ -407,6 +461,8 @@ class LinkRecovery(InputEvent):
 
 class ControllerFailure(InputEvent):
   ''' Kills a controller process with `kill -9`'''
+  __slots__ = ('controller_id',)
+  _json_fields = (Field('controller_id'),)
   def __init__(self, controller_id, label=None, round=-1, time=None):
     '''
     Parameters:
@@ -426,13 +482,6 @@ class ControllerFailure(InputEvent):
     simulation.controller_manager.kill_controller(controller)
     return True
 
-  @staticmethod
-  def from_json(json_hash):
-    (label, time, round) = extract_label_time(json_hash)
-    assert_fields_exist('controller_id')
-    controller_id = json_hash['controller_id']
-    return ControllerFailure(controller_id, round=round, label=label, time=time)
-
   @property
   def fingerprint(self):
     ''' Fingerprint tuple format: (class name, controller id) '''
@@ -441,6 +490,8 @@ class ControllerFailure(InputEvent):
 class ControllerRecovery(InputEvent):
   ''' Reboots a crashed controller by reinvoking its original command line
   parameters'''
+  __slots__ = ('controller_id',)
+  _json_fields = (Field('controller_id'),)
   def __init__(self, controller_id, label=None, round=-1, time=None):
     '''
     Parameters:
@@ -460,13 +511,6 @@ class ControllerRecovery(InputEvent):
     simulation.controller_manager.reboot_controller(controller)
     return True
 
-  @staticmethod
-  def from_json(json_hash):
-    (label, time, round) = extract_label_time(json_hash)
-    assert_fields_exist('controller_id')
-    controller_id = json_hash['controller_id']
-    return ControllerRecovery(controller_id, round=round, label=label, time=time)
-
   @property
   def fingerprint(self):
     ''' Fingerprint tuple format: (class name, controller id) '''
@@ -476,6 +520,13 @@ class HostMigration(InputEvent):
   ''' Migrates a host from one location in network to another. Creates a new
   virtual port on the new switch, and takes down the old port on the old switch.
   '''
+  __slots__ = ('old_ingress_dpid', 'old_ingress_port_no', 'new_ingress_dpid',
+               'new_ingress_port_no', 'host_id')
+  _json_fields = (Field('old_ingress_dpid', decode=int),
+                  Field('old_ingress_port_no', decode=int),
+                  Field('new_ingress_dpid', decode=int),
+                  Field('new_ingress_port_no', decode=int),
+                  Field('host_id'))
   def __init__(self, old_ingress_dpid, old_ingress_port_no,
                new_ingress_dpid, new_ingress_port_no, host_id, label=None, round=-1, time=None):
     '''
@@ -510,20 +561,6 @@ class HostMigration(InputEvent):
                                      self.new_ingress_port_no)
     return True
 
-  @staticmethod
-  def from_json(json_hash):
-    (label, time, round) = extract_label_time(json_hash)
-    assert_fields_exist(json_hash, 'old_ingress_dpid', 'old_ingress_port_no',
-                        'new_ingress_dpid', 'new_ingress_port_no', 'host_id')
-    old_ingress_dpid = int(json_hash['old_ingress_dpid'])
-    old_ingress_port_no = int(json_hash['old_ingress_port_no'])
-    new_ingress_dpid = int(json_hash['new_ingress_dpid'])
-    new_ingress_port_no = int(json_hash['new_ingress_port_no'])
-    host_id = json_hash['host_id']
-    return HostMigration(old_ingress_dpid, old_ingress_port_no,
-                         new_ingress_dpid, new_ingress_port_no,
-                         host_id, round=round, label=label, time=time)
-
   @property
   def old_location(self):
     return (self.old_ingress_dpid, self.old_ingress_port_no)
@@ -547,6 +584,8 @@ class HostMigration(InputEvent):
 
 class PolicyChange(InputEvent):
   ''' Not currently supported '''
+  __slots__ = ('request_type',)
+  _json_fields = (Field('request_type'),)
   def __init__(self, request_type, label=None, round=-1, time=None):
     super(PolicyChange, self).__init__(label=label, round=round, time=time)
     self.request_type = request_type
@@ -555,15 +594,15 @@ class PolicyChange(InputEvent):
     # TODO(cs): implement me, and add PolicyChanges to Fuzzer
     pass
 
-  @staticmethod
-  def from_json(json_hash):
-    (label, time, round) = extract_label_time(json_hash)
-    assert_fields_exist(json_hash, 'request_type')
-    request_type = json_hash['request_type']
-    return PolicyChange(request_type, round=round, label=label, time=time)
-
 class TrafficInjection(InputEvent):
   ''' Injects a dataplane packet into the network at the given host's access link '''
+  __slots__ = ('dp_event', 'host_id')
+  _json_fields = (Field('prunable', default=True),
+                  Field('fingerprint', encode=encode_traffic_fingerprint,
+                        decoded=False),
+                  Field('dp_event', encode=encode_dp_event,
+                        decode=DataplaneEvent.from_json, default=None),
+                  Field('host_id', default=None))
   def __init__(self, label=None, dp_event=None, host_id=None, round=-1, time=None, prunable=True):
     '''
     Parameters:
@@ -606,32 +645,11 @@ class TrafficInjection(InputEvent):
     '''
     return (self.__class__.__name__, self.dp_event, self.host_id)
 
-  def to_json(self):
-    fields = {}
-    fields = dict(self.__dict__)
-    fields['class'] = self.__class__.__name__
-    fields['dp_event'] = self.dp_event.to_json()
-    fields['fingerprint'] = (self.__class__.__name__, self.dp_event.to_json(), self.host_id)
-    fields['host_id'] = self.host_id
-    return json.dumps(fields)
-
-  @staticmethod
-  def from_json(json_hash):
-    (label, time, round) = extract_label_time(json_hash)
-    prunable = True
-    if 'prunable' in json_hash:
-      prunable = json_hash['prunable']
-    dp_event = None
-    if 'dp_event' in json_hash:
-      dp_event = DataplaneEvent.from_json(json_hash['dp_event'])
-    host_id = None
-    if 'host_id' in json_hash:
-      host_id = json_hash['host_id']
-    return TrafficInjection(label=label, dp_event=dp_event, host_id=host_id, time=time, round=round, prunable=prunable)
-
 class WaitTime(InputEvent):
   ''' Causes the simulation to sleep for the specified number of seconds.
   Controller processes continue running during this time.'''
+  __slots__ = ('wait_time',)
+  _json_fields = (Field('wait_time'),)
   def __init__(self, wait_time, label=None, round=-1, time=None):
     '''
     Parameters:
@@ -651,16 +669,19 @@ class WaitTime(InputEvent):
     time.sleep(self.wait_time)
     return True
 
-  @staticmethod
-  def from_json(json_hash):
-    (label, time, round) = extract_label_time(json_hash)
-    assert_fields_exist(json_hash, 'wait_time')
-    wait_time = json_hash['wait_time']
-    return WaitTime(wait_time, round=round, label=label, time=time)
-
 class CheckInvariants(InputEvent):
   ''' Causes the simulation to pause itself and check the given invariant before
   proceeding. '''
+  __slots__ = ('legacy_invariant_check', 'invariant_check',
+               'invariant_check_name')
+  _json_fields = (Field('fingerprint', attr='_json_fingerprint', decoded=False),
+                  Field('legacy_invariant_check', decoded=False),
+                  Field('invariant_check', attr='_json_invariant_check',
+                        decoded=False),
+                  Field('invariant_check_name', optional=True, decoded=False),
+                  Field('invariant_name', attr='_json_invariant_name',
+                        decoded=False))
+  _json_fingerprint = "N/A"
   def __init__(self, label=None, round=-1, time=None,
                invariant_check_name="InvariantChecker.check_correspondence"):
     '''
@@ -713,18 +734,17 @@ class CheckInvariants(InputEvent):
         raise KeyboardInterrupt("fail to interactive on persistent violation")
     return True
 
-  def to_json(self):
-    fields = dict(self.__dict__)
-    fields['class'] = self.__class__.__name__
+  @property
+  def _json_invariant_check(self):
     if self.legacy_invariant_check:
-      fields['invariant_check'] = marshal.dumps(self.invariant_check.func_code)\
-                                         .encode('base64')
-      fields['invariant_name'] = self.invariant_check.__name__
-    else:
-      fields['invariant_name'] = self.invariant_check_name
-      fields['invariant_check'] = None
-    fields['fingerprint'] = "N/A"
-    return json.dumps(fields)
+      return marshal.dumps(self.invariant_check.func_code).encode('base64')
+    return None
+
+  @property
+  def _json_invariant_name(self):
+    if self.legacy_invariant_check:
+      return self.invariant_check.__name__
+    return self.invariant_check_name
 
   @staticmethod
   def from_json(json_hash):
@@ -746,6 +766,8 @@ class ControlChannelBlock(InputEvent):
   queuing all messages sent on the switch<->controller TCP connection. No
   messages will be sent over the connection until a ControlChannelUnblock
   occurs. '''
+  __slots__ = ('dpid', 'controller_id')
+  _json_fields = (Field('dpid'), Field('controller_id'))
   def __init__(self, dpid, controller_id, label=None, round=-1, time=None):
     '''
     Parameters:
@@ -778,17 +800,11 @@ class ControlChannelBlock(InputEvent):
     return (self.__class__.__name__,
             self.dpid, self.controller_id)
 
-  @staticmethod
-  def from_json(json_hash):
-    (label, time, round) = extract_label_time(json_hash)
-    assert_fields_exist(json_hash, 'dpid', 'controller_id')
-    dpid = json_hash['dpid']
-    controller_id = json_hash['controller_id']
-    return ControlChannelBlock(dpid, controller_id, round=round, label=label, time=time)
-
 class ControlChannelUnblock(InputEvent):
   ''' Unblocks the control channel delay triggered by a ControlChannelUnblock.
   All queued messages will be sent.'''
+  __slots__ = ('dpid', 'controller_id')
+  _json_fields = (Field('dpid'), Field('controller_id'))
   def __init__(self, dpid, controller_id, label=None, round=-1, time=None):
     '''
     Parameters:
@@ -820,17 +836,14 @@ class ControlChannelUnblock(InputEvent):
     return (self.__class__.__name__,
             self.dpid, self.controller_id)
 
-  @staticmethod
-  def from_json(json_hash):
-    (label, time, round) = extract_label_time(json_hash)
-    assert_fields_exist(json_hash, 'dpid', 'controller_id')
-    dpid = json_hash['dpid']
-    controller_id = json_hash['controller_id']
-    return ControlChannelUnblock(dpid, controller_id, round=round, label=label, time=time)
-
 class DataplaneDrop(InputEvent):
   ''' Removes an in-flight dataplane packet with the given fingerprint from
   the network. '''
+  __slots__ = ('_fingerprint', 'passive', 'host_id', 'dpid')
+  _json_fields = (Field('fingerprint', encode=encode_dp_fingerprint),
+                  Field('passive', decoded=False),
+                  Field('host_id', decoded=False),
+                  Field('dpid', decoded=False))
   def __init__(self, fingerprint, label=None, host_id=None, dpid=None, round=-1, time=None, passive=True):
     '''
     Parameters:
@@ -882,23 +895,10 @@ class DataplaneDrop(InputEvent):
   def dp_fingerprint(self):
     return self.fingerprint[1]
 
-  @staticmethod
-  def from_json(json_hash):
-    (label, time, round) = extract_label_time(json_hash)
-    assert_fields_exist(json_hash, 'fingerprint')
-    fingerprint = json_hash['fingerprint']
-    return DataplaneDrop(fingerprint, round=round, label=label, time=time)
-
-  def to_json(self):
-    fields = dict(self.__dict__)
-    fields['class'] = self.__class__.__name__
-    fields['fingerprint'] = (self.fingerprint[0], self.fingerprint[1].to_dict(),
-                             self.fingerprint[2], self.fingerprint[3])
-    del fields['_fingerprint']
-    return json.dumps(fields)
-
 class BlockControllerPair(InputEvent):
   ''' '''
+  __slots__ = ('cid1', 'cid2')
+  _json_fields = (Field('cid1'), Field('cid2'))
   def __init__(self, cid1, cid2, label=None, round=-1, time=None):
     super(BlockControllerPair, self).__init__(label=label, round=round, time=time)
     self.cid1 = cid1
@@ -922,15 +922,9 @@ class BlockControllerPair(InputEvent):
     '''
     return (self.__class__.__name__, self.cid1, self.cid2)
 
-  @staticmethod
-  def from_json(json_hash):
-    (label, time, round) = extract_label_time(json_hash)
-    assert_fields_exist(json_hash, 'cid1', 'cid2')
-    cid1 = json_hash['cid1']
-    cid2 = json_hash['cid2']
-    return BlockControllerPair(cid1, cid2, round=round, label=label, time=time)
-
 class UnblockControllerPair(InputEvent):
+  __slots__ = ('cid1', 'cid2')
+  _json_fields = (Field('cid1'), Field('cid2'))
   def __init__(self, cid1, cid2, label=None, round=-1, time=None):
     super(UnblockControllerPair, self).__init__(label=label, round=round, time=time)
     self.cid1 = cid1
@@ -954,17 +948,11 @@ class UnblockControllerPair(InputEvent):
     '''
     return (self.__class__.__name__, self.cid1, self.cid2)
 
-  @staticmethod
-  def from_json(json_hash):
-    (label, time, round) = extract_label_time(json_hash)
-    assert_fields_exist(json_hash, 'cid1', 'cid2')
-    cid1 = json_hash['cid1']
-    cid2 = json_hash['cid2']
-    return UnblockControllerPair(cid1, cid2, round=round, label=label, time=time)
-
 # TODO(cs): Temporary hack until we figure out determinism
 class LinkDiscovery(InputEvent):
   ''' Deprecated '''
+  __slots__ = ('_fingerprint', 'controller_id', 'link_attrs')
+  _json_fields = (Field('controller_id'), Field('link_attrs'))
   def __init__(self, controller_id, link_attrs, label=None, round=-1, time=None):
     super(LinkDiscovery, self).__init__(label=label, round=round, time=time)
     self._fingerprint = (self.__class__.__name__,
@@ -981,16 +969,9 @@ class LinkDiscovery(InputEvent):
   def fingerprint(self):
     return self._fingerprint
 
-  @staticmethod
-  def from_json(json_hash):
-    (label, time, round) = extract_label_time(json_hash)
-    assert_fields_exist(json_hash, 'controller_id', 'link_attrs')
-    controller_id = json_hash['controller_id']
-    link_attrs = json_hash['link_attrs']
-    return LinkDiscovery(controller_id, link_attrs, round=round, label=label, time=time)
-
 class NOPInput(InputEvent):
   ''' Does nothing. Useful for fenceposting. '''
+  __slots__ = ()
   def proceed(self, simulation):
     return True
 
@@ -998,11 +979,6 @@ class NOPInput(InputEvent):
   def fingerprint(self):
     return (self.__class__.__name__,)
 
-  @staticmethod
-  def from_json(json_hash):
-    (label, time, round) = extract_label_time(json_hash)
-    return NOPInput(round=round, label=label, time=time)
-
 # N.B. When adding inputs to this list, make sure to update input susequence
 # validity checking in event_dag.py.
 all_input_events = [SwitchFailure, SwitchRecovery, LinkFailure, LinkRecovery,
@@ -1016,18 +992,19 @@ all_input_events = [SwitchFailure, SwitchRecovery, LinkFailure, LinkRecovery,
 #  Concrete classes of InternalEvents #
 # ----------------------------------- #
 
-def extract_base_fields(json_hash):
-  (label, time, round) = extract_label_time(json_hash)
-  timeout_disallowed = False
-  if 'timeout_disallowed' in json_hash:
-    timeout_disallowed = json_hash['timeout_disallowed']
-  return (label, time, round, timeout_disallowed)
-
 class ControlMessageBase(InternalEvent):
   '''
   Logged whenever an OpenFlowBuffer decides to explicitly fail an OpenFlow packet, or
   allow a switch to receive or send an openflow packet.
   '''
+  __slots__ = ('dpid', 'controller_id', 'b64_packet', '_fingerprint', '_packet',
+               'ignore_whitelisted_packets', 'pass_through_sends')
+  _json_fields = (Field('fingerprint', encode=dictify_fingerprint),
+                  Field('dpid'),
+                  Field('controller_id'),
+                  Field('b64_packet', default=""),
+                  Field('ignore_whitelisted_packets', decoded=False),
+                  Field('pass_through_sends', decoded=False))
   def __init__(self, dpid, controller_id, fingerprint, b64_packet="", label=None, round=-1, time=None, timeout_disallowed=False):
     '''
     Parameters:
@@ -1066,11 +1043,6 @@ class ControlMessageBase(InternalEvent):
       self._packet = base64_decode_openflow(self.b64_packet)
     return self._packet
 
-  def to_json(self):
-    if hasattr(self, "_packet"):
-      delattr(self, "_packet")
-    return super(ControlMessageBase, self).to_json()
-
   @property
   def fingerprint(self):
     ''' Fingerprint tuple format:
@@ -1084,6 +1056,7 @@ class ControlMessageReceive(ControlMessageBase):
   Logged whenever the GodScheduler decides to allow a switch to receive an
   openflow message.
   '''
+  __slots__ = ()
   def proceed(self, simulation):
     pending_receive = self.pending_receive
     message_waiting = simulation.openflow_buffer.message_receipt_waiting(pending_receive)
@@ -1111,24 +1084,12 @@ class ControlMessageReceive(ControlMessageBase):
   def __str__(self):
     return "ControlMessageReceive:%s c %s -> s %s [%s]" % (self.label, self.controller_id, self.dpid, self.fingerprint[1].human_str())
 
-  @staticmethod
-  def from_json(json_hash):
-    (label, time, round, timeout_disallowed) = extract_base_fields(json_hash)
-    assert_fields_exist(json_hash, 'dpid', 'controller_id', 'fingerprint')
-    dpid = json_hash['dpid']
-    controller_id = json_hash['controller_id']
-    fingerprint = json_hash['fingerprint']
-    b64_packet = ""
-    if 'b64_packet' in json_hash:
-      b64_packet = json_hash['b64_packet']
-    return ControlMessageReceive(dpid, controller_id, fingerprint, b64_packet=b64_packet,
-                                 round=round, label=label, time=time, timeout_disallowed=timeout_disallowed)
-
 class ControlMessageSend(ControlMessageBase):
   '''
   Logged whenever the GodScheduler decides to allow a switch to send an
   openflow message.
   '''
+  __slots__ = ()
   def proceed(self, simulation):
     pending_send = self.pending_send
     message_waiting = simulation.openflow_buffer.message_send_waiting(pending_send)
@@ -1150,20 +1111,6 @@ class ControlMessageSend(ControlMessageBase):
   def __str__(self):
     return "ControlMessageSend:%s c %s -> s %s [%s]" % (self.label, self.dpid, self.controller_id, self.fingerprint[1].human_str())
 
-  @staticmethod
-  def from_json(json_hash):
-    (label, time, round, timeout_disallowed) = extract_base_fields(json_hash)
-    assert_fields_exist(json_hash, 'dpid', 'controller_id', 'fingerprint')
-    dpid = json_hash['dpid']
-    controller_id = json_hash['controller_id']
-    fingerprint = json_hash['fingerprint']
-    b64_packet = ""
-    if 'b64_packet' in json_hash:
-      b64_packet = json_hash['b64_packet']
-    return ControlMessageSend(dpid, controller_id, fingerprint, round=round,
-                              b64_packet=b64_packet, label=label, time=time,
-                              timeout_disallowed=timeout_disallowed)
-
 # TODO(cs): move me?
 class PendingStateChange(namedtuple('PendingStateChange',
                                 ['controller_id', 'time', 'fingerprint',
@@ -1208,6 +1155,11 @@ class ControllerStateChange(InternalEvent):
   mastership change). Visibility into controller state changes is obtained
   via syncproto.
   '''
+  __slots__ = ('controller_id', '_fingerprint', 'name', 'value')
+  _json_fields = (Field('fingerprint', encode=dictify_fingerprint),
+                  Field('controller_id'),
+                  Field('name'),
+                  Field('value'))
   def __init__(self, controller_id, fingerprint, name, value, label=None, round=-1, time=None, timeout_disallowed=False):
     '''
     Parameters:
@@ -1271,24 +1223,13 @@ class ControllerStateChange(InternalEvent):
             state_change.fingerprint, state_change.name, state_change.value,
             time=state_change.time)
 
-  @staticmethod
-  def from_json(json_hash):
-    (label, time, round, timeout_disallowed) = extract_base_fields(json_hash)
-    assert_fields_exist(json_hash, 'controller_id', 'fingerprint',
-                        'name', 'value')
-    controller_id = json_hash['controller_id']
-    fingerprint = json_hash['fingerprint']
-    name = json_hash['name']
-    value = json_hash['value']
-    return ControllerStateChange(controller_id, fingerprint, name, value,
-                                 round=round, label=label, time=time,
-                                 timeout_disallowed=timeout_disallowed)
-
 class DeterministicValue(InternalEvent):
   '''
   Logged whenever the controller asks for a deterministic value (e.g.
   gettimeofday()
   '''
+  __slots__ = ('controller_id', 'name', 'value')
+  _json_fields = (Field('controller_id'), Field('name'), Field('value'))
   def __init__(self, controller_id, name, value, label=None, round=-1, time=None, timeout_disallowed=False):
     '''
     Parameters:
@@ -1321,23 +1262,16 @@ class DeterministicValue(InternalEvent):
       return True
     return False
 
-  @staticmethod
-  def from_json(json_hash):
-    (label, time, round, timeout_disallowed) = extract_base_fields(json_hash)
-    assert_fields_exist(json_hash, 'controller_id',
-                        'name', 'value')
-    controller_id = json_hash['controller_id']
-    name = json_hash['name']
-    value = json_hash['value']
-    return DeterministicValue(controller_id, name, value, round=round,
-                              label=label, time=time, timeout_disallowed=timeout_disallowed)
-
 
 class DataplanePermit(InternalEvent):
   ''' DataplanePermit allows a packet to move from one port to another in the
   dataplane. We basically just keep this around for bookkeeping purposes. During
   replay, this let's us know which packets to let through, and which to drop.
   '''
+  __slots__ = ('_fingerprint', 'passive')
+  _json_fields = (Field('timeout_disallowed', decoded=False),
+                  Field('fingerprint', encode=encode_dp_fingerprint),
+                  Field('passive', decoded=False))
   def __init__(self, fingerprint, label=None, round=-1, time=None,
                passive=True):
     '''
@@ -1385,24 +1319,10 @@ class DataplanePermit(InternalEvent):
   def dp_fingerprint(self):
     return self.fingerprint[1]
 
-  @staticmethod
-  def from_json(json_hash):
-    (label, time, round) = extract_label_time(json_hash)
-    assert_fields_exist(json_hash, 'fingerprint')
-    fingerprint = json_hash['fingerprint']
-    return DataplanePermit(fingerprint, label=label, round=round, time=time)
-
-  def to_json(self):
-    fields = dict(self.__dict__)
-    fields['class'] = self.__class__.__name__
-    fields['fingerprint'] = (self.fingerprint[0], self.fingerprint[1].to_dict(),
-                             self.fingerprint[2], self.fingerprint[3])
-    del fields['_fingerprint']
-    return json.dumps(fields)
-
 class ProcessFlowMod(ControlMessageBase):
   ''' Logged whenever the network-wide OpenFlowBuffer decides to allow buffered (local
   to each switch) OpenFlow flow_mod message through and be processed by the switch '''
+  __slots__ = ()
   # TODO(jl): Update visualization tool to recognize this replay event
 
   def proceed(self, simulation):
@@ -1418,20 +1338,6 @@ class ProcessFlowMod(ControlMessageBase):
     # TODO(cs): inefficient to keep reconrstructing this tuple.
     return PendingReceive(self.dpid, self.controller_id, self.fingerprint[1])
 
-  @staticmethod
-  def from_json(json_hash):
-    (label, time, round, timeout_disallowed) = extract_base_fields(json_hash)
-    assert_fields_exist(json_hash, 'dpid', 'controller_id', 'fingerprint')
-    dpid = json_hash['dpid']
-    controller_id = json_hash['controller_id']
-    fingerprint = json_hash['fingerprint']
-    b64_packet = ""
-    if 'b64_packet' in json_hash:
-      b64_packet = json_hash['b64_packet']
-    return ProcessFlowMod(dpid, controller_id, fingerprint, b64_packet=b64_packet,
-                          round=round, label=label, time=time,
-                          timeout_disallowed=timeout_disallowed)
-
   def __str__(self):
     return "ProcessFlowMod:%s c %s -> s %s [%s]" % (self.label, self.controller_id, self.dpid, self.fingerprint[1].human_str())
 
@@ -1442,11 +1348,15 @@ all_internal_events = [ControlMessageReceive, ControlMessageSend,
 # Special events:
 
 class SpecialEvent(Event):
+  __slots__ = ()
   def proceed(self, _):
     raise RuntimeError("Should never be called!")
 
 class InvariantViolation(SpecialEvent):
   ''' Class for logging violations as json dicts '''
+  __slots__ = ('violations', 'persistent')
+  _json_fields = (Field('violations'),
+                  Field('persistent', default=True))
   def __init__(self, violations, label=None, round=-1, time=None, persistent=False):
     '''
     Parameters:
@@ -1466,18 +1376,31 @@ class InvariantViolation(SpecialEvent):
     self.violations = [ str(v) for v in violations ]
     self.persistent = persistent
 
-  @staticmethod
-  def from_json(json_hash):
-    (label, time, round) = extract_label_time(json_hash)
-    assert_fields_exist(json_hash, 'violations')
-    violations = json_hash['violations']
-    persistent = True
-    if 'persistent' in json_hash:
-      persistent = json_hash['persistent']
-    return InvariantViolation(violations, label=label, round=round, time=time, persistent=persistent)
-
 all_special_events = [InvariantViolation]
 
 all_events = all_input_events + all_internal_events + all_special_events
 
 dp_events = set([DataplanePermit, DataplaneDrop])
+
+# ----------------------------------- #
+#  Serialization                      #
+# ----------------------------------- #
+
+def json_schema(event_class):
+  ''' Return the Fields of event_class's serialized form, in order '''
+  return merge_fields(*[ klass.__dict__['_json_fields']
+                         for klass in reversed(event_class.__mro__)
+                         if '_json_fields' in klass.__dict__ ])
+
+# { event class -> function that serializes events of exactly that class }
+json_encoders = {}
+
+def _install_serializers(event_classes):
+  for event_class in event_classes:
+    fields = json_schema(event_class)
+    json_encoders[event_class] = make_encoder(event_class.__name__, fields)
+    # CheckInvariants still parses its legacy format by hand
+    if 'from_json' not in event_class.__dict__:
+      event_class.from_json = staticmethod(make_decoder(event_class, fields))
+
+_install_serializers(all_events)
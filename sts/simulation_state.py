@@ -134,12 +134,18 @@ class SimulationConfig(object):
       #           set SimulationConfig.multiplex_sockets = False?
       self.interpose_on_controllers = False
 
-  def bootstrap(self, sync_callback=None, boot_controllers=default_boot_controllers):
+  def bootstrap(self, sync_callback=None, boot_controllers=default_boot_controllers,
+                virtual_clock=None):
     '''Return a simulation object encapsulating the state of
        the system in its initial starting point:
        - boots controllers
        - connects switches to controllers
 
+       If virtual_clock (a sts.util.virtual_clock.VirtualClock) is given, the
+       simulation runs in virtual time until it is cleaned up. Only use this
+       when no external process depends on real time, e.g. with
+       boot_mock_controllers.
+
        May be invoked multiple times!
     '''
     if sync_callback is None:
@@ -150,6 +156,9 @@ class SimulationConfig(object):
       _io_master = IOMaster()
       # monkey patch time.sleep for all our friends
       _io_master.monkey_time_sleep()
+      if virtual_clock is not None:
+        virtual_clock.install()
+        _io_master.set_virtual_clock(virtual_clock)
       # tell sts.console to use our io_master
       msg.set_io_master(_io_master)
       return _io_master
@@ -229,9 +238,11 @@ class SimulationConfig(object):
     simulation = Simulation(topology, controller_manager, dataplane_trace,
                             openflow_buffer, io_master, controller_patch_panel,
                             patch_panel, sync_callback, mux_select, demuxers,
-                            violation_tracker, self._kill_controllers_on_exit)
+                            violation_tracker, self._kill_controllers_on_exit,
+                            virtual_clock=virtual_clock)
     if self.ignore_interposition:
-      simulation.set_pass_through()
+      # Nobody asks for the internal events passed through
+      simulation.set_pass_through(record=False)
     self.current_simulation = simulation
     return simulation
 
@@ -265,7 +276,8 @@ class Simulation(object):
   def __init__(self, topology, controller_manager, dataplane_trace,
                openflow_buffer, io_master, controller_patch_panel, patch_panel,
                controller_sync_callback, mux_select, demuxers,
-               violation_tracker, kill_controllers_on_exit):
+               violation_tracker, kill_controllers_on_exit,
+               virtual_clock=None):
     self.topology = topology
     self.controller_manager = controller_manager
     self.controller_manager.set_simulation(self)
@@ -281,16 +293,28 @@ class Simulation(object):
     self.mux_select = mux_select
     self.multiplex_sockets = mux_select is not None
     self.demuxers = demuxers
+    self.virtual_clock = virtual_clock
 
   def set_exit_code(self, code):
     self.exit_code = code
 
-  def set_pass_through(self):
+  def advance_virtual_time(self, timestamp):
+    ''' Jump the virtual clock forward to timestamp, and expire any flow
+    entries that timed out in between. '''
+    if self.virtual_clock is None:
+      raise RuntimeError("Simulation is not running in virtual time")
+    self.virtual_clock.advance_to(timestamp)
+    for switch in self.topology.switches:
+      switch.table.remove_expired_entries()
+
+  def set_pass_through(self, record=True):
     ''' Set to pass-through during bootstrap, so that switch initialization
-    messages don't get buffered '''
-    self.openflow_buffer.set_pass_through()
+    messages don't get buffered. If record is False, don't keep track of
+    the internal events passed through (unset_pass_through() then returns
+    none of them) '''
+    self.openflow_buffer.set_pass_through(record=record)
     if hasattr(self.controller_sync_callback, "set_pass_through"):
-      self.controller_sync_callback.set_pass_through()
+      self.controller_sync_callback.set_pass_through(record=record)
 
   def unset_pass_through(self):
     ''' unset pass-through mode '''
@@ -324,6 +348,9 @@ class Simulation(object):
     if self._io_master is not None:
       self._io_master.close_all()
 
+    if self.virtual_clock is not None:
+      self.virtual_clock.uninstall()
+
   @property
   def io_master(self):
     return self._io_master
@@ -0,0 +1,71 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''
+Transparent compression for trace files, selected by suffix: paths ending in
+".gz" are read and written as gzip streams, paths ending in ".bz2" as bzip2
+streams, and anything else as plain files. e.g.:
+
+  with open_compressed("events.trace.gz", "w") as output:
+    output.write(event.to_json() + '\\n')
+
+See tools/benchmark_trace_compression.py for the throughput and compression
+ratio of each.
+'''
+
+import bz2
+import gzip
+import io
+
+GZIP_SUFFIX = ".gz"
+BZ2_SUFFIX = ".bz2"
+COMPRESSION_SUFFIXES = [GZIP_SUFFIX, BZ2_SUFFIX]
+
+# Superlogs are mostly repeated json keys and base64 payloads, so the faster
+# levels already compress them well; writing shouldn't be slower than the disk
+DEFAULT_COMPRESSLEVEL = 3
+
+def compression_suffix(path):
+  ''' Return the compression suffix of path, or "" if it is uncompressed '''
+  for suffix in COMPRESSION_SUFFIXES:
+    if path.endswith(suffix):
+      return suffix
+  return ""
+
+def split_compression_suffix(path):
+  ''' Return (path without its compression suffix, compression suffix) '''
+  suffix = compression_suffix(path)
+  return (path[:len(path) - len(suffix)], suffix)
+
+def is_compressed_path(path):
+  return compression_suffix(path) != ""
+
+def open_compressed(path, mode='r', compresslevel=DEFAULT_COMPRESSLEVEL):
+  '''
+  Open path for reading ('r') or writing ('w'), (de)compressing on the fly
+  if path has a compression suffix. Only sequential access is supported for
+  compressed files.
+  '''
+  suffix = compression_suffix(path)
+  if suffix == "":
+    return open(path, mode)
+  if mode not in ['r', 'rb', 'w', 'wb']:
+    raise ValueError("Unsupported mode %s for compressed file %s" % (mode, path))
+  if suffix == BZ2_SUFFIX:
+    return bz2.BZ2File(path, mode, compresslevel=compresslevel)
+  # GzipFile's own readline() and small write()s run in python, so buffer
+  # them in C
+  if mode[0] == 'r':
+    return io.BufferedReader(gzip.GzipFile(path, 'rb'))
+  return io.BufferedWriter(gzip.GzipFile(path, 'wb', compresslevel=compresslevel))
@@ -64,6 +64,13 @@ class IOMaster(object):
     self.closed = False
     self._close_requested = False
     self._in_select = 0
+    self.virtual_clock = None
+
+  def set_virtual_clock(self, virtual_clock):
+    ''' Sleep in virtual time: sleep() polls for I/O once and then jumps
+    virtual_clock forward, and the time spent blocked in a timed select()
+    advances virtual_clock by the same amount. '''
+    self.virtual_clock = virtual_clock
 
   def create_worker_for_socket(self, socket):
     '''
@@ -158,6 +165,10 @@ class IOMaster(object):
     self.select(0)
 
   def sleep(self, timeout):
+    if self.virtual_clock is not None:
+      self.poll()
+      self.virtual_clock.advance(timeout)
+      return
     start = time.time()
     while not self.closed:
       elapsed = time.time() - start
@@ -183,7 +194,14 @@ class IOMaster(object):
     self._in_select += 1
     try:
       read_sockets, write_sockets, exception_sockets = self.grab_workers_rwe()
+      # Blocking indefinitely (timeout None) only happens while waiting on the
+      # user in raw_input(), which shouldn't count as simulated time.
+      advance_clock = self.virtual_clock is not None and timeout is not None
+      if advance_clock:
+        start = self.virtual_clock.real_time()
       rlist, wlist, elist = select.select(read_sockets, write_sockets, exception_sockets, timeout)
+      if advance_clock:
+        self.virtual_clock.advance(self.virtual_clock.real_time() - start)
       self.handle_workers_rwe(rlist, wlist, elist)
     except select.error:
       # TODO(cs): this is a hack: file descriptor is closed upon shut
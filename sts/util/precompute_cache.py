@@ -13,8 +13,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from collections import defaultdict
+from collections import defaultdict, namedtuple
 import itertools
+import hashlib
+import json
+import os
 
 class PrecomputePowerSetCache(object):
   sequence_id = itertools.count(1)
@@ -38,4 +41,163 @@ class PrecomputeCache(object):
   def update(self, input_sequence):
     self.done_sequences.add(input_sequence)
 
+class MonotonicReplayCache(object):
+  ''' Outcomes of replayed subsequences of a trace, for inferring the outcome
+  of other subsequences of it, assuming that the violation is monotonic: if a
+  subsequence reproduces the violation, so do all of its supersets, and if it
+  does not, neither do any of its subsets.
 
+  Subsequences are identified by the labels of their inputs. For each input
+  of the trace we keep a bitset of the ids of the recorded subsequences that
+  contain it, so that lookups only look at the inputs of the queried
+  subsequence, not at every input of the trace. A superset query takes one
+  bitset operation per queried input; a subset query counts, for each
+  reproducing subsequence that contains a queried input, how many of its
+  inputs the query contains. '''
+  def __init__(self, input_labels):
+    self._label2index = dict((label, i) for i, label in enumerate(input_labels))
+    # { input index -> bitset of ids of reproducing subsequences containing it }
+    self._reproducing_with = [0] * len(input_labels)
+    # { input index -> bitset of ids of non-reproducing subsequences containing it }
+    self._not_reproducing_with = [0] * len(input_labels)
+    # Bitsets of the ids of all reproducing and non-reproducing subsequences
+    self._reproducing = 0
+    self._not_reproducing = 0
+    # { id of reproducing subsequence -> # of distinct inputs in it }
+    self._reproducing_sizes = {}
+    self._next_id = 0
+
+  def __len__(self):
+    return self._next_id
+
+  def _indices(self, input_labels):
+    ''' Return the indices of input_labels in the trace, or None if any of
+    them are not inputs of the trace '''
+    try:
+      return [ self._label2index[label] for label in input_labels ]
+    except KeyError:
+      return None
+
+  def update(self, input_labels, violation_found):
+    indices = self._indices(input_labels)
+    if indices is None:
+      return
+    entry = 1 << self._next_id
+    if violation_found:
+      self._reproducing_sizes[self._next_id] = len(set(indices))
+      self._reproducing |= entry
+      with_input = self._reproducing_with
+    else:
+      self._not_reproducing |= entry
+      with_input = self._not_reproducing_with
+    self._next_id += 1
+    for i in indices:
+      with_input[i] |= entry
+
+  def _superset_not_reproducing(self, indices):
+    superset_ids = self._not_reproducing
+    for i in indices:
+      superset_ids &= self._not_reproducing_with[i]
+      if superset_ids == 0:
+        return False
+    return superset_ids != 0
+
+  def _subset_reproducing(self, indices):
+    if 0 in self._reproducing_sizes.itervalues():
+      # The empty subsequence is a subset of everything
+      return True
+    # { id of reproducing subsequence -> # of its inputs that are in ours }
+    found = defaultdict(int)
+    for i in set(indices):
+      ids = self._reproducing_with[i]
+      while ids != 0:
+        lowest = ids & -ids
+        ids ^= lowest
+        entry_id = lowest.bit_length() - 1
+        found[entry_id] += 1
+        if found[entry_id] == self._reproducing_sizes[entry_id]:
+          return True
+    return False
+
+  def superset_not_reproducing(self, input_labels):
+    ''' Whether a superset of input_labels is known not to reproduce the
+    violation '''
+    indices = self._indices(input_labels)
+    return indices is not None and self._superset_not_reproducing(indices)
+
+  def subset_reproducing(self, input_labels):
+    ''' Whether a subset of input_labels is known to reproduce the
+    violation '''
+    indices = self._indices(input_labels)
+    return indices is not None and self._subset_reproducing(indices)
+
+  def infer(self, input_labels):
+    ''' Return whether input_labels reproduces the violation, or None if that
+    can't be inferred from the recorded outcomes '''
+    indices = self._indices(input_labels)
+    if indices is None:
+      return None
+    if self._subset_reproducing(indices):
+      return True
+    if self._superset_not_reproducing(indices):
+      return False
+    return None
+
+class ReplayOutcome(namedtuple('ReplayOutcome',
+                               ['violation_found', 'replays',
+                                'timed_out_internal'])):
+  ''' The result of replaying a subsequence up to `replays' times. '''
+  pass
+
+class PersistentReplayCache(object):
+  ''' Records replay outcomes on disk, so that they survive across MCS runs.
+
+  Outcomes are appended as JSON lines to path. Each outcome is keyed by a
+  digest of the config fingerprint (a list of strings identifying the
+  trace, invariant check, bug signature, and topology) and the ordered input
+  labels of the replayed subsequence. Later lines take precedence over earlier
+  ones. '''
+  def __init__(self, path, config_fingerprint):
+    self.path = path
+    self._config_digest = hashlib.sha1(json.dumps(config_fingerprint)).hexdigest()
+    self._digest2outcome = {}
+    needs_newline = False
+    if os.path.exists(path):
+      with open(path) as cache_file:
+        for line in cache_file:
+          needs_newline = not line.endswith('\n')
+          try:
+            json_hash = json.loads(line)
+          except ValueError:
+            # The previous run died halfway through writing this line
+            continue
+          self._digest2outcome[json_hash['digest']] = \
+            ReplayOutcome(json_hash['violation_found'], json_hash['replays'],
+                          json_hash['timed_out_internal'])
+    self._output = open(path, 'a')
+    if needs_newline:
+      self._output.write('\n')
+
+  def _digest(self, input_labels):
+    return hashlib.sha1(self._config_digest + " " +
+                        " ".join(input_labels)).hexdigest()
+
+  def lookup(self, input_labels):
+    ''' Return the ReplayOutcome for input_labels, or None if unknown '''
+    return self._digest2outcome.get(self._digest(input_labels))
+
+  def update(self, input_labels, violation_found, replays, timed_out_internal):
+    digest = self._digest(input_labels)
+    outcome = ReplayOutcome(violation_found, replays, list(timed_out_internal))
+    self._digest2outcome[digest] = outcome
+    self._output.write(json.dumps({'digest': digest,
+                                   'violation_found': violation_found,
+                                   'replays': replays,
+                                   'timed_out_internal': outcome.timed_out_internal}) + '\n')
+    self._output.flush()
+
+  def close(self):
+    self._output.close()
+
+  def __len__(self):
+    return len(self._digest2outcome)
@@ -6,6 +6,21 @@ import xmlrpclib
 import sys
 import marshal
 import signal
+import threading
+import Queue
+import SocketServer
+import httplib
+import importlib
+import itertools
+import time
+import types
+from collections import Counter
+import socket
+import select
+import errno
+import struct
+import cPickle
+import traceback
 from sts.util.convenience import find_port
 from pox.lib.util import connect_with_backoff
 import logging
@@ -40,9 +55,24 @@ class TaskRegistry(object):
       raise ValueError("Task %s is not registered" % task_name)
     return self._name_to_task[task_name]
 
+  def task_names(self):
+    return self._name_to_task.keys()
+
 class ReplayException(Exception):
   pass
 
+class ChildCancelled(BaseException):
+  ''' Raised within a child when its parent cancels it (with a SIGTERM), so
+  that the task's finally clauses, e.g. killing the controllers it booted in
+  their own sessions, still run before the child exits. Not an Exception, so
+  that tasks' catch-all handlers don't swallow it. '''
+  pass
+
+def _raise_child_cancelled(signum, frame):
+  # Only the first SIGTERM interrupts the task; don't interrupt its clean up
+  signal.signal(signal.SIGTERM, signal.SIG_IGN)
+  raise ChildCancelled()
+
 class DebuggableHandler(SimpleXMLRPCRequestHandler):
   ''' Simple handler that extracts the stack trace of any exceptions that occur '''
   ''' on the server side, and encapsulates them in a new exception to send '''
@@ -64,6 +94,11 @@ class Forker(object):
   #  - parent returns result to caller.
   __metaclass__ = ABCMeta
 
+  # Whether children outlive a single invocation. If so, tasks should get all
+  # of their state through their arguments rather than their closure, since
+  # re-registering a task forces the children to be replaced.
+  reuses_children = False
+
   def __init__(self, strict_assertion_checking=False):
     self._task_registry = TaskRegistry()
     self.strict_assertion_checking = strict_assertion_checking
@@ -86,10 +121,34 @@ class Forker(object):
     Raises a ValueError if task_name is not registered.'''
     pass
 
-  def _new_child_url(self, ip='localhost', port=None):
+  def fork_many(self, task_name, args_list, max_parallel=None, stop_on=None):
+    ''' Invoke task_name once for each tuple of arguments in args_list, and
+    return a list of the values returned by the children, in the same order as
+    args_list.
+
+    If stop_on is not None, it is invoked on each child's return value. Once
+    it returns True for the i'th invocation, invocations with an index greater
+    than i are cancelled (or never started), and their entry in the returned
+    list is None. Invocations with an index less than i always complete, so
+    the first entry for which stop_on holds does not depend on scheduling.
+
+    This default implementation invokes the children one at a time; subclasses
+    may run up to max_parallel children concurrently.'''
+    results = [ None ] * len(args_list)
+    for i, args in enumerate(args_list):
+      results[i] = self.fork(task_name, *args)
+      if stop_on is not None and stop_on(results[i]):
+        break
+    return results
+
+  def shutdown(self):
+    ''' Release any children kept around for later invocations. '''
+    pass
+
+  def _new_child_url(self, ip='localhost', port=None, used_ports=()):
     # Called within the parent process
     if port is None:
-      port = find_port(xrange(3000,6000))
+      port = find_port([ p for p in xrange(3000,6000) if p not in used_ports ])
     return (ip, port)
 
   def _invoke_child_rpc(self, ip, port, task_name, *args):
@@ -131,50 +190,731 @@ class LocalForker(Forker):
   @staticmethod
   def kill_all():
     for pid in list(LocalForker._active_pids):
-      os.kill(pid, signal.SIGTERM)
+      try:
+        os.kill(pid, signal.SIGTERM)
+      except OSError:
+        # Already exited
+        pass
     LocalForker._active_pids.clear()
 
   def register_task(self, task_name, code_block):
     self._task_registry.register_task(task_name, code_block)
 
+  def _spawn_child(self, task, task_name, ip, port):
+    ''' Fork a child that serves a single invocation of task on (ip, port).
+    Returns the child's pid. '''
+    # TODO(cs): use subprocess to spawn baby snakes instead of os.fork()
+    pid = os.fork()
+    if pid == 0: # Child
+      # Our siblings are not ours to kill
+      LocalForker._active_pids.clear()
+      # Send parents interrupts to the child
+      os.setsid()
+      signal.signal(signal.SIGTERM, _raise_child_cancelled)
+      try:
+        self._initialize_child_rpc_server(ip, port)
+        self.server.register_function(task, task_name)
+        self.server.handle_request()
+      except ChildCancelled:
+        pass
+      finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        # Don't unwind through the parent's stack frames
+        os._exit(0)
+    LocalForker._active_pids.add(pid)
+    return pid
+
+  def _reap_child(self, pid, kill=False):
+    if kill:
+      try:
+        os.kill(pid, signal.SIGTERM)
+      except OSError:
+        # Already exited
+        pass
+    os.waitpid(pid, 0)
+    LocalForker._active_pids.discard(pid)
+
   def fork(self, task_name, *args, **kws):
     # N.B. get_task raises an exception if task_name is not registered
     task = self._task_registry.get_task(task_name)
     (ip, port) = self._new_child_url()
-    # TODO(cs): use subprocess to spawn baby snakes instead of os.fork()
+    pid = self._spawn_child(task, task_name, ip, port)
+    child_return = self._invoke_child_rpc(ip, port,
+                                          task_name, *args, **kws)
+    self._reap_child(pid)
+    return child_return
+
+  def fork_many(self, task_name, args_list, max_parallel=None, stop_on=None):
+    ''' Run up to max_parallel children at once. See Forker.fork_many.
+
+    Cancelled children are sent a SIGTERM, which raises ChildCancelled within
+    the task so that it can clean up after itself; we wait for them to exit.
+    The threads waiting on their RPC responses are left to die on their own. '''
+    task = self._task_registry.get_task(task_name)
+    if max_parallel is None or max_parallel < 1:
+      max_parallel = len(args_list)
+    results = [ None ] * len(args_list)
+    # Indices of invocations not yet started
+    pending = range(len(args_list))
+    # { index -> (pid, port) }
+    running = {}
+    # Invocations with an index >= cutoff are cancelled
+    cutoff = len(args_list)
+    # (index, child return value, exception) tuples
+    done = Queue.Queue()
+
+    def invoke_child(index, ip, port):
+      try:
+        done.put((index, self._invoke_child_rpc(ip, port, task_name,
+                                                *args_list[index]), None))
+      except Exception as e:
+        done.put((index, None, e))
+
+    try:
+      while pending or running:
+        # N.B. all fork()s happen in this thread, never in the RPC threads.
+        while pending and len(running) < max_parallel:
+          index = pending.pop(0)
+          used_ports = set(port for (_, port) in running.values())
+          (ip, port) = self._new_child_url(used_ports=used_ports)
+          pid = self._spawn_child(task, task_name, ip, port)
+          running[index] = (pid, port)
+          rpc_thread = threading.Thread(target=invoke_child,
+                                        args=(index, ip, port))
+          rpc_thread.daemon = True
+          rpc_thread.start()
+
+        # Poll with a timeout so that signals are still delivered to us
+        try:
+          (index, child_return, error) = done.get(True, 1.0)
+        except Queue.Empty:
+          continue
+        if index not in running:
+          # Straggler that we already cancelled
+          continue
+        (pid, _) = running.pop(index)
+        self._reap_child(pid)
+        if error is not None:
+          raise error
+        results[index] = child_return
+        if stop_on is not None and index < cutoff and stop_on(child_return):
+          log.debug("Task %s succeeded for invocation %d. Cancelling later invocations" %
+                    (task_name, index))
+          cutoff = index
+          for i in xrange(cutoff + 1, len(results)):
+            results[i] = None
+          pending = [ i for i in pending if i < cutoff ]
+          for i in [ i for i in running.keys() if i > cutoff ]:
+            (pid, _) = running.pop(i)
+            self._reap_child(pid, kill=True)
+    finally:
+      for (pid, _) in running.values():
+        self._reap_child(pid, kill=True)
+    return results
+
+def send_pickled(sock, obj):
+  data = cPickle.dumps(obj, cPickle.HIGHEST_PROTOCOL)
+  sock.sendall(struct.pack("!I", len(data)) + data)
+
+def _recv_exactly(sock, length):
+  chunks = []
+  while length > 0:
+    try:
+      chunk = sock.recv(min(length, 1 << 20))
+    except socket.error as e:
+      if e.errno == errno.EINTR:
+        continue
+      if e.errno == errno.ECONNRESET:
+        return None
+      raise
+    if chunk == "":
+      return None
+    chunks.append(chunk)
+    length -= len(chunk)
+  return "".join(chunks)
+
+def recv_pickled(sock):
+  ''' Return the next object sent by send_pickled(), or None if the other end
+  hung up. '''
+  header = _recv_exactly(sock, 4)
+  if header is None:
+    return None
+  data = _recv_exactly(sock, struct.unpack("!I", header)[0])
+  if data is None:
+    return None
+  return cPickle.loads(data)
+
+class _Worker(object):
+  ''' Parent-side handle on a pre-forked child '''
+  def __init__(self, pid, sock, generation):
+    self.pid = pid
+    self.sock = sock
+    # Tasks registered after the worker was forked are invisible to it
+    self.generation = generation
+    self.tasks_run = 0
+
+  def fileno(self):
+    return self.sock.fileno()
+
+class PreforkForker(LocalForker):
+  ''' Keeps up to num_workers long-lived children around, and hands each
+  invocation to an idle one over a socketpair, rather than forking a fresh
+  child (and booting an RPC server in it) for every invocation.
+
+  Requests and responses are pickled, so arguments and return values need
+  not be XML-RPC serializable.
+
+  Children inherit the tasks registered before they were forked. Registering
+  a task retires the existing children, since they cannot see the new code
+  block, so tasks that are re-registered for every invocation gain nothing
+  over LocalForker. Each child exits after max_tasks_per_worker invocations
+  (bounding any state that leaks between them), and is replaced on demand.
+  If max_tasks_per_worker is None, children are never recycled. '''
+  reuses_children = True
+
+  def __init__(self, num_workers=1, max_tasks_per_worker=50,
+               strict_assertion_checking=False):
+    super(PreforkForker, self).__init__(strict_assertion_checking=strict_assertion_checking)
+    if num_workers < 1:
+      raise ValueError("num_workers must be at least 1")
+    if max_tasks_per_worker is not None and max_tasks_per_worker < 1:
+      raise ValueError("max_tasks_per_worker must be at least 1")
+    self.num_workers = num_workers
+    self.max_tasks_per_worker = max_tasks_per_worker
+    self._generation = 0
+    self._idle = []
+    self._busy = []
+
+  def register_task(self, task_name, code_block):
+    super(PreforkForker, self).register_task(task_name, code_block)
+    self._generation += 1
+    # Busy workers are retired once they respond
+    for worker in self._idle:
+      self._retire_worker(worker)
+    self._idle = []
+
+  def prefork(self):
+    ''' Fork children until there are num_workers of them. Optional: children
+    are otherwise forked as invocations need them. '''
+    while len(self._idle) + len(self._busy) < self.num_workers:
+      self._idle.append(self._spawn_worker())
+
+  def _spawn_worker(self):
+    (parent_sock, child_sock) = socket.socketpair()
     pid = os.fork()
     if pid == 0: # Child
-      # Send parents interrupts to the child
-      os.setsid()
-      self._initialize_child_rpc_server(ip, port)
-      self.server.register_function(task, task_name)
-      self.server.handle_request()
-      sys.exit(0)
-    else: # Parent
+      parent_sock.close()
+      for worker in self._idle + self._busy:
+        worker.sock.close()
+      self._worker_main(child_sock)
+    child_sock.close()
+    LocalForker._active_pids.add(pid)
+    return _Worker(pid, parent_sock, self._generation)
+
+  def _worker_main(self, sock):
+    # Called within the child process. Never returns.
+    # Our siblings are not ours to kill
+    LocalForker._active_pids.clear()
+    # Send parents interrupts to the child
+    os.setsid()
+    signal.signal(signal.SIGTERM, _raise_child_cancelled)
+    tasks_run = 0
+    try:
+      while (self.max_tasks_per_worker is None or
+             tasks_run < self.max_tasks_per_worker):
+        request = recv_pickled(sock)
+        if request is None:
+          # Parent is done with us
+          break
+        (task_name, args) = request
+        try:
+          response = (True, self._task_registry.get_task(task_name)(*args))
+          data = cPickle.dumps(response, cPickle.HIGHEST_PROTOCOL)
+        except ChildCancelled:
+          break
+        except BaseException:
+          # Including SystemExit and KeyboardInterrupt, which would otherwise
+          # take the worker down with them
+          data = cPickle.dumps((False, traceback.format_exc()),
+                               cPickle.HIGHEST_PROTOCOL)
+        sock.sendall(struct.pack("!I", len(data)) + data)
+        tasks_run += 1
+    finally:
+      sys.stdout.flush()
+      sys.stderr.flush()
+      # Don't unwind through the parent's stack frames
+      os._exit(0)
+
+  def _retire_worker(self, worker, kill=False):
+    # Closing our end tells an idle worker to exit
+    worker.sock.close()
+    self._reap_child(worker.pid, kill=kill)
+
+  def _start_task(self, task_name, args):
+    ''' Hand the invocation to an idle worker, forking one if needed.
+    Pre: fewer than num_workers workers are busy. '''
+    # N.B. get_task raises an exception if task_name is not registered
+    self._task_registry.get_task(task_name)
+    if self._idle:
+      worker = self._idle.pop()
+    else:
+      worker = self._spawn_worker()
+    try:
+      send_pickled(worker.sock, (task_name, args))
+    except socket.error as e:
+      self._retire_worker(worker, kill=True)
+      raise ReplayException("Could not send task %s to worker %d: %s" %
+                            (task_name, worker.pid, e))
+    self._busy.append(worker)
+    return worker
+
+  def _finish_task(self, worker, task_name):
+    ''' Wait for worker's response, and return the task's return value '''
+    response = recv_pickled(worker.sock)
+    self._busy.remove(worker)
+    worker.tasks_run += 1
+    if response is None:
+      self._retire_worker(worker, kill=True)
+      raise ReplayException("Worker %d exited while running task %s" %
+                            (worker.pid, task_name))
+    if ((self.max_tasks_per_worker is not None and
+         worker.tasks_run >= self.max_tasks_per_worker) or
+        worker.generation != self._generation):
+      self._retire_worker(worker)
+    else:
+      self._idle.append(worker)
+    (ok, value) = response
+    if not ok:
+      raise ReplayException("An Exception occured in the child replay process: %s" %
+                            value)
+    return value
+
+  def fork(self, task_name, *args, **kws):
+    log.debug("Invoking task %s on a worker" % task_name)
+    worker = self._start_task(task_name, args)
+    return self._finish_task(worker, task_name)
+
+  def fork_many(self, task_name, args_list, max_parallel=None, stop_on=None):
+    ''' Run up to min(max_parallel, num_workers) invocations at once. See
+    Forker.fork_many.
+
+    Workers running cancelled invocations are killed, with the same SIGTERM
+    as LocalForker's cancelled children. '''
+    if max_parallel is None or max_parallel < 1:
+      max_parallel = len(args_list)
+    max_parallel = min(max_parallel, self.num_workers)
+    results = [ None ] * len(args_list)
+    # Indices of invocations not yet started
+    pending = range(len(args_list))
+    # { worker -> index }
+    running = {}
+    # Invocations with an index >= cutoff are cancelled
+    cutoff = len(args_list)
+
+    try:
+      while pending or running:
+        while pending and len(running) < max_parallel:
+          index = pending.pop(0)
+          running[self._start_task(task_name, args_list[index])] = index
+
+        # Poll with a timeout so that signals are still delivered to us
+        try:
+          (readable, _, _) = select.select(running.keys(), [], [], 1.0)
+        except select.error as e:
+          if e.args[0] == errno.EINTR:
+            continue
+          raise
+        for worker in readable:
+          if worker not in running:
+            # Killed below
+            continue
+          index = running.pop(worker)
+          results[index] = self._finish_task(worker, task_name)
+          if stop_on is not None and index < cutoff and stop_on(results[index]):
+            log.debug("Task %s succeeded for invocation %d. Cancelling later invocations" %
+                      (task_name, index))
+            cutoff = index
+            for i in xrange(cutoff + 1, len(results)):
+              results[i] = None
+            pending = [ i for i in pending if i < cutoff ]
+            for w in [ w for (w, i) in running.items() if i > cutoff ]:
+              del running[w]
+              self._busy.remove(w)
+              self._retire_worker(w, kill=True)
+    finally:
+      for worker in running.keys():
+        self._busy.remove(worker)
+        self._retire_worker(worker, kill=True)
+    return results
+
+  def shutdown(self):
+    for worker in self._idle:
+      self._retire_worker(worker)
+    for worker in self._busy:
+      self._retire_worker(worker, kill=True)
+    self._idle = []
+    self._busy = []
+
+class _ThreadingXMLRPCServer(SocketServer.ThreadingMixIn, SimpleXMLRPCServer):
+  daemon_threads = True
+  allow_reuse_address = True
+
+class RemoteWorker(object):
+  ''' Serves tasks shipped by a RemoteForker, running each invocation in its
+  own fork()ed child. See tools/rpc_worker.py.
+
+  N.B. anyone who can reach the worker's port can run arbitrary code on it. '''
+  def __init__(self, ip, port, max_tasks=1):
+    self.max_tasks = max_tasks
+    # Lets the parent notice that we restarted (and lost our tasks)
+    self.incarnation = "%d:%f" % (os.getpid(), time.time())
+    self._task_registry = TaskRegistry()
+    # { invocation id -> pid of the child running it }
+    self._children = {}
+    self._children_lock = threading.Lock()
+    self.server = _ThreadingXMLRPCServer((ip, port), DebuggableHandler,
+                                         allow_none=True, logRequests=False)
+    self.server.register_function(self.ping, "ping")
+    self.server.register_function(self.register_task, "register_task")
+    self.server.register_function(self.invoke, "invoke")
+    self.server.register_function(self.cancel, "cancel")
+
+  def serve_forever(self):
+    self.server.serve_forever()
+
+  def ping(self):
+    with self._children_lock:
+      running = len(self._children)
+    return {'incarnation' : self.incarnation, 'max_tasks' : self.max_tasks,
+            'running' : running}
+
+  def register_task(self, task_name, serialized_task):
+    (module_name, code, defaults) = cPickle.loads(serialized_task.data)
+    try:
+      func_globals = importlib.import_module(module_name).__dict__
+    except ImportError:
+      # The task can only use builtins and its own imports
+      func_globals = { '__builtins__' : __builtins__ }
+    task = types.FunctionType(marshal.loads(code), func_globals, task_name,
+                              defaults)
+    self._task_registry.register_task(task_name, task)
+    return True
+
+  def invoke(self, task_name, invocation_id, serialized_args):
+    task = self._task_registry.get_task(task_name)
+    args = cPickle.loads(serialized_args.data)
+    (read_fd, write_fd) = os.pipe()
+    with self._children_lock:
+      pid = os.fork()
+      if pid == 0: # Child
+        os.close(read_fd)
+        # Our siblings are not ours to kill
+        LocalForker._active_pids.clear()
+        # Don't keep our port open if the worker dies
+        self.server.socket.close()
+        # cancel() interrupts the task, which still gets to clean up
+        signal.signal(signal.SIGTERM, _raise_child_cancelled)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        try:
+          try:
+            data = cPickle.dumps((True, task(*args)), cPickle.HIGHEST_PROTOCOL)
+          except ChildCancelled:
+            # Nobody is waiting for the result
+            data = ""
+          except Exception:
+            data = cPickle.dumps((False, traceback.format_exc()),
+                                 cPickle.HIGHEST_PROTOCOL)
+          while data:
+            data = data[os.write(write_fd, data):]
+        except ChildCancelled:
+          # Cancelled while writing the result
+          pass
+        finally:
+          sys.stdout.flush()
+          sys.stderr.flush()
+          # Don't unwind through the server's stack frames
+          os._exit(0)
+      self._children[invocation_id] = pid
       LocalForker._active_pids.add(pid)
-      child_return = self._invoke_child_rpc(ip, port,
-                                            task_name, *args, **kws)
-      LocalForker._active_pids.remove(pid)
+    os.close(write_fd)
+    chunks = []
+    while True:
+      chunk = os.read(read_fd, 1 << 20)
+      if chunk == "":
+        break
+      chunks.append(chunk)
+    os.close(read_fd)
+    os.waitpid(pid, 0)
+    with self._children_lock:
+      del self._children[invocation_id]
+      LocalForker._active_pids.discard(pid)
+    data = "".join(chunks)
+    if data == "":
+      data = cPickle.dumps((False, "Task %s exited without returning" % task_name),
+                           cPickle.HIGHEST_PROTOCOL)
+    return xmlrpclib.Binary(data)
+
+  def cancel(self, invocation_id):
+    with self._children_lock:
+      pid = self._children.get(invocation_id)
+      if pid is not None:
+        os.kill(pid, signal.SIGTERM)
+    return pid is not None
+
+class _TimeoutTransport(xmlrpclib.Transport):
+  def __init__(self, timeout):
+    xmlrpclib.Transport.__init__(self)
+    self.timeout = timeout
+
+  def make_connection(self, host):
+    connection = xmlrpclib.Transport.make_connection(self, host)
+    connection.timeout = self.timeout
+    return connection
+
+class _LostWorker(Exception):
+  pass
 
-      os.waitpid(pid, 0)
-      return child_return
+class _RemoteServer(object):
+  ''' Parent-side view of a RemoteWorker '''
+  def __init__(self, ip, port):
+    self.ip = ip
+    self.port = port
+    self.url = "http://%s:%d/" % (ip, port)
+    self.alive = False
+    self.incarnation = None
+    self.max_tasks = 1
+    self.in_flight = 0
+    # Names of tasks this incarnation has the latest code for
+    self.synced_tasks = set()
+
+  def proxy(self, timeout=None):
+    if timeout is None:
+      return xmlrpclib.ServerProxy(self.url, allow_none=True)
+    return xmlrpclib.ServerProxy(self.url, allow_none=True,
+                                 transport=_TimeoutTransport(timeout))
+
+  def __repr__(self):
+    return "%s:%d" % (self.ip, self.port)
 
 class RemoteForker(Forker):
-  def __init__(self, server_info_list):
-    ''' cycles through server_info_list for each invocation of fork() '''
-    pass
+  ''' Runs invocations on RemoteWorkers (started with tools/rpc_worker.py,
+  possibly on other machines), rather than in local children.
+
+  Each invocation goes to a live worker with spare capacity: the next one
+  in server_info_list order if dispatch is "round_robin", or the one with
+  the fewest invocations in flight (relative to its max_tasks) if dispatch
+  is "least_loaded". Workers are health checked at the start of every
+  fork()/fork_many(), and every health_check_interval seconds while
+  invocations are running. If a worker is lost mid-invocation, the
+  invocation is retried on another worker, up to max_retries times.
+
+  Tasks must be module-level functions without closures, since their code
+  is marshalled and shipped to the workers; arguments and return values are
+  pickled. '''
+  reuses_children = True
+
+  def __init__(self, server_info_list, dispatch="least_loaded", max_retries=2,
+               health_check_timeout=5.0, health_check_interval=30.0,
+               strict_assertion_checking=False):
+    ''' server_info_list is a list of (ip, port) pairs of workers '''
+    super(RemoteForker, self).__init__(strict_assertion_checking=strict_assertion_checking)
+    if dispatch not in ["round_robin", "least_loaded"]:
+      raise ValueError("Unknown dispatch policy %s" % dispatch)
+    if server_info_list == []:
+      raise ValueError("Need at least one worker")
+    self._servers = [ _RemoteServer(ip, port) for (ip, port) in server_info_list ]
+    self.dispatch = dispatch
+    self.max_retries = max_retries
+    self.health_check_timeout = health_check_timeout
+    self.health_check_interval = health_check_interval
+    # Index into self._servers where round robin dispatch picks up
+    self._next_server = 0
+    self._invocation_ids = itertools.count()
 
   def register_task(self, task_name, code_block):
+    if type(code_block) != types.FunctionType:
+      raise ValueError("Task %s must be a plain function" % task_name)
+    if code_block.func_closure is not None:
+      raise ValueError("Task %s must not be a closure" % task_name)
     # Serialize the code_block so we can send it across the wire to the child
-    serialized_code = marshal.dumps(code_block.func_code)\
-                             .encode('base64')
-    self._task_registry.register_task(task_name, serialized_code)
+    serialized_task = cPickle.dumps((code_block.__module__,
+                                     marshal.dumps(code_block.func_code),
+                                     code_block.func_defaults),
+                                    cPickle.HIGHEST_PROTOCOL)
+    self._task_registry.register_task(task_name, serialized_task)
+    for server in self._servers:
+      server.synced_tasks.discard(task_name)
+
+  def check_health(self):
+    ''' Ping every worker, and return the number of live ones '''
+    for server in self._servers:
+      try:
+        status = server.proxy(timeout=self.health_check_timeout).ping()
+      except (socket.error, xmlrpclib.Error) as e:
+        if server.alive:
+          log.warn("Worker %s is not responding: %s" % (server, e))
+        server.alive = False
+        continue
+      if status['incarnation'] != server.incarnation:
+        # New worker process, which hasn't seen any of our tasks
+        server.incarnation = status['incarnation']
+        server.synced_tasks = set()
+      server.max_tasks = status['max_tasks']
+      server.alive = True
+    return len([ s for s in self._servers if s.alive ])
+
+  def _choose_server(self):
+    ''' Return a live worker with spare capacity, or None '''
+    available = [ (i, s) for (i, s) in enumerate(self._servers)
+                  if s.alive and s.in_flight < s.max_tasks ]
+    if available == []:
+      return None
+    if self.dispatch == "least_loaded":
+      (_, server) = min(available,
+                        key=lambda pair: (float(pair[1].in_flight) / pair[1].max_tasks,
+                                          pair[0]))
+      return server
+    for (i, server) in available:
+      if i >= self._next_server:
+        break
+    else:
+      (i, server) = available[0]
+    self._next_server = (i + 1) % len(self._servers)
+    return server
+
+  def _invoke(self, server, task_name, invocation_id, args):
+    # Called in an RPC thread of the parent process
+    proxy = server.proxy()
+    try:
+      for name in self._task_registry.task_names():
+        if name not in server.synced_tasks:
+          proxy.register_task(name, xmlrpclib.Binary(self._task_registry.get_task(name)))
+          server.synced_tasks.add(name)
+      data = proxy.invoke(task_name, invocation_id,
+                          xmlrpclib.Binary(cPickle.dumps(args, cPickle.HIGHEST_PROTOCOL)))
+    except (socket.error, httplib.HTTPException, xmlrpclib.ProtocolError) as e:
+      raise _LostWorker(str(e))
+    except xmlrpclib.Fault as e:
+      raise ReplayException("An Exception (code %d) occured on worker %s: %s" %
+                            (e.faultCode, server, e.faultString))
+    (ok, value) = cPickle.loads(data.data)
+    if not ok:
+      raise ReplayException("An Exception occured in the child replay process on worker %s: %s" %
+                            (server, value))
+    return value
+
+  def _cancel(self, server, invocation_id):
+    try:
+      server.proxy(timeout=self.health_check_timeout).cancel(invocation_id)
+    except (socket.error, xmlrpclib.Error) as e:
+      log.warn("Could not cancel invocation on worker %s: %s" % (server, e))
 
   def fork(self, task_name, *args, **kws):
-    # TODO(cs): Need to define a main() method for the child process, tell child what URL
-    # to bind to via command line arguments, and have child boot
-    # up an RPC server. Then send over the TaskRegistry's task code over the wire,
-    # have the child deserialize the base64 encoded func object, and have the
-    # child register the tasks as RPC stubs.
-    task = self._task_registry.get_task(task_name)
-    pass
+    return self.fork_many(task_name, [args])[0]
+
+  def fork_many(self, task_name, args_list, max_parallel=None, stop_on=None):
+    ''' Run up to max_parallel invocations at once across the workers. See
+    Forker.fork_many. Results are collected (and stop_on evaluated) as each
+    invocation finishes. '''
+    # N.B. get_task raises an exception if task_name is not registered
+    self._task_registry.get_task(task_name)
+    if max_parallel is None or max_parallel < 1:
+      max_parallel = len(args_list)
+    results = [ None ] * len(args_list)
+    # Indices of invocations not yet started
+    pending = range(len(args_list))
+    # { index -> (server, invocation id) }
+    running = {}
+    # Invocations with an index >= cutoff are cancelled
+    cutoff = len(args_list)
+    # { index -> number of workers lost while running it }
+    retries = Counter()
+    # (index, invocation id, return value, exception) tuples
+    done = Queue.Queue()
+
+    def invoke(index, server, invocation_id):
+      try:
+        done.put((index, invocation_id,
+                  self._invoke(server, task_name, invocation_id, args_list[index]),
+                  None))
+      except Exception as e:
+        done.put((index, invocation_id, None, e))
+
+    def stop_running(index):
+      (server, invocation_id) = running.pop(index)
+      server.in_flight -= 1
+      return (server, invocation_id)
+
+    def retry(index, server, error):
+      server.alive = False
+      retries[index] += 1
+      if retries[index] > self.max_retries:
+        raise ReplayException("Lost %d workers while running invocation %d of task %s: %s" %
+                              (retries[index], index, task_name, error))
+      log.warn("Lost worker %s (%s). Retrying invocation %d of task %s" %
+               (server, error, index, task_name))
+      # Keep pending in order, so that earlier invocations go first
+      return sorted(pending + [index])
+
+    if self.check_health() == 0:
+      raise ReplayException("No live workers among %s" % self._servers)
+    last_health_check = time.time()
+    try:
+      while pending or running:
+        while pending and len(running) < max_parallel:
+          server = self._choose_server()
+          if server is None:
+            break
+          index = pending.pop(0)
+          invocation_id = "%d" % self._invocation_ids.next()
+          server.in_flight += 1
+          running[index] = (server, invocation_id)
+          log.debug("Invoking task %s on worker %s" % (task_name, server))
+          rpc_thread = threading.Thread(target=invoke,
+                                        args=(index, server, invocation_id))
+          rpc_thread.daemon = True
+          rpc_thread.start()
+
+        if running == {}:
+          # All workers were lost. See if any came back
+          if self.check_health() == 0:
+            raise ReplayException("No live workers among %s" % self._servers)
+          continue
+
+        # Poll with a timeout so that signals are still delivered to us
+        try:
+          (index, invocation_id, child_return, error) = done.get(True, 1.0)
+        except Queue.Empty:
+          if time.time() - last_health_check > self.health_check_interval:
+            # Workers that die without closing their connections (e.g. along
+            # with their host) would otherwise keep us waiting forever
+            self.check_health()
+            last_health_check = time.time()
+            for i in [ i for (i, (s, _)) in running.items() if not s.alive ]:
+              (server, _) = stop_running(i)
+              pending = retry(i, server, "failed health check")
+          continue
+        if index not in running or running[index][1] != invocation_id:
+          # Straggler that we already cancelled
+          continue
+        (server, _) = stop_running(index)
+        if isinstance(error, _LostWorker):
+          pending = retry(index, server, error)
+          continue
+        if error is not None:
+          raise error
+        results[index] = child_return
+        if stop_on is not None and index < cutoff and stop_on(child_return):
+          log.debug("Task %s succeeded for invocation %d. Cancelling later invocations" %
+                    (task_name, index))
+          cutoff = index
+          for i in xrange(cutoff + 1, len(results)):
+            results[i] = None
+          pending = [ i for i in pending if i < cutoff ]
+          for i in [ i for i in running.keys() if i > cutoff ]:
+            self._cancel(*stop_running(i))
+    finally:
+      for i in running.keys():
+        self._cancel(*stop_running(i))
+    return results
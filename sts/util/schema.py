@@ -0,0 +1,119 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''
+Declared JSON field schemas, and the encoders and decoders built from them.
+
+A schema is a sequence of Fields. The encoder built from a schema writes a
+JSON object with a "class" key followed by the fields, in schema order,
+straight from the object's attributes. The decoder passes the fields of a
+parsed JSON object straight to a constructor as keyword arguments.
+'''
+
+import json
+
+# The encoder json.dumps() uses by default, so values are formatted exactly
+# as json.dumps() would format them
+_encode_value = json.JSONEncoder().encode
+
+class _Required(object):
+  def __repr__(self):
+    return "REQUIRED"
+
+# Default for Fields that must be present when decoding
+REQUIRED = _Required()
+
+class Field(object):
+  ''' One field of a serialized object. '''
+  def __init__(self, name, attr=None, encode=None, optional=False,
+               decode=None, default=REQUIRED, decoded=True):
+    '''
+    Parameters:
+     - name: the JSON key, and the constructor keyword argument the field is
+       decoded into.
+     - attr: the attribute to encode. Defaults to name.
+     - encode: optional function applied to the attribute before it is
+       written.
+     - optional: only write the field if the attribute has been set.
+     - decode: optional function applied to the JSON value before it is
+       passed to the constructor.
+     - default: what to pass to the constructor if the field is missing.
+       Missing REQUIRED fields raise a ValueError.
+     - decoded: whether to pass the field to the constructor at all.
+    '''
+    self.name = name
+    self.attr = attr if attr is not None else name
+    self.encode = encode
+    self.optional = optional
+    self.decode = decode
+    self.default = default
+    self.decoded = decoded
+
+  def __repr__(self):
+    return "Field(%s)" % self.name
+
+def merge_fields(*field_lists):
+  ''' Concatenate field lists. A field redeclared by a later list replaces
+  the earlier declaration in place. '''
+  merged = []
+  name2index = {}
+  for fields in field_lists:
+    for field in fields:
+      if field.name in name2index:
+        merged[name2index[field.name]] = field
+      else:
+        name2index[field.name] = len(merged)
+        merged.append(field)
+  return merged
+
+def make_encoder(class_name, fields):
+  ''' Return a function that serializes an object to a JSON object string:
+  {"class": class_name, <fields in order>} '''
+  head = '{"class": ' + _encode_value(class_name)
+  steps = [ (', ' + _encode_value(f.name) + ': ', f.attr, f.encode, f.optional)
+            for f in fields ]
+
+  def encode(obj):
+    parts = [head]
+    for (key, attr, encode_field, optional) in steps:
+      if optional and not hasattr(obj, attr):
+        continue
+      value = getattr(obj, attr)
+      if encode_field is not None:
+        value = encode_field(value)
+      parts.append(key)
+      parts.append(_encode_value(value))
+    parts.append('}')
+    return ''.join(parts)
+  return encode
+
+def make_decoder(factory, fields):
+  ''' Return a function that builds an object from a parsed JSON object by
+  calling factory with the decoded fields as keyword arguments '''
+  steps = [ (f.name, f.decode, f.default) for f in fields if f.decoded ]
+
+  def decode(json_hash):
+    kwargs = {}
+    for (name, decode_field, default) in steps:
+      if name in json_hash:
+        value = json_hash[name]
+        if decode_field is not None:
+          value = decode_field(value)
+      elif default is REQUIRED:
+        raise ValueError("Field %s not in json_hash %s" % (name, str(json_hash)))
+      else:
+        value = default
+      kwargs[name] = value
+    return factory(**kwargs)
+  return decode
@@ -66,15 +66,19 @@ def launch(snapshot_address=None):
 
     # In controller upon receiving "SNAPSHOT":
     #  - fork a child
-    #     - in child, set (inherited) domain socket to blocking
-    #     - write READY <PID>
-    #     - block on recv()
+    #     - in child, listen on a new domain socket <snapshot_address>.<PID>
+    #     - write READY <PID> to the (inherited) domain socket
+    #     - accept() on the new domain socket, and block on recv()
     #  - proceed
 
+    # In STS upon receiving READY <PID>:
+    #  - connect to <snapshot_address>.<PID>. Several snapshots may be
+    #    pending at once, each with its own domain socket
+
     # In STS after peek()ing:
-    #  - double check that READY <PID> was received
     #  - kill parent process
-    #  - send "PROCEED" to domain socket
+    #  - send "PROCEED" to the child's domain socket, which STS sends all
+    #    further snapshot commands to
     #  - close STSSocketDemultiplexer.true_io_worker.socket
     #  - create a new socket and connect it to the same (address, port) pair
     #    as before
@@ -83,6 +87,7 @@ def launch(snapshot_address=None):
     #  - proceed
 
     # In child, upon recv()ing "PROCEED":
+    #  - stop listening to the inherited domain socket
     #  - create a new blocking listen socket bound to
     #    ServerSocketDemultiplexer.mock_listen_sock.server_info
     #    (old true listen socket should already have been closed)
@@ -128,7 +133,7 @@ def launch(snapshot_address=None):
       demuxer.true_io_worker.socket = new_socket
       log.debug("Done rewiring")
 
-    def snapshot(snapshot_sock):
+    def snapshot(io_worker):
       log.debug("Received SNAPSHOT signal in %d. fork()ing" % os.getpid())
 
       if mux_select.true_listen_socks != []:
@@ -141,14 +146,28 @@ def launch(snapshot_address=None):
         # Make sure to remove ourselves from parent's process group, so we don't
         # get killed by STS along with our parent.
         os.setpgrp()
-        snapshot_sock.setblocking(1)
         pid = os.getpid()
+        # Our own domain socket, so that STS can keep several snapshots
+        # suspended at once
+        clone_address = "%s.%d" % (snapshot_address, pid)
+        clone_listen_sock = create_true_listen_socket(clone_address, socket.AF_UNIX,
+                                                      socket.SOCK_STREAM, blocking=1)
+        shared_sock = io_worker.socket
+        shared_sock.setblocking(1)
         log.debug("Sending READY %d" % pid)
-        snapshot_sock.send("READY %d" % pid)
-        command = snapshot_sock.recv(100)
+        shared_sock.send("READY %d" % pid)
+        clone_sock = clone_listen_sock.accept()[0]
+        clone_listen_sock.close()
+        os.unlink(clone_address)
+        command = clone_sock.recv(100)
         log.debug("Read command %s" % command)
-        snapshot_sock.setblocking(0)
         if command == "PROCEED":
+          # Further snapshot commands are meant for us, not for whoever
+          # else holds the inherited domain socket
+          io_worker.close()
+          clone_sock.setblocking(0)
+          clone_worker = mux_select.create_worker_for_socket(clone_sock)
+          clone_worker.set_receive_handler(read_snapshot_commands)
           proceed()
         else:
           raise ValueError("Unknown command %s" % command)
@@ -157,7 +176,7 @@ def launch(snapshot_address=None):
       command = io_worker.peek_receive_buf()
       io_worker.consume_receive_buf(len(command))
       if command == "SNAPSHOT":
-        snapshot(snapshot_sock)
+        snapshot(io_worker)
       else:
         raise ValueError("Unknown command %s" % command)
 
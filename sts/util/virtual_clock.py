@@ -0,0 +1,71 @@
+# Copyright 2011-2013 Colin Scott
+# Copyright 2011-2013 Andreas Wundsam
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+
+from sts.syncproto.base import SyncTime
+
+class VirtualClock(object):
+  '''
+  A simulated clock for replays where no external process depends on real
+  time, e.g. replays with mock controllers.
+
+  Once installed, time.time() (and hence SyncTime.now() and the switches'
+  flow entry timeouts) reads the virtual clock. Sleeping jumps the clock
+  forward instead of blocking, and replayers jump it directly to the
+  timestamp of each event they replay.
+  '''
+  def __init__(self, start_time=None):
+    self._real_time = time.time
+    if start_time is None:
+      start_time = self._real_time()
+    self._now = float(start_time)
+    self.installed = False
+
+  def time(self):
+    return self._now
+
+  def real_time(self):
+    return self._real_time()
+
+  def advance(self, seconds):
+    if seconds > 0:
+      self._now += seconds
+
+  def advance_to(self, timestamp):
+    ''' Jump forward to timestamp. Never moves the clock backwards. '''
+    if timestamp > self._now:
+      self._now = float(timestamp)
+
+  def sleep(self, seconds):
+    self.advance(seconds)
+
+  def install(self):
+    ''' Monkey patch time.time to read this clock '''
+    if self.installed:
+      return
+    self._real_time = time.time
+    time.time = self.time
+    # SyncTime.now() only ever moves forward. Start it over on our timeline,
+    # which is typically behind the real one.
+    SyncTime.last_returned_time_usec = 0
+    self.installed = True
+
+  def uninstall(self):
+    if not self.installed:
+      return
+    if time.time == self.time:
+      time.time = self._real_time
+    self.installed = False
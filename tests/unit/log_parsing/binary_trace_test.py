@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+#
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os
+import shutil
+import tempfile
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+import sts.input_traces.log_parser as log_parser
+from sts.input_traces.binary_trace import *
+from sts.replay_event import (LinkFailure, LinkRecovery, ControllerStateChange,
+                              WaitTime)
+
+class BinaryTraceTest(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.events = [LinkFailure(1, 1, 2, 1, label="e1", round=0),
+                   ControllerStateChange("c1", "f", "name", [], label="i2", round=0),
+                   LinkRecovery(1, 1, 2, 1, label="e3", round=1),
+                   ControllerStateChange("c2", "f", "name", [], label="i4", round=1),
+                   WaitTime(0.5, label="e5", round=2)]
+    self.events[0].dependent_labels = ["e3"]
+    self.json_path = os.path.join(self.tmpdir, "events.trace")
+    with open(self.json_path, 'w') as output:
+      for event in self.events:
+        output.write(event.to_json() + '\n')
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def test_round_trip(self):
+    binary_path = os.path.join(self.tmpdir, "events" + BINARY_TRACE_EXTENSION)
+    json_to_binary(self.json_path, binary_path)
+    copy_path = os.path.join(self.tmpdir, "copy.trace")
+    binary_to_json(binary_path, copy_path)
+    with open(self.json_path) as original, open(copy_path) as copy:
+      self.assertEqual(original.read(), copy.read())
+    self.assertEqual(self.events, log_parser.parse_path(binary_path))
+
+  def test_random_access(self):
+    binary_path = os.path.join(self.tmpdir, "events" + BINARY_TRACE_EXTENSION)
+    json_to_binary(self.json_path, binary_path)
+    with BinaryTraceReader(binary_path) as reader:
+      self.assertEqual(5, len(reader))
+      self.assertEqual(self.events[2], reader.event_with_label("e3"))
+      self.assertEqual(None, reader.event_with_label("e6"))
+      self.assertEqual([0, 1, 2], reader.rounds)
+      self.assertEqual(self.events[2:4], reader.events_in_round(1))
+      self.assertEqual([], reader.events_in_round(7))
+      self.assertEqual(self.events[1:4:2],
+                       reader.events_of_class("ControllerStateChange"))
+      self.assertEqual([self.events[3]],
+                       reader.events_of_class("ControllerStateChange",
+                                              lambda e: e.controller_id == "c2"))
+
+  def test_unclosed(self):
+    binary_path = os.path.join(self.tmpdir, "events" + BINARY_TRACE_EXTENSION)
+    writer = BinaryTraceWriter(binary_path)
+    writer.write_event(self.events[0])
+    self.assertRaises(RuntimeError, writer.write_event, self.events[0])
+    writer._output.flush()
+    self.assertRaises(ValueError, BinaryTraceReader, binary_path)
+    writer.close()
+    self.assertEqual(1, len(BinaryTraceReader(binary_path)))
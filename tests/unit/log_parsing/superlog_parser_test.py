@@ -17,6 +17,7 @@
 import unittest
 import sys
 import os
+import json
 
 sys.path.append(os.path.dirname(__file__) + "/../../..")
 
@@ -49,5 +50,39 @@ class superlog_parser_test(unittest.TestCase):
       if name is not None:
         os.unlink(name)
 
+  def link_event(self, klass, label, dependent_labels=[]):
+    return ('''{"dependent_labels": %s, "start_dpid": 1, "class": "%s",'''
+            ''' "start_port_no": 1, "end_dpid": 2, "end_port_no": 1,'''
+            ''' "label": "%s", "time": [0,0], "round": 0}''' %
+            (json.dumps(dependent_labels), klass, label))
+
+  def test_iter_parse_is_lazy(self):
+    def lines():
+      yield self.link_event("LinkFailure", "e1", ["e2"])
+      raise AssertionError("read past the first event")
+    events = log_parser.iter_parse(lines())
+    self.assertEqual(LinkFailure, type(events.next()))
+
+  def test_iter_parse_checks(self):
+    duplicate = [self.link_event("LinkFailure", "e1"),
+                 self.link_event("LinkRecovery", "e1")]
+    self.assertRaises(RuntimeError, list, log_parser.iter_parse(duplicate))
+    # Dependents can't have happened already
+    early_dependent = [self.link_event("LinkRecovery", "e2"),
+                       self.link_event("LinkFailure", "e1", ["e2"])]
+    self.assertRaises(AssertionError, list, log_parser.iter_parse(early_dependent))
+    missing_dependent = [self.link_event("LinkFailure", "e1", ["e2"])]
+    self.assertRaises(AssertionError, list, log_parser.iter_parse(missing_dependent))
+
+  def test_label_set(self):
+    labels = log_parser.LabelSet()
+    for label in ["e1", "i1", "e1000", "x", "e-3"]:
+      self.assertFalse(label in labels)
+      labels.add(label)
+      self.assertTrue(label in labels)
+    self.assertFalse("i1000" in labels)
+    self.assertFalse("e999" in labels)
+    self.assertFalse("e100000" in labels)
+
 if __name__ == '__main__':
   unittest.main()
@@ -0,0 +1,175 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os
+
+sys.path.append(os.path.dirname(__file__) + "/../../../..")
+
+from sts.replay_event import *
+from sts.openflow_buffer import OpenFlowBuffer
+from sts.control_flow.base import ReplaySyncCallback
+from sts.control_flow.event_scheduler import EventScheduler, DumbEventScheduler, TimeoutModel
+from sts.util.convenience import base64_encode
+from pox.openflow.libopenflow_01 import ofp_echo_request, ofp_hello
+
+class MockConnection(object):
+  def __init__(self):
+    self.received = []
+
+  def allow_message_receipt(self, message):
+    self.received.append(message)
+
+class MockIOMaster(object):
+  ''' Delivers one queued message to the OpenFlowBuffer per select '''
+  def __init__(self, openflow_buffer, deliveries):
+    self.openflow_buffer = openflow_buffer
+    self.deliveries = list(deliveries)
+    self.timeouts = []
+
+  def select(self, timeout=0):
+    self.timeouts.append(timeout)
+    if self.deliveries:
+      (message, conn) = self.deliveries.pop(0)
+      self.openflow_buffer.insert_pending_receipt(1, "c1", message, conn)
+
+class MockSimulation(object):
+  def __init__(self, deliveries):
+    self.openflow_buffer = OpenFlowBuffer()
+    self.controller_sync_callback = ReplaySyncCallback()
+    self.patch_panel = None
+    self.io_master = MockIOMaster(self.openflow_buffer, deliveries)
+
+def receive_event(message):
+  fingerprint = ("ControlMessageReceive", OFFingerprint.from_pkt(message), 1, "c1")
+  return ControlMessageReceive(1, "c1", fingerprint,
+                               b64_packet=base64_encode(message))
+
+class EventSchedulerTest(unittest.TestCase):
+  def test_wakes_on_matching_receive(self):
+    conn = MockConnection()
+    expected = ofp_echo_request()
+    # An unrelated message arrives first
+    simulation = MockSimulation([(ofp_hello(), conn), (expected, conn)])
+    scheduler = EventScheduler(simulation, epsilon_seconds=60)
+    event = receive_event(expected)
+    scheduler.schedule(event)
+    self.assertFalse(event.timed_out)
+    self.assertEqual([expected], conn.received)
+    # Only one select per delivery, and none of them poll
+    self.assertEqual(2, len(simulation.io_master.timeouts))
+    for timeout in simulation.io_master.timeouts:
+      self.assertTrue(timeout > scheduler.sleep_interval_seconds)
+
+  def test_already_buffered(self):
+    conn = MockConnection()
+    expected = ofp_echo_request()
+    simulation = MockSimulation([])
+    simulation.openflow_buffer.insert_pending_receipt(1, "c1", expected, conn)
+    scheduler = EventScheduler(simulation)
+    event = receive_event(expected)
+    scheduler.schedule(event)
+    self.assertFalse(event.timed_out)
+    self.assertEqual([], simulation.io_master.timeouts)
+
+  def test_timeout(self):
+    simulation = MockSimulation([])
+    scheduler = EventScheduler(simulation, initial_wait=0.0,
+                               epsilon_seconds=0.05)
+    event = receive_event(ofp_echo_request())
+    scheduler.schedule(event)
+    self.assertTrue(event.timed_out)
+
+  def test_close_stops_listening(self):
+    simulation = MockSimulation([])
+    scheduler = EventScheduler(simulation)
+    key = scheduler.waiters.key_for(receive_event(ofp_echo_request()))
+    scheduler.waiters.expect(key)
+    scheduler.close()
+    simulation.openflow_buffer.insert_pending_receipt(1, "c1", ofp_echo_request(),
+                                                      MockConnection())
+    self.assertFalse(scheduler.waiters.signalled(key))
+
+  def test_dumb_scheduler_wakes_on_matching_receive(self):
+    conn = MockConnection()
+    expected = ofp_echo_request()
+    simulation = MockSimulation([(ofp_hello(), conn), (expected, conn)])
+    scheduler = DumbEventScheduler(simulation, epsilon_seconds=60)
+    event = receive_event(expected)
+    scheduler.schedule(event)
+    self.assertFalse(event.timed_out)
+    self.assertEqual([expected], conn.received)
+    self.assertEqual(2, len(simulation.io_master.timeouts))
+    self.assertEqual(1, scheduler.stats.event2matched["ControlMessageReceive"])
+
+class TimeoutModelTest(unittest.TestCase):
+  def test_budget(self):
+    model = TimeoutModel(min_samples=3, latency_slack=2.0, min_wait_seconds=0.05)
+    model.update({"matches": [[0.1, 0.5, 0.5], [0.05, 0.5, 0.5]],
+                  "times out": [[None, 0.5, 0.5]] * 3,
+                  "both": [[0.1, 0.5, 0.5], [None, 0.5, 0.5], [0.1, 0.5, 0.5]]})
+    # Not enough samples yet
+    self.assertEqual(0.5, model.budget("matches", 0.5))
+    model.update({"matches": [[0.2, 0.5, 0.5]]})
+    self.assertAlmostEqual(0.4, model.budget("matches", 0.5))
+    # Never more than the default
+    self.assertEqual(0.3, model.budget("matches", 0.3))
+    self.assertEqual(0.05, model.budget("times out", 0.5))
+    self.assertEqual(0.5, model.budget("both", 0.5))
+    self.assertEqual(0.5, model.budget("unknown", 0.5))
+    # A timeout after shrinking the budget goes back to the default, until
+    # the next match
+    model.update({"matches": [[None, 0.4, 0.5]]})
+    self.assertEqual(0.5, model.budget("matches", 0.5))
+    model.update({"matches": [[0.1, 0.5, 0.5]]})
+    self.assertAlmostEqual(0.4, model.budget("matches", 0.5))
+
+  def test_shrunk_timeouts_recover(self):
+    model = TimeoutModel(min_samples=3, min_wait_seconds=0.05)
+    model.update({"key": [[None, 0.5, 0.5]] * 3})
+    self.assertEqual(0.05, model.budget("key", 0.5))
+    # Timeouts with the shrunk budget don't tell us whether the event would
+    # have shown up with the default budget, so now and then we check
+    model.update({"key": [[None, 0.05, 0.5]] * 2})
+    self.assertEqual(0.05, model.budget("key", 0.5))
+    model.update({"key": [[None, 0.05, 0.5]]})
+    self.assertEqual(0.5, model.budget("key", 0.5))
+    # The event has started showing up, e.g. in a pruned trace
+    model.update({"key": [[0.2, 0.5, 0.5]]})
+    self.assertEqual(0.5, model.budget("key", 0.5))
+
+  def test_timeouts_slide_out(self):
+    model = TimeoutModel(min_samples=3, latency_slack=2.0, max_samples=5)
+    model.update({"key": [[0.1, 0.5, 0.5], [None, 0.5, 0.5]]})
+    model.update({"key": [[0.1, 0.5, 0.5]] * 4})
+    self.assertEqual(0.5, model.budget("key", 0.5))
+    # The stray timeout is now more than max_samples waits ago
+    model.update({"key": [[0.1, 0.5, 0.5]]})
+    self.assertAlmostEqual(0.2, model.budget("key", 0.5))
+
+  def test_scheduler_uses_budget(self):
+    simulation = MockSimulation([])
+    model = TimeoutModel(min_samples=1)
+    event = receive_event(ofp_echo_request())
+    model.update({TimeoutModel.key(event): [[None, 60, 60]]})
+    scheduler = EventScheduler(simulation, initial_wait=0.0,
+                               epsilon_seconds=60, timeout_model=model)
+    scheduler.schedule(event)
+    self.assertTrue(event.timed_out)
+    [[latency, budget, default_budget]] = \
+        scheduler.stats.get_waits_dict()[TimeoutModel.key(event)]
+    self.assertEqual(None, latency)
+    self.assertEqual(model.min_wait_seconds, budget)
+    self.assertTrue(default_budget > 59)
@@ -0,0 +1,81 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from sts.control_flow.partitioners import *
+from sts.replay_event import *
+
+class PartitionersTest(unittest.TestCase):
+  def setUp(self):
+    self.inputs = [ SwitchFailure(1, label="e1"),
+                    LinkFailure(2, 1, 3, 1, label="e2"),
+                    TrafficInjection(label="e3", host_id=7),
+                    SwitchRecovery(1, label="e4"),
+                    LinkRecovery(3, 1, 2, 1, label="e5"),
+                    ControllerFailure("c1", label="e6"),
+                    TrafficInjection(label="e7", host_id=8),
+                    ControllerRecovery("c1", label="e8") ]
+
+  def labels(self, chunks):
+    return [ [ e.label for e in chunk ] for chunk in chunks ]
+
+  def test_time(self):
+    (name, chunks) = Partitioner().partition(self.inputs, 2)
+    self.assertEqual("time", name)
+    self.assertEqual([["e1", "e2", "e3", "e4"], ["e5", "e6", "e7", "e8"]],
+                     self.labels(chunks))
+
+  def test_switch(self):
+    (name, chunks) = SwitchPartitioner().partition(self.inputs, 3)
+    self.assertEqual("switch", name)
+    # Inputs that don't affect a switch are grouped together
+    self.assertEqual([["e1", "e4"], ["e2", "e5"], ["e3", "e6", "e7", "e8"]],
+                     self.labels(chunks))
+
+  def test_balanced(self):
+    # Two groups per chunk, with two inputs each
+    (_, chunks) = EventTypePartitioner().partition(self.inputs, 2)
+    self.assertEqual([["e1", "e3", "e4", "e7"], ["e2", "e5", "e6", "e8"]],
+                     self.labels(chunks))
+
+  def test_fewer_groups_than_chunks(self):
+    (_, chunks) = HostPartitioner().partition(self.inputs, 4)
+    self.assertEqual(4, len(chunks))
+    self.assertEqual(sorted(e.label for e in self.inputs),
+                     sorted(sum(self.labels(chunks), [])))
+    self.assertTrue(["e3"] in self.labels(chunks))
+    self.assertTrue(["e7"] in self.labels(chunks))
+
+  def test_hybrid(self):
+    partitioner = HybridPartitioner([LinkPartitioner(), HostPartitioner()])
+    # The link partitioner has 2 groups, and the host partitioner 3
+    self.assertEqual("link", partitioner.partition(self.inputs, 2)[0])
+    self.assertEqual("host", partitioner.partition(self.inputs, 3)[0])
+    self.assertEqual("time", partitioner.partition(self.inputs, 4)[0])
+
+  def test_group_internal_events(self):
+    c1 = ControllerStateChange("c1", "mastership %s", "mastership %s", ["a"], label="i1")
+    c2 = ControllerStateChange("c2", "mastership %s", "mastership %s", ["b"], label="i2")
+    d1 = DeterministicValue("c1", "gettimeofday", [1, 0], label="i3")
+    groups = group_internal_events([c1, self.inputs[0], d1, c2])
+    self.assertEqual([(("ControllerStateChange", "mastership %s"), [c1, c2]),
+                      (("DeterministicValue", "gettimeofday"), [d1])], groups)
+
+if __name__ == '__main__':
+  unittest.main()
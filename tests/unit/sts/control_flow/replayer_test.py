@@ -0,0 +1,131 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os
+import random
+from collections import Counter
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from sts.control_flow.replayer import Replayer, ExpectedMessageWindow, DataplaneChecker
+from sts.replay_event import *
+from sts.event_dag import EventDag
+
+def message(event_type, of_fingerprint, dpid, round):
+  return event_type(dpid, "c1", (event_type.__name__, of_fingerprint, dpid, "c1"),
+                    round=round)
+
+class ExpectedMessageWindowTest(unittest.TestCase):
+  def expected(self, events, index, round_window, event_type):
+    ''' What the window should hold, computed from scratch '''
+    expected = Counter()
+    for event in events[index:]:
+      if event.round - events[index].round > round_window:
+        break
+      if type(event) == event_type:
+        expected[event.fingerprint[1:]] += 1
+    return expected
+
+  def test_window(self):
+    random.seed(1)
+    events = []
+    for round in xrange(40):
+      for _ in xrange(random.randint(0, 3)):
+        event_type = random.choice([ControlMessageReceive, ControlMessageSend])
+        events.append(message(event_type, random.choice(["echo", "lldp"]),
+                              random.randint(1, 2), round))
+      events.append(WaitTime(0, round=round))
+    window = ExpectedMessageWindow(events, 3)
+    for index in xrange(len(events)):
+      window.advance(index)
+      self.assertEqual(self.expected(events, index, 3, ControlMessageReceive),
+                       window.receives)
+      self.assertEqual(self.expected(events, index, 3, ControlMessageSend),
+                       window.sends)
+
+  def test_rewind(self):
+    events = [ message(ControlMessageReceive, "echo", 1, round)
+               for round in [0, 1, 5, 6] ]
+    window = ExpectedMessageWindow(events, 1)
+    window.advance(2)
+    self.assertEqual(2, window.receives[("echo", 1, "c1")])
+    window.advance(0)
+    self.assertEqual(2, window.receives[("echo", 1, "c1")])
+    window.advance(1)
+    self.assertEqual(1, window.receives[("echo", 1, "c1")])
+
+class DataplaneCheckerTest(unittest.TestCase):
+  def test_decide_drop(self):
+    f1 = (DPFingerprint({'class': 'lldp'}), 1, 1)
+    f2 = (DPFingerprint({'class': 'arp'}), 1, 1)
+    events = [ DataplaneDrop(f1, round=0),
+               DataplanePermit(f1, round=1),
+               DataplaneDrop(f2, round=2),
+               DataplaneDrop(f1, round=30) ]
+    checker = DataplaneChecker(EventDag(events), slop_buffer=10)
+    checker.update_window(0)
+    # Same fingerprints are matched in order, once each
+    self.assertTrue(checker.decide_drop_fingerprint(f1))
+    self.assertFalse(checker.decide_drop_fingerprint(f1))
+    self.assertFalse(checker.decide_drop_fingerprint(f1))
+    # The last drop is outside of the window until round 21
+    checker.update_window(20)
+    self.assertFalse(checker.decide_drop_fingerprint(f1))
+    checker.update_window(21)
+    self.assertTrue(checker.decide_drop_fingerprint(f1))
+    # The drop of f2 has left the window by now
+    self.assertFalse(checker.decide_drop_fingerprint(f2))
+    # Going back doesn't bring back matched events
+    checker.update_window(0)
+    self.assertTrue(checker.decide_drop_fingerprint(f2))
+    self.assertFalse(checker.decide_drop_fingerprint(f1))
+    self.assertEqual(3, len(checker.stats.actual_drops))
+
+class MockSimulationConfig(object):
+  ignore_interposition = False
+
+class MockEventScheduler(object):
+  def __init__(self):
+    self.stats = None
+    self.scheduled = []
+
+  def set_input_logger(self, input_logger):
+    pass
+
+  def schedule(self, event):
+    self.scheduled.append(event)
+
+  def close(self):
+    pass
+
+class ReplayerTest(unittest.TestCase):
+  def test_nothing_left_to_replay(self):
+    event_scheduler = MockEventScheduler()
+    replayer = Replayer(MockSimulationConfig(),
+                        EventDag([ WaitTime(0, round=0) ]),
+                        create_event_scheduler=lambda _: event_scheduler,
+                        early_exit=True)
+    # Normally set up by simulate()
+    replayer.simulation = None
+    # e.g. continuing from a snapshot taken after the last event
+    replayer.run_simulation_forward(start_index=1)
+    replayer.dag = EventDag([])
+    replayer.run_simulation_forward()
+    self.assertEqual([], event_scheduler.scheduled)
+    self.assertEqual(None, replayer.early_exit_index)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,69 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from sts.control_flow.snapshot_utils import PrefixSnapshot, PrefixSnapshotCache
+
+class PrefixSnapshotCacheTest(unittest.TestCase):
+  def setUp(self):
+    self.cache = PrefixSnapshotCache(2)
+    self.a = PrefixSnapshot("/tmp/a", 1)
+    self.b = PrefixSnapshot("/tmp/b", 2)
+    self.c = PrefixSnapshot("/tmp/c", 3)
+
+  def test_longest_prefix(self):
+    self.cache.insert(["e1"], self.a)
+    self.cache.insert(["e1", "e2", "e3"], self.b)
+    self.assertEqual((3, self.b),
+                     self.cache.longest_prefix(["e1", "e2", "e3", "e4"]))
+    self.assertEqual((1, self.a), self.cache.longest_prefix(["e1", "e2", "e4"]))
+    self.assertEqual(None, self.cache.longest_prefix(["e2", "e3"]))
+    # Only proper prefixes: there would be nothing left to replay
+    self.assertEqual((1, self.a), self.cache.longest_prefix(["e1", "e2", "e3"]))
+
+  def test_contains(self):
+    self.cache.insert(["e1", "e2"], self.a)
+    self.assertTrue(["e1", "e2"] in self.cache)
+    self.assertFalse(["e1"] in self.cache)
+    self.assertFalse(["e2", "e1"] in self.cache)
+
+  def test_lru_eviction(self):
+    self.assertEqual([], self.cache.insert(["e1"], self.a))
+    self.assertEqual([], self.cache.insert(["e2"], self.b))
+    # Using ["e1"] makes ["e2"] the least recently used
+    self.cache.longest_prefix(["e1", "e3"])
+    self.assertEqual([self.b], self.cache.insert(["e3"], self.c))
+    self.assertEqual(2, len(self.cache))
+    self.assertFalse(["e2"] in self.cache)
+    self.assertEqual(set([self.a, self.c]), set(self.cache.clear()))
+    self.assertEqual(0, len(self.cache))
+
+  def test_replace(self):
+    self.cache.insert(["e1"], self.a)
+    self.assertEqual([self.a], self.cache.insert(["e1"], self.b))
+    self.assertEqual((1, self.b), self.cache.longest_prefix(["e1", "e2"]))
+
+  def test_remove(self):
+    self.cache.insert(["e1"], self.a)
+    self.cache.remove(["e1"])
+    self.cache.remove(["e2"])
+    self.assertEqual(None, self.cache.longest_prefix(["e1", "e2"]))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -24,6 +24,7 @@ from sts.topology import FatTree, BufferedPatchPanel, MeshTopology
 from sts.simulation_state import SimulationConfig
 from sts.entities import Host
 from sts.util.convenience import IPAddressSpace
+from config.invariant_checks import name_to_invariant_check
 
 sys.path.append(os.path.dirname(__file__) + "/../../..")
 
@@ -43,6 +44,7 @@ class ReplayerTest(unittest.TestCase):
   tmp_controller_superlog = '/tmp/superlog_controller.tmp'
   tmp_dataplane_superlog = '/tmp/superlog_dataplane.tmp'
   tmp_migration_superlog = '/tmp/superlog_migration.tmp'
+  tmp_early_exit_superlog = '/tmp/superlog_early_exit.tmp'
 
   # ------------------------------------------ #
   #        Basic Test                          #
@@ -203,5 +205,38 @@ class ReplayerTest(unittest.TestCase):
       if simulation is not None:
         simulation.clean_up()
 
+  # ------------------------------------------ #
+  #        Early Exit Test                     #
+  # ------------------------------------------ #
+
+  def write_early_exit_superlog(self):
+    superlog = open(self.tmp_early_exit_superlog, 'w')
+    for i in range(4):
+      e = str('''{"dependent_labels": [], "dpid": 8, "class": "%s",'''
+              ''' "label": "e%d", "time": [0,0], "round": %d}''' %
+              ("SwitchFailure" if i % 2 == 0 else "SwitchRecovery", i+1, i))
+      superlog.write(e + '\n')
+    superlog.close()
+
+  def test_early_exit(self):
+    simulation = None
+    name_to_invariant_check["test_always_violated"] = lambda simulation: ["bug"]
+    try:
+      self.write_early_exit_superlog()
+      simulation_cfg = self.setup_simple_simulation()
+      replayer = Replayer(simulation_cfg, self.tmp_early_exit_superlog,
+                          invariant_check_name="test_always_violated",
+                          bug_signature="bug", early_exit=True,
+                          early_exit_round_interval=1)
+      simulation = replayer.simulate()
+      self.assertTrue(simulation.violation_found)
+      # The first check happens one round in
+      self.assertEqual(1, replayer.early_exit_index)
+    finally:
+      del name_to_invariant_check["test_always_violated"]
+      os.unlink(self.tmp_early_exit_superlog)
+      if simulation is not None:
+        simulation.clean_up()
+
 if __name__ == '__main__':
   unittest.main()
@@ -118,6 +118,29 @@ class event_dag_test(unittest.TestCase):
     sub_graph = event_dag.input_complement([mockInputEvent])
     self.assertEqual( [ e for (i, e) in enumerate(event_dag.events) if i==0 or i==2 ], sub_graph.events)
 
+  def test_internal_complement(self):
+    i1 = MockInternalEvent(("lldp",))
+    i2 = MockInternalEvent(("echo",))
+    e1 = MockInputEvent()
+    events = [i1, e1, i2]
+    dag = EventDag(events)
+    # Input events are never removed
+    view = dag.internal_complement([i1, e1])
+    self.assertEqual([e1, i2], view.events)
+    self.assertEqual([e1], view.internal_complement([i2]).events)
+
+  def test_next_state_change(self):
+    s1 = ControllerStateChange("c1", "f", "f", [], label="i1")
+    s2 = ControllerStateChange("c1", "f", "f", [], label="i2")
+    e1 = MockInputEvent()
+    e2 = MockInputEvent()
+    dag = EventDag([e1, s1, e2, s2, MockInputEvent()])
+    self.assertEqual([s1, s1, s2, s2, None],
+                     [ dag.next_state_change(i) for i in xrange(5) ])
+    view = dag.input_complement([e2])
+    self.assertEqual([s1, s1, s2, None],
+                     [ view.next_state_change(i) for i in xrange(4) ])
+
   def test_migration_simple(self):
     events = [ MockInternalEvent('a'), HostMigration(1,1,2,2,"host1"),
                MockInternalEvent('b'), HostMigration(2,2,3,3,"host1"),
@@ -161,6 +184,35 @@ class event_dag_test(unittest.TestCase):
     fingerprint = ('HostMigration',1,1,2,2,"host1")
     self.assertEqual(fingerprint, new_dag.events[1].fingerprint)
 
+  def test_failure_recovery_pruned_together(self):
+    events = [ MockInternalEvent('a'), SwitchFailure(1), MockInputEvent(),
+               SwitchRecovery(1), MockInternalEvent('b') ]
+    event_dag = EventDag(events)
+    event_dag.mark_invalid_input_sequences()
+    # Pruning the failure prunes its recovery
+    new_dag = event_dag.input_complement([events[1]])
+    self.assertEqual([events[0], events[2], events[4]], new_dag.events)
+    # Recoveries are never pruned on their own
+    new_dag = event_dag.input_complement([events[3]])
+    self.assertEqual(events, new_dag.events)
+    # The failure and recovery form a single atomic input
+    self.assertEqual(2, len(event_dag.atomic_input_events))
+    new_dag = event_dag.atomic_input_subset(event_dag.atomic_input_events[:1])
+    self.assertEqual([events[0], events[1], events[3], events[4]], new_dag.events)
+
+  def test_insert_atomic_inputs(self):
+    events = [ MockInternalEvent('a'), MockInputEvent(), MockInternalEvent('b'),
+               MockInputEvent(), MockInputEvent() ]
+    event_dag = EventDag(events)
+    view = event_dag.input_complement([events[1], events[3]])
+    self.assertEqual([events[0], events[2], events[4]], view.events)
+    # Nested views are relative to the view, not the original dag
+    self.assertEqual([events[0], events[2]],
+                     view.input_complement([events[4]]).events)
+    new_dag = view.insert_atomic_inputs([events[3], events[1]])
+    self.assertEqual(events, new_dag.events)
+    self.assertEqual(len(events), len(new_dag))
+    self.assertEqual([events[1], events[3], events[4]], new_dag.input_events)
 
 if __name__ == '__main__':
   unittest.main()
@@ -0,0 +1,75 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os
+import shutil
+import tempfile
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+import sts.input_traces.log_parser as log_parser
+from sts.input_traces.input_logger import InputLogger
+from sts.replay_event import LinkFailure, LinkRecovery, WaitTime
+
+class MockControlFlow(object):
+  sync_callback = None
+  invariant_check_name = ""
+
+class InputLoggerTest(unittest.TestCase):
+  def setUp(self):
+    self.results_dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.results_dir)
+
+  def test_batch_writes(self):
+    logger = InputLogger()
+    logger.open(self.results_dir)
+    logger.batch_writes(2)
+    events = [ LinkFailure(1, 1, 2, 1, label="e%d" % i) if i % 2 == 0 else
+               LinkRecovery(1, 1, 2, 1, label="e%d" % i) for i in range(5) ]
+    for event in events:
+      logger.log_input_event(event)
+    logger.close(MockControlFlow(), "SimulationConfig()")
+    logged = log_parser.parse_path(logger.output_path)
+    self.assertEqual([ e.label for e in events ],
+                     [ e.label for e in logged[:-1] ])
+    self.assertEqual(WaitTime, type(logged[-1]))
+
+  def test_binary_output(self):
+    logger = InputLogger()
+    logger.open(self.results_dir, output_filename="events.btrace")
+    logger.batch_writes(2)
+    events = [ LinkFailure(1, 1, 2, 1, label="e1", round=0),
+               LinkRecovery(1, 1, 2, 1, label="e2", round=1) ]
+    for event in events:
+      logger.log_input_event(event)
+    logger.close(MockControlFlow(), "SimulationConfig()")
+    logged = log_parser.parse_path(logger.output_path)
+    self.assertEqual(events, logged[:-1])
+    self.assertEqual(WaitTime, type(logged[-1]))
+
+  def test_compressed_output(self):
+    logger = InputLogger(output_filename="events.trace.gz")
+    logger.open(self.results_dir)
+    events = [ LinkFailure(1, 1, 2, 1, label="e1", round=0),
+               LinkRecovery(1, 1, 2, 1, label="e2", round=1) ]
+    for event in events:
+      logger.log_input_event(event)
+    logger.close(MockControlFlow(), "SimulationConfig()")
+    self.assertTrue(logger.output_path.endswith("events.trace.gz"))
+    logged = log_parser.parse_path(logger.output_path)
+    self.assertEqual(events, logged[:-1])
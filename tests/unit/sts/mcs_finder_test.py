@@ -17,14 +17,21 @@ import unittest
 import sys
 import os
 import shutil
+from collections import Counter
 
 from sts.control_flow.mcs_finder import MCSFinder, EfficientMCSFinder
-from sts.replay_event import InputEvent, InvariantViolation
+from sts.replay_event import InputEvent, InternalEvent, InvariantViolation, SwitchFailure, LinkFailure, TrafficInjection
 from sts.event_dag import EventDag
+from sts.control_flow.snapshot_utils import PrefixSnapshot, PrefixSnapshotCache
+from sts.util.precompute_cache import MonotonicReplayCache, PersistentReplayCache
+from sts.control_flow.partitioners import EventTypePartitioner
 import logging
 
 sys.path.append(os.path.dirname(__file__) + "/../../..")
 
+class MockCrash(Exception):
+  pass
+
 class MockSimulationConfig(object):
   def __init__(self, ignore_interposition=False):
     self.ignore_interposition = ignore_interposition
@@ -42,6 +49,9 @@ class MockMCSFinderBase(MCSFinder):
     self.mcs = mcs
     self.simulation = None
     self.transform_dag = None
+    self.replays = 0
+    # Raise MockCrash after this many replays
+    self.crash_after = None
 
   def log(self, message):
     self._log.info(message)
@@ -53,6 +63,10 @@ class MockMCSFinderBase(MCSFinder):
     return ["violation"]
 
   def replay(self, new_dag, hook=None, ignore_runtime_stats=False):
+    if self.replays == self.crash_after:
+      raise MockCrash()
+    self.replays += 1
+    self._runtime_stats.record_replay_stats(len(new_dag.input_events))
     self.new_dag = new_dag
     return self.invariant_check(new_dag)
 
@@ -67,6 +81,31 @@ class MockEfficientMCSFinder(MockMCSFinderBase, EfficientMCSFinder):
     MockMCSFinderBase.__init__(self, event_dag, mcs)
     self._log = logging.getLogger("mock_efficient_mcs_finder")
 
+class MockParallelMCSFinderBase(MockMCSFinderBase):
+  ''' Replays "concurrently", cancelling dags after the first violation '''
+  def __init__(self, event_dag, mcs):
+    MockMCSFinderBase.__init__(self, event_dag, mcs)
+    self.max_parallel_replays = 4
+
+  def replay_parallel(self, new_dags, labels, ignore_runtime_stats=False,
+                      stop_on_violation=True):
+    violations = []
+    for new_dag in new_dags:
+      violations.append(self.replay(new_dag))
+      if violations[-1] and stop_on_violation:
+        break
+    return violations + [None] * (len(new_dags) - len(violations))
+
+class MockParallelMCSFinder(MockParallelMCSFinderBase, MCSFinder):
+  def __init__(self, event_dag, mcs):
+    MockParallelMCSFinderBase.__init__(self, event_dag, mcs)
+    self._log = logging.getLogger("mock_parallel_mcs_finder")
+
+class MockParallelEfficientMCSFinder(MockParallelMCSFinderBase, EfficientMCSFinder):
+  def __init__(self, event_dag, mcs):
+    MockParallelMCSFinderBase.__init__(self, event_dag, mcs)
+    self._log = logging.getLogger("mock_parallel_efficient_mcs_finder")
+
 class MockInputEvent(InputEvent):
   def __init__(self, fingerprint=None, **kws):
     super(MockInputEvent, self).__init__(**kws)
@@ -80,6 +119,18 @@ class MockInputEvent(InputEvent):
   def proceed(self, simulation):
     return True
 
+class MockInternalEvent(InternalEvent):
+  def __init__(self, fingerprint, **kws):
+    super(MockInternalEvent, self).__init__(**kws)
+    self._fingerprint = fingerprint
+
+  @property
+  def fingerprint(self):
+    return self._fingerprint
+
+  def proceed(self, simulation):
+    return True
+
 mcs_results_path = "/tmp/mcs_results"
 
 class MCSFinderTest(unittest.TestCase):
@@ -89,6 +140,12 @@ class MCSFinderTest(unittest.TestCase):
   def test_basic_efficient(self):
     self.basic(MockEfficientMCSFinder)
 
+  def test_basic_parallel(self):
+    self.basic(MockParallelMCSFinder)
+
+  def test_basic_parallel_efficient(self):
+    self.basic(MockParallelEfficientMCSFinder)
+
   def basic(self, mcs_finder_type):
     trace = [ MockInputEvent(fingerprint=("class",f)) for f in range(1,7) ]
     trace.append(InvariantViolation(["violation"], persistent=True))
@@ -109,6 +166,12 @@ class MCSFinderTest(unittest.TestCase):
   def test_straddle_efficient(self):
     self.straddle(MockEfficientMCSFinder)
 
+  def test_straddle_parallel(self):
+    self.straddle(MockParallelMCSFinder)
+
+  def test_straddle_parallel_efficient(self):
+    self.straddle(MockParallelEfficientMCSFinder)
+
   def straddle(self, mcs_finder_type):
     trace = [ MockInputEvent(fingerprint=("class",f)) for f in range(1,7) ]
     trace.append(InvariantViolation(["violation"], persistent=True))
@@ -129,6 +192,12 @@ class MCSFinderTest(unittest.TestCase):
   def test_all_efficient(self):
     self.all(MockEfficientMCSFinder)
 
+  def test_all_parallel(self):
+    self.all(MockParallelMCSFinder)
+
+  def test_all_parallel_efficient(self):
+    self.all(MockParallelEfficientMCSFinder)
+
   def all(self, mcs_finder_type):
     trace = [ MockInputEvent(fingerprint=("class",f)) for f in range(1,7) ]
     trace.append(InvariantViolation(["violation"], persistent=True))
@@ -143,5 +212,353 @@ class MCSFinderTest(unittest.TestCase):
       shutil.rmtree(mcs_results_path)
     self.assertEqual(mcs, mcs_finder.dag.input_events)
 
+  def test_adaptive_replays(self):
+    trace = [ MockInputEvent(fingerprint=("class",f)) for f in range(1,7) ]
+    trace.append(InvariantViolation(["violation"], persistent=True))
+    mcs = [trace[0],trace[5]]
+    replays = {}
+    for replay_confidence in [None, 0.5]:
+      mcs_finder = MockMCSFinder(EventDag(trace), mcs)
+      mcs_finder.max_replays_per_subsequence = 5
+      mcs_finder.replay_confidence = replay_confidence
+      try:
+        os.makedirs(mcs_results_path)
+        mcs_finder.init_results(mcs_results_path)
+        mcs_finder.simulate()
+      finally:
+        shutil.rmtree(mcs_results_path)
+      self.assertEqual(mcs, mcs_finder.dag.input_events)
+      replays[replay_confidence] = mcs_finder.replays
+    self.assertTrue(replays[0.5] < replays[None])
+
+  def test_assume_monotonic(self):
+    self.assume_monotonic(MockMCSFinder)
+
+  def test_assume_monotonic_efficient(self):
+    self.assume_monotonic(MockEfficientMCSFinder)
+
+  def test_assume_monotonic_parallel(self):
+    self.assume_monotonic(MockParallelMCSFinder)
+
+  def assume_monotonic(self, mcs_finder_type):
+    trace = [ MockInputEvent(fingerprint=("class",f)) for f in range(1,13) ]
+    trace.append(InvariantViolation(["violation"], persistent=True))
+    mcs = [trace[2], trace[9]]
+    replays = {}
+    for monotonic in [False, True]:
+      mcs_finder = mcs_finder_type(EventDag(trace), mcs)
+      if monotonic:
+        mcs_finder.monotonic_cache = MonotonicReplayCache([ e.label for e in trace[:12] ])
+      try:
+        os.makedirs(mcs_results_path)
+        mcs_finder.init_results(mcs_results_path)
+        mcs_finder.simulate()
+      finally:
+        shutil.rmtree(mcs_results_path)
+      self.assertEqual(mcs, mcs_finder.dag.input_events)
+      replays[monotonic] = mcs_finder.replays
+    # EfficientMCSFinder rarely replays a subset of what it replayed before
+    if mcs_finder_type != MockEfficientMCSFinder:
+      self.assertTrue(replays[True] < replays[False])
+      # Parallel replays may infer the outcome of a candidate that would have
+      # been cancelled
+      self.assertTrue(mcs_finder._runtime_stats.replays_saved_by_monotonicity >=
+                      replays[False] - replays[True])
+
+  def test_partitioner(self):
+    trace = [ MockInputEvent(fingerprint=("class",f)) for f in range(1,7) ]
+    trace.append(InvariantViolation(["violation"], persistent=True))
+    mcs = [trace[0],trace[5]]
+    mcs_finder = MockMCSFinder(EventDag(trace), mcs)
+    mcs_finder.partitioner = EventTypePartitioner()
+    try:
+      os.makedirs(mcs_results_path)
+      mcs_finder.init_results(mcs_results_path)
+      mcs_finder.simulate()
+    finally:
+      shutil.rmtree(mcs_results_path)
+    self.assertEqual(mcs, mcs_finder.dag.input_events)
+    # All inputs have the same type, so its group is split further by time
+    self.assertEqual(["event_type"],
+                     mcs_finder._runtime_stats.replays_per_partitioner.keys())
+
+  def test_replay_budget(self):
+    self.replay_budget(MockMCSFinder)
+
+  def test_replay_budget_efficient(self):
+    self.replay_budget(MockEfficientMCSFinder)
+
+  def test_replay_budget_parallel(self):
+    self.replay_budget(MockParallelMCSFinder)
+
+  def test_replay_budget_parallel_repeated(self):
+    self.replay_budget(MockParallelMCSFinder, replays_per_subsequence=3)
+
+  def replay_budget(self, mcs_finder_type, replays_per_subsequence=1):
+    trace = [ MockInputEvent(fingerprint=("class",f)) for f in range(1,13) ]
+    trace.append(InvariantViolation(["violation"], persistent=True))
+    mcs = [trace[2], trace[9]]
+    mcs_finder = mcs_finder_type(EventDag(trace), mcs)
+    max_replays = 8 * replays_per_subsequence
+    mcs_finder.max_replays = max_replays
+    mcs_finder.max_replays_per_subsequence = replays_per_subsequence
+    try:
+      os.makedirs(mcs_results_path)
+      mcs_finder.init_results(mcs_results_path)
+      mcs_finder.simulate()
+    finally:
+      shutil.rmtree(mcs_results_path)
+    stats = mcs_finder._runtime_stats
+    self.assertFalse(stats.one_minimal)
+    self.assertTrue(stats.budget_exhausted is not None)
+    # The reproducibility check is not part of the budget. The last subsequence
+    # we start may overshoot it
+    self.assertTrue(mcs_finder.replays <=
+                    replays_per_subsequence + max_replays +
+                    replays_per_subsequence - 1)
+    # Best so far: smaller than the trace, and still violating
+    inputs = mcs_finder.dag.input_events
+    self.assertTrue(len(inputs) < 12)
+    self.assertTrue(all(e in inputs for e in mcs))
+
+  def optimize_event_dag(self, mcs_finder_type, invariant_check=None):
+    trace = [ SwitchFailure(1, label="e1"),
+              TrafficInjection(label="e2", host_id=1),
+              LinkFailure(1, 1, 2, 1, label="e3"),
+              SwitchFailure(2, label="e4"),
+              InvariantViolation(["violation"], persistent=True) ]
+    mcs_finder = mcs_finder_type(EventDag(trace), [trace[1]])
+    if invariant_check is not None:
+      mcs_finder.invariant_check = invariant_check
+    mcs_finder._optimize_event_dag()
+    return (mcs_finder, [ e.label for e in mcs_finder.dag.input_events ])
+
+  def test_optimize_event_dag(self):
+    for mcs_finder_type in [MockMCSFinder, MockParallelMCSFinder]:
+      (mcs_finder, labels) = self.optimize_event_dag(mcs_finder_type)
+      self.assertEqual(["e2"], labels)
+      # One replay per event type, and one for pruning them all at once
+      self.assertEqual(4, mcs_finder.replays)
+
+  def test_optimize_event_dag_fallback(self):
+    # Violates with switch failures or link failures, but not without both
+    def invariant_check(new_dag):
+      types = set(type(e) for e in new_dag.input_events)
+      if SwitchFailure in types or LinkFailure in types:
+        return ["violation"]
+      return []
+    (mcs_finder, labels) = self.optimize_event_dag(MockParallelMCSFinder,
+                                                   invariant_check)
+    self.assertEqual(["e3"], labels)
+    # Three single types, the combination, then pruning switch failures and
+    # link failures after traffic injections
+    self.assertEqual(6, mcs_finder.replays)
+
+  def test_minimize_internal_events(self):
+    self.minimize_internal_events(MockMCSFinder)
+
+  def test_minimize_internal_events_parallel(self):
+    self.minimize_internal_events(MockParallelMCSFinder)
+
+  def minimize_internal_events(self, mcs_finder_type):
+    trace = []
+    for f in range(1, 5):
+      trace.append(MockInputEvent(fingerprint=("class",f)))
+      trace.append(MockInternalEvent(("lldp",)))
+      trace.append(MockInternalEvent(("echo",)))
+      trace.append(MockInternalEvent(("state_change",f)))
+    trace.append(InvariantViolation(["violation"], persistent=True))
+    mcs = [trace[4]]
+    mcs_finder = mcs_finder_type(EventDag(trace), mcs)
+    mcs_finder.minimize_internal_events = True
+    # The violation needs the lldp events as well as the mcs
+    def invariant_check(new_dag):
+      if ("lldp",) not in [ e.fingerprint for e in new_dag.events ]:
+        return []
+      return mcs_finder._invariant_check(new_dag)
+    mcs_finder.invariant_check = invariant_check
+    try:
+      os.makedirs(mcs_results_path)
+      mcs_finder.init_results(mcs_results_path)
+      mcs_finder.simulate()
+      internal_events = {}
+      for extension in ["", ".notimeouts"]:
+        with open(os.path.join(mcs_results_path, "mcs.trace" + extension)) as f:
+          internal_events[extension] = len([ l for l in f
+                                             if "MockInternalEvent" in l ])
+    finally:
+      shutil.rmtree(mcs_results_path)
+    self.assertEqual(mcs, mcs_finder.dag.input_events)
+    self.assertEqual(12, internal_events[""])
+    self.assertEqual(4, internal_events[".notimeouts"])
+    stats = mcs_finder._runtime_stats
+    self.assertEqual(12, stats.internal_events_before_minimization)
+    self.assertEqual(4, stats.internal_events_after_minimization)
+    self.assertEqual(5, len(stats.pruned_internal_event_classes))
+
+  def test_replays_needed(self):
+    trace = [ MockInputEvent(fingerprint=("class",1)),
+              InvariantViolation(["violation"], persistent=True) ]
+    mcs_finder = MockMCSFinder(EventDag(trace), trace[0:1])
+    mcs_finder.max_replays_per_subsequence = 10
+    mcs_finder.replay_confidence = 0.8
+    # No violations observed yet
+    self.assertEqual(10, mcs_finder._replays_needed())
+    mcs_finder._runtime_stats.violation_found_in_run = Counter({0: 9})
+    self.assertEqual(1, mcs_finder._replays_needed())
+    mcs_finder._runtime_stats.violation_found_in_run = Counter({0: 9, 2: 10})
+    self.assertEqual(3, mcs_finder._replays_needed())
+
+  def test_replays_needed_late_violations(self):
+    trace = [ MockInputEvent(fingerprint=("class",1)),
+              InvariantViolation(["violation"], persistent=True) ]
+    bounds = {}
+    for full_replay_interval in [None, 3]:
+      mcs_finder = MockMCSFinder(EventDag(trace), trace[0:1])
+      mcs_finder.max_replays_per_subsequence = 10
+      mcs_finder.replay_confidence = 0.8
+      mcs_finder.full_replay_interval = full_replay_interval
+      # Early luck: the violation showed up on the first replay so far
+      mcs_finder._runtime_stats.violation_found_in_run = Counter({0: 9})
+      self.assertEqual(1, mcs_finder._replays_needed())
+      # But it actually only shows up on every fourth replay
+      mcs_finder.invariant_check = lambda _, f=mcs_finder: \
+        ["violation"] if f.replays % 4 == 0 else []
+      for _ in range(30):
+        mcs_finder.replay_max_iterations(mcs_finder.dag, "flaky")
+      bounds[full_replay_interval] = mcs_finder._replays_needed()
+    # Replays cut short at one iteration never see a late violation
+    self.assertEqual(1, bounds[None])
+    self.assertTrue(bounds[3] > 1)
+
+  def test_replay_cache_hits_not_recorded(self):
+    trace = [ MockInputEvent(fingerprint=("class",f)) for f in range(1,3) ]
+    trace.append(InvariantViolation(["violation"], persistent=True))
+    mcs_finder = MockMCSFinder(EventDag(trace), trace[0:1])
+    cache_path = "/tmp/replay_cache_test.json"
+    if os.path.exists(cache_path):
+      os.remove(cache_path)
+    mcs_finder.replay_cache = PersistentReplayCache(cache_path, ["test"])
+    try:
+      subset = mcs_finder.dag.input_subset(trace[0:1])
+      # Found on the third replay of an earlier run
+      mcs_finder.replay_cache.update([ e.label for e in subset.input_events ],
+                                     True, 3, [])
+      self.assertTrue(mcs_finder._check_violation(subset, 0, "subset"))
+      self.assertEqual(0, mcs_finder.replays)
+      self.assertEqual(Counter(),
+                       mcs_finder._runtime_stats.violation_found_in_run)
+      # Replayed in this process
+      complement = mcs_finder.dag.input_subset(trace[1:2])
+      self.assertFalse(mcs_finder._check_violation(complement, 1, "complement"))
+      self.assertTrue(mcs_finder._check_violation(mcs_finder.dag, 2, "all"))
+      self.assertEqual(Counter({0: 1}),
+                       mcs_finder._runtime_stats.violation_found_in_run)
+    finally:
+      mcs_finder.replay_cache.close()
+      os.remove(cache_path)
+
+  def test_plan_prefix_snapshots(self):
+    trace = [ MockInputEvent(fingerprint=("class",f)) for f in range(1,7) ]
+    trace.append(InvariantViolation(["violation"], persistent=True))
+    mcs_finder = MockMCSFinder(EventDag(trace), trace[0:1])
+    mcs_finder._prefix_snapshots = PrefixSnapshotCache(2)
+    mcs_finder._set_snapshot_boundaries([trace[2].label, trace[4].label])
+    dag = mcs_finder.dag
+    # Nothing cached yet: suspend before both boundaries
+    self.assertEqual(None, mcs_finder._plan_prefix_snapshots(dag))
+    self.assertEqual([2, 4], mcs_finder._snapshot_indices)
+    snapshot = PrefixSnapshot("/tmp/prefix_snapshot", 1)
+    mcs_finder._prefix_snapshots.insert([ e.label for e in trace[:2] ], snapshot)
+    # Doesn't share the cached prefix. Never suspend before the first event
+    complement = dag.input_complement(trace[:2])
+    self.assertEqual(None, mcs_finder._plan_prefix_snapshots(complement))
+    self.assertEqual([2], mcs_finder._snapshot_indices)
+    # Continues from the cached prefix, which is just before trace[4]
+    subset = dag.input_subset(trace[0:2] + trace[4:6])
+    self.assertEqual((2, snapshot), mcs_finder._plan_prefix_snapshots(subset))
+    self.assertEqual([], mcs_finder._snapshot_indices)
+
+  def test_resume(self):
+    self.resume(MockMCSFinder)
+
+  def test_resume_efficient(self):
+    self.resume(MockEfficientMCSFinder)
+
+  def test_resume_parallel(self):
+    self.resume(MockParallelMCSFinder)
+
+  def test_resume_budget_exhausted(self):
+    # Crash once delta debugging has recursed into a violating subsequence
+    for mcs_finder_type, crash_after in [(MockMCSFinder, 10),
+                                         (MockEfficientMCSFinder, 4)]:
+      trace = [ MockInputEvent(fingerprint=("class",f)) for f in range(1,9) ]
+      trace.append(InvariantViolation(["violation"], persistent=True))
+      mcs = [trace[1],trace[6]]
+      crashed = mcs_finder_type(EventDag(trace), mcs)
+      crashed.crash_after = crash_after
+      try:
+        os.makedirs(mcs_results_path)
+        crashed.init_results(mcs_results_path)
+        self.assertRaises(MockCrash, crashed.simulate)
+        resumed = mcs_finder_type(EventDag(trace), mcs)
+        resumed.resume = True
+        resumed.max_replays = 0
+        resumed.init_results(mcs_results_path)
+        checkpointed = resumed._checkpointed_dag(resumed._load_checkpoint()["frames"])
+        resumed.simulate()
+      finally:
+        shutil.rmtree(mcs_results_path)
+      self.assertEqual(0, resumed.replays)
+      # The checkpointed run had already pruned some inputs
+      self.assertTrue(len(checkpointed.input_events) < 8)
+      self.assertEqual(checkpointed.input_events, resumed.dag.input_events)
+      self.assertTrue(all(e in resumed.dag.input_events for e in mcs))
+      iteration_size = resumed._runtime_stats.iteration_size
+      self.assertEqual(len(checkpointed.input_events),
+                       iteration_size[max(iteration_size.keys())])
+
+  def test_resume_optimized(self):
+    self.resume(MockMCSFinder, optimized_filtering=True)
+
+  def resume(self, mcs_finder_type, optimized_filtering=False):
+    trace = [ MockInputEvent(fingerprint=("class",f)) for f in range(1,9) ]
+    mcs = [trace[1],trace[6]]
+    if optimized_filtering:
+      # Pruned by _optimize_event_dag before delta debugging starts
+      trace += [ TrafficInjection(label="t%d" % i, host_id=1) for i in range(3) ]
+    trace.append(InvariantViolation(["violation"], persistent=True))
+    def mcs_finder_factory():
+      mcs_finder = mcs_finder_type(EventDag(trace), mcs)
+      mcs_finder.optimized_filtering = optimized_filtering
+      return mcs_finder
+    uninterrupted = mcs_finder_factory()
+    try:
+      os.makedirs(mcs_results_path)
+      uninterrupted.init_results(mcs_results_path)
+      uninterrupted.simulate()
+    finally:
+      shutil.rmtree(mcs_results_path)
+
+    # Crash at every point in the run, and check that we always end up with
+    # the same MCS, without re-checking reproducibility
+    for crash_after in range(2, uninterrupted.replays):
+      crashed = mcs_finder_factory()
+      crashed.crash_after = crash_after
+      try:
+        os.makedirs(mcs_results_path)
+        crashed.init_results(mcs_results_path)
+        self.assertRaises(MockCrash, crashed.simulate)
+        resumed = mcs_finder_factory()
+        resumed.resume = True
+        resumed.init_results(mcs_results_path)
+        resumed.simulate()
+      finally:
+        shutil.rmtree(mcs_results_path)
+      self.assertEqual(mcs, resumed.dag.input_events)
+      self.assertTrue(resumed.replays < uninterrupted.replays)
+      iteration_size = resumed._runtime_stats.iteration_size
+      self.assertEqual(len(mcs), iteration_size[max(iteration_size.keys())])
+
 if __name__ == '__main__':
   unittest.main()
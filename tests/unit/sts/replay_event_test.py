@@ -0,0 +1,125 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os
+import json
+import cPickle
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from sts.replay_event import *
+
+class LabelRegistryTest(unittest.TestCase):
+  def test_allocates_past_registered(self):
+    registry = LabelRegistry()
+    self.assertEqual(1, registry.allocate())
+    registry.register(10)
+    registry.register(5)
+    self.assertEqual(11, registry.allocate())
+    self.assertEqual(12, registry.allocate())
+
+class EventTest(unittest.TestCase):
+  def setUp(self):
+    self.old_registry = Event.label_registry
+    Event.label_registry = LabelRegistry()
+
+  def tearDown(self):
+    Event.label_registry = self.old_registry
+
+  def test_labels(self):
+    parsed = LinkFailure(1, 1, 2, 1, label=u"e7")
+    self.assertEqual("e7", parsed.label)
+    self.assertEqual(7, parsed.label_id)
+    internal = ControllerStateChange("c1", "fingerprint", "name", [])
+    self.assertEqual("i8", internal.label)
+    self.assertEqual(8, internal.label_id)
+
+  def test_no_instance_dict(self):
+    events = [LinkFailure(1, 1, 2, 1), WaitTime(0.5),
+              ControllerStateChange("c1", "fingerprint", "name", []),
+              DataplanePermit(("DataplanePermit", {}, 1, 1)),
+              InvariantViolation(["violation"])]
+    for event in events:
+      self.assertFalse(hasattr(event, "__dict__"), type(event).__name__)
+
+  def test_json_fields(self):
+    event = LinkFailure(1, 2, 3, 4, round=5)
+    event.replay_time = [1, 2]
+    fields = json.loads(event.to_json())
+    self.assertEqual(set(["class", "fingerprint", "label", "round", "time",
+                          "dependent_labels", "prunable", "timed_out",
+                          "replay_time", "start_dpid", "start_port_no",
+                          "end_dpid", "end_port_no"]), set(fields.keys()))
+    copy = LinkFailure.from_json(fields)
+    self.assertEqual(event, copy)
+    self.assertEqual(hash(event), hash(copy))
+    self.assertEqual(event.fingerprint, copy.fingerprint)
+
+  def test_pickle(self):
+    event = WaitTime(0.5, round=3)
+    copy = cPickle.loads(cPickle.dumps(event, cPickle.HIGHEST_PROTOCOL))
+    self.assertEqual(event, copy)
+    self.assertEqual(3, copy.round)
+    self.assertEqual(event.to_json(), copy.to_json())
+
+class SerializationTest(unittest.TestCase):
+  def test_field_order(self):
+    event = LinkFailure(1, 2, 3, 4, label="e3", round=5, time=SyncTime(10, 20))
+    self.assertEqual('{"class": "LinkFailure", "label": "e3", "time": [10, 20], '
+                     '"round": 5, "dependent_labels": [], "prunable": true, '
+                     '"timed_out": false, "fingerprint": ["LinkFailure", 1, 2, 3, 4], '
+                     '"start_dpid": 1, "start_port_no": 2, "end_dpid": 3, '
+                     '"end_port_no": 4}', event.to_json())
+
+  def test_same_fields_as_before(self):
+    # The fields (if not their order) of the reflection-based serializer
+    event = DataplanePermit(("DataplanePermit", DPFingerprint({"dl_src": "a"}), 1, 2),
+                            label="i4", round=2, time=SyncTime(10, 20))
+    self.assertEqual({"class": "DataplanePermit", "label": "i4",
+                      "time": [10, 20], "round": 2, "dependent_labels": [],
+                      "prunable": True, "timed_out": False,
+                      "timeout_disallowed": False, "passive": True,
+                      "fingerprint": ["DataplanePermit", {"dl_src": "a"}, 1, 2]},
+                     json.loads(event.to_json()))
+    event = ControllerStateChange("c1", "fingerprint", "name", [1],
+                                  label="i5", time=SyncTime(10, 20))
+    event.new_internal_event = True
+    event.replay_time = SyncTime(11, 0)
+    self.assertEqual({"class": "ControllerStateChange", "label": "i5",
+                      "time": [10, 20], "round": -1, "dependent_labels": [],
+                      "prunable": True, "timed_out": False,
+                      "timeout_disallowed": False, "new_internal_event": True,
+                      "replay_time": [11, 0], "controller_id": "c1",
+                      "name": "name", "value": [1],
+                      "fingerprint": ["ControllerStateChange", "fingerprint", "c1"]},
+                     json.loads(event.to_json()))
+
+  def test_round_trip(self):
+    events = [LinkFailure(1, 2, 3, 4, round=5), WaitTime(0.5),
+              SwitchRecovery(3), HostMigration(1, 2, 3, 4, 5),
+              DeterministicValue("c1", "random", [1, 2]),
+              DataplaneDrop(("DataplaneDrop", DPFingerprint({"dl_src": "a"}), 1, 2)),
+              InvariantViolation(["violation"], persistent=True)]
+    for event in events:
+      line = event.to_json()
+      parsed = type(event).from_json(json.loads(line))
+      self.assertEqual(event, parsed)
+      self.assertEqual(line, parsed.to_json())
+
+  def test_missing_field(self):
+    self.assertRaises(ValueError, WaitTime.from_json,
+                      {"class": "WaitTime", "label": "e1", "time": [1, 2],
+                       "round": -1})
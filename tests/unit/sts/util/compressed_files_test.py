@@ -0,0 +1,60 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os
+import gzip
+import pickle
+import shutil
+import tempfile
+
+sys.path.append(os.path.dirname(__file__) + "/../../../..")
+
+from sts.util.compressed_files import *
+
+class CompressedFilesTest(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def test_suffixes(self):
+    self.assertEqual(("mcs.trace.notimeouts", ".gz"),
+                     split_compression_suffix("mcs.trace.notimeouts.gz"))
+    self.assertEqual(("events.trace", ""),
+                     split_compression_suffix("events.trace"))
+    self.assertTrue(is_compressed_path("events.trace.bz2"))
+    self.assertFalse(is_compressed_path("events.trace"))
+
+  def test_round_trip(self):
+    lines = [ '{"class": "WaitTime", "label": "e%d"}\n' % i for i in range(100) ]
+    for suffix in [""] + COMPRESSION_SUFFIXES:
+      path = os.path.join(self.tmpdir, "events.trace" + suffix)
+      with open_compressed(path, 'w') as output:
+        for line in lines:
+          output.write(line)
+      with open_compressed(path) as input_file:
+        self.assertEqual(lines, list(input_file))
+      if suffix != "":
+        self.assertTrue(os.path.getsize(path) < len("".join(lines)))
+
+  def test_gzip_compatible(self):
+    path = os.path.join(self.tmpdir, "dataplane.trace.gz")
+    with open_compressed(path, 'wb') as output:
+      pickle.dump([1, 2, 3], output)
+    self.assertEqual([1, 2, 3], pickle.load(gzip.open(path)))
+    with open_compressed(path, 'rb') as input_file:
+      self.assertEqual([1, 2, 3], pickle.load(input_file))
@@ -16,6 +16,9 @@
 import unittest
 import sys
 import os.path
+import shutil
+import tempfile
+import itertools
 
 sys.path.append(os.path.dirname(__file__) + "/../../..")
 
@@ -56,3 +59,67 @@ class precompute_cache_test(unittest.TestCase):
     self.assertTrue(p.already_done( (4,)))
     self.assertFalse(p.already_done( (1,2,3,4)))
 
+  def test_persistent(self):
+    tmpdir = tempfile.mkdtemp()
+    try:
+      path = os.path.join(tmpdir, "replay_cache.json")
+      p = PersistentReplayCache(path, ["trace", "check", "signature"])
+      self.assertEqual(None, p.lookup(["e1", "e2"]))
+      p.update(["e1", "e2"], True, 1, ["i3"])
+      p.update(["e2"], False, 2, [])
+      p.close()
+      # Simulate a crash halfway through writing an entry
+      with open(path, "a") as cache_file:
+        cache_file.write('{"digest": "abc')
+
+      p = PersistentReplayCache(path, ["trace", "check", "signature"])
+      self.assertEqual(ReplayOutcome(True, 1, ["i3"]), p.lookup(["e1", "e2"]))
+      self.assertEqual(ReplayOutcome(False, 2, []), p.lookup(["e2"]))
+      # Order matters
+      self.assertEqual(None, p.lookup(["e2", "e1"]))
+      p.update(["e2"], True, 4, [])
+      p.close()
+
+      p = PersistentReplayCache(path, ["trace", "check", "signature"])
+      self.assertEqual(ReplayOutcome(True, 4, []), p.lookup(["e2"]))
+      p.close()
+
+      # Different configs don't share outcomes
+      p = PersistentReplayCache(path, ["trace", "check", "other signature"])
+      self.assertEqual(None, p.lookup(["e1", "e2"]))
+      p.close()
+    finally:
+      shutil.rmtree(tmpdir)
+
+  def test_monotonic(self):
+    p = MonotonicReplayCache(["e1", "e2", "e3", "e4"])
+    self.assertEqual(None, p.infer(["e1", "e2"]))
+    p.update(["e1", "e2", "e3"], False)
+    self.assertTrue(p.superset_not_reproducing(["e1", "e3"]))
+    self.assertEqual(False, p.infer(["e1", "e3"]))
+    self.assertEqual(False, p.infer(["e1", "e2", "e3"]))
+    self.assertEqual(None, p.infer(["e1", "e4"]))
+    p.update(["e2", "e4"], True)
+    self.assertTrue(p.subset_reproducing(["e1", "e2", "e4"]))
+    self.assertEqual(True, p.infer(["e1", "e2", "e4"]))
+    self.assertEqual(None, p.infer(["e1", "e4"]))
+    self.assertEqual(None, p.infer(["e4"]))
+    # Inputs from outside the trace tell us nothing
+    self.assertEqual(None, p.infer(["e2", "e4", "e5"]))
+    p.update(["e5"], True)
+    self.assertEqual(2, len(p))
+
+  def test_monotonic_subsets(self):
+    labels = [ "e%d" % i for i in range(6) ]
+    p = MonotonicReplayCache(labels)
+    reproducing = [ ["e1", "e3"], ["e0", "e2", "e4"], ["e3", "e3", "e5"] ]
+    for subsequence in reproducing:
+      p.update(subsequence, True)
+    p.update(["e1", "e2"], False)
+    for size in range(len(labels) + 1):
+      for candidate in itertools.combinations(labels, size):
+        expected = any(set(r) <= set(candidate) for r in reproducing)
+        self.assertEqual(expected, p.subset_reproducing(candidate))
+    # The empty subsequence is a subset of every subsequence
+    p.update([], True)
+    self.assertTrue(p.subset_reproducing(["e0"]))
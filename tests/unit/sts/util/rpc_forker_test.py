@@ -0,0 +1,273 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os
+import time
+import shutil
+import tempfile
+import subprocess
+import signal
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from sts.util.rpc_forker import *
+from sts.util.convenience import find_port
+
+worker_path = os.path.join(os.path.dirname(__file__),
+                           "../../../../tools/rpc_worker.py")
+
+def pid_task(x):
+  return (os.getpid(), x)
+
+def failing_task():
+  raise ValueError("boom")
+
+def exiting_task():
+  sys.exit(3)
+
+def sleep_task(index, seconds):
+  time.sleep(seconds)
+  return index
+
+def subprocess_task(index, seconds, pid_path):
+  # Like a controller, the subprocess runs in its own session, so killing
+  # our process group would not reach it
+  child = subprocess.Popen(["sleep", "60"], preexec_fn=os.setsid)
+  try:
+    with open(pid_path, "w") as pid_file:
+      pid_file.write(str(child.pid))
+    time.sleep(seconds)
+    return index
+  finally:
+    child.kill()
+    child.wait()
+
+def process_exists(pid):
+  try:
+    os.kill(pid, 0)
+  except OSError:
+    return False
+  return True
+
+def check_cancel_cleans_up(test, forker, tmp_dir):
+  forker.register_task("subprocess", subprocess_task)
+  pid_paths = [ os.path.join(tmp_dir, "pid%d" % i) for i in xrange(2) ]
+  # Invocation 1 is still running when invocation 0 succeeds
+  args_list = [(0, 2.0, pid_paths[0]), (1, 30.0, pid_paths[1])]
+  start = time.time()
+  results = forker.fork_many("subprocess", args_list, max_parallel=2,
+                             stop_on=lambda index: index == 0)
+  test.assertEqual([0, None], results)
+  test.assertTrue(time.time() - start < 20.0)
+  with open(pid_paths[1]) as pid_file:
+    straggler_subprocess = int(pid_file.read())
+  try:
+    test.assertFalse(process_exists(straggler_subprocess))
+  finally:
+    if process_exists(straggler_subprocess):
+      os.kill(straggler_subprocess, signal.SIGKILL)
+
+class local_forker_test(unittest.TestCase):
+  def setUp(self):
+    self.forker = LocalForker()
+    self.tmp_dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp_dir)
+
+  def test_cancel_cleans_up(self):
+    check_cancel_cleans_up(self, self.forker, self.tmp_dir)
+
+class prefork_forker_test(unittest.TestCase):
+  def setUp(self):
+    self.forker = PreforkForker(num_workers=2, max_tasks_per_worker=3)
+    self.forker.register_task("pid", pid_task)
+
+  def tearDown(self):
+    self.forker.shutdown()
+
+  def test_reuse(self):
+    (pid, x) = self.forker.fork("pid", {"a" : [1L << 100]})
+    self.assertNotEqual(os.getpid(), pid)
+    self.assertEqual({"a" : [1L << 100]}, x)
+    self.assertEqual(pid, self.forker.fork("pid", 1)[0])
+
+  def test_recycle(self):
+    pids = [ self.forker.fork("pid", i)[0] for i in xrange(4) ]
+    self.assertEqual(1, len(set(pids[:3])))
+    self.assertNotEqual(pids[0], pids[3])
+
+  def test_register_retires_workers(self):
+    (pid, _) = self.forker.fork("pid", 1)
+    self.forker.register_task("fail", failing_task)
+    self.assertNotEqual(pid, self.forker.fork("pid", 1)[0])
+    self.assertRaises(ReplayException, self.forker.fork, "fail")
+    # The worker survives exceptions in the task
+    self.forker.fork("pid", 1)
+
+  def test_task_exits(self):
+    self.forker.register_task("exit", exiting_task)
+    (pid, _) = self.forker.fork("pid", 1)
+    try:
+      self.forker.fork("exit")
+      self.fail("ReplayException not raised")
+    except ReplayException as e:
+      self.assertTrue("SystemExit" in str(e))
+    # The worker survives the task exiting
+    self.assertEqual(pid, self.forker.fork("pid", 1)[0])
+
+  def test_cancel_cleans_up(self):
+    tmp_dir = tempfile.mkdtemp()
+    try:
+      check_cancel_cleans_up(self, self.forker, tmp_dir)
+    finally:
+      shutil.rmtree(tmp_dir)
+
+  def test_fork_many(self):
+    self.forker.register_task("sleep", sleep_task)
+    args_list = [ (i, 0.01) for i in xrange(5) ]
+    self.assertEqual(range(5), self.forker.fork_many("sleep", args_list,
+                                                     max_parallel=4))
+
+  def test_fork_many_stop_on(self):
+    self.forker.shutdown()
+    self.forker = PreforkForker(num_workers=4)
+    self.forker.register_task("sleep", sleep_task)
+    # Invocation 2 finishes before 0 and 1, but they are still run to
+    # completion; 3 is killed, and 4 never starts
+    args_list = [(0, 0.5), (1, 0.5), (2, 0.0), (3, 5.0), (4, 0.0)]
+    start = time.time()
+    results = self.forker.fork_many("sleep", args_list, max_parallel=4,
+                                    stop_on=lambda index: index >= 1)
+    self.assertEqual([0, 1, None, None, None], results)
+    self.assertTrue(time.time() - start < 4.0)
+
+# Remote tasks do their own imports, in case workers can't import this module
+
+def remote_pids_task(x):
+  import os
+  # The worker is our parent
+  return (os.getppid(), x)
+
+def remote_kill_worker_once_task(marker_path):
+  import os
+  import signal
+  import time
+  if not os.path.exists(marker_path):
+    open(marker_path, "w").close()
+    os.kill(os.getppid(), signal.SIGKILL)
+    time.sleep(10)
+  return os.getppid()
+
+def remote_subprocess_task(index, seconds, pid_path):
+  import os
+  import subprocess
+  import time
+  child = subprocess.Popen(["sleep", "60"], preexec_fn=os.setsid)
+  try:
+    with open(pid_path, "w") as pid_file:
+      pid_file.write(str(child.pid))
+    time.sleep(seconds)
+    return index
+  finally:
+    child.kill()
+    child.wait()
+
+class remote_forker_test(unittest.TestCase):
+  def setUp(self):
+    self.workers = []
+    server_info_list = []
+    for i in xrange(2):
+      port = find_port(xrange(4000 + 100 * i, 4100 + 100 * i))
+      self.workers.append(subprocess.Popen([sys.executable, worker_path,
+                                            "-p", str(port), "-m", "2"],
+                                           stdout=open(os.devnull, "w")))
+      server_info_list.append(("localhost", port))
+    self.forker = RemoteForker(server_info_list, dispatch="round_robin",
+                               health_check_timeout=1.0,
+                               health_check_interval=1.0)
+    deadline = time.time() + 20
+    while self.forker.check_health() < 2:
+      self.assertTrue(time.time() < deadline, "workers did not start")
+      time.sleep(0.1)
+    self.forker.register_task("pids", remote_pids_task)
+    self.tmp_dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    for worker in self.workers:
+      if worker.poll() is None:
+        worker.terminate()
+      worker.wait()
+    shutil.rmtree(self.tmp_dir)
+
+  def test_fork(self):
+    (pid, x) = self.forker.fork("pids", [1L << 100])
+    self.assertTrue(pid in [ w.pid for w in self.workers ])
+    self.assertEqual([1L << 100], x)
+
+  def test_fork_many(self):
+    results = self.forker.fork_many("pids", [ (i,) for i in xrange(8) ])
+    self.assertEqual(range(8), [ x for (_, x) in results ])
+    self.assertEqual(set(w.pid for w in self.workers),
+                     set(pid for (pid, _) in results))
+
+  def test_fork_many_stop_on(self):
+    results = self.forker.fork_many("pids", [ (i,) for i in xrange(8) ],
+                                    max_parallel=1,
+                                    stop_on=lambda (_, x): x == 2)
+    self.assertEqual([0, 1, 2], [ x for (_, x) in results[:3] ])
+    self.assertEqual([None] * 5, results[3:])
+
+  def test_cancel_cleans_up(self):
+    self.forker.register_task("subprocess", remote_subprocess_task)
+    pid_paths = [ os.path.join(self.tmp_dir, "pid%d" % i) for i in xrange(2) ]
+    # Invocation 1 is still running when invocation 0 succeeds
+    args_list = [(0, 2.0, pid_paths[0]), (1, 30.0, pid_paths[1])]
+    results = self.forker.fork_many("subprocess", args_list, max_parallel=2,
+                                    stop_on=lambda index: index == 0)
+    self.assertEqual([0, None], results)
+    with open(pid_paths[1]) as pid_file:
+      straggler_subprocess = int(pid_file.read())
+    try:
+      # The worker cleans up after the cancelled task asynchronously
+      deadline = time.time() + 10
+      while process_exists(straggler_subprocess) and time.time() < deadline:
+        time.sleep(0.1)
+      self.assertFalse(process_exists(straggler_subprocess))
+    finally:
+      if process_exists(straggler_subprocess):
+        os.kill(straggler_subprocess, signal.SIGKILL)
+
+  def test_lost_worker(self):
+    self.forker.register_task("kill_once", remote_kill_worker_once_task)
+    marker_path = os.path.join(self.tmp_dir, "killed")
+    pid = self.forker.fork("kill_once", marker_path)
+    self.assertTrue(os.path.exists(marker_path))
+    survivors = [ w.pid for w in self.workers if w.poll() is None ]
+    self.assertEqual([pid], survivors)
+
+  def test_exception(self):
+    self.forker.register_task("fail", failing_task)
+    self.assertRaises(ReplayException, self.forker.fork, "fail")
+
+  def test_closure(self):
+    x = 1
+    def closure():
+      return x
+    self.assertRaises(ValueError, self.forker.register_task, "closure", closure)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,57 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os
+import json
+
+sys.path.append(os.path.dirname(__file__) + "/../../../..")
+
+from sts.util.schema import *
+
+class Point(object):
+  def __init__(self, x, y, z=0):
+    self.x = x
+    self.y = y
+    self.z = z
+
+fields = merge_fields([Field('x'), Field('y', encode=str, decode=int),
+                       Field('note', optional=True, decoded=False)],
+                      [Field('z', default=0), Field('x', decode=float)])
+
+class SchemaTest(unittest.TestCase):
+  def test_merge(self):
+    self.assertEqual(['x', 'y', 'note', 'z'], [ f.name for f in fields ])
+    self.assertEqual(float, fields[0].decode)
+
+  def test_encode(self):
+    encode = make_encoder("Point", fields)
+    point = Point(1, 2)
+    self.assertEqual('{"class": "Point", "x": 1, "y": "2", "z": 0}',
+                     encode(point))
+    point.note = u"n\xe9"
+    encoded = encode(point)
+    self.assertEqual('{"class": "Point", "x": 1, "y": "2", "note": "n\\u00e9", "z": 0}',
+                     encoded)
+    self.assertEqual(json.loads(json.dumps({"class": "Point", "x": 1, "y": "2",
+                                            "note": u"n\xe9", "z": 0})),
+                     json.loads(encoded))
+
+  def test_decode(self):
+    decode = make_decoder(Point, fields)
+    point = decode({"class": "Point", "x": 1, "y": "2", "note": "ignored"})
+    self.assertEqual((1.0, 2, 0), (point.x, point.y, point.z))
+    self.assertFalse(hasattr(point, "note"))
+    self.assertRaises(ValueError, decode, {"class": "Point", "x": 1})
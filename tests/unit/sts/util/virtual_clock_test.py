@@ -0,0 +1,61 @@
+# Copyright 2011-2013 Colin Scott
+# Copyright 2011-2013 Andreas Wundsam
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os.path
+import time
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from sts.util.virtual_clock import VirtualClock
+from sts.util.io_master import IOMaster
+from sts.syncproto.base import SyncTime
+
+class VirtualClockTest(unittest.TestCase):
+  def test_advance(self):
+    clock = VirtualClock(start_time=100.0)
+    clock.advance_to(160.5)
+    self.assertEqual(160.5, clock.time())
+    # Never moves backwards
+    clock.advance_to(10.0)
+    self.assertEqual(160.5, clock.time())
+    clock.sleep(1200)
+    self.assertEqual(1360.5, clock.time())
+
+  def test_install(self):
+    real_time = time.time
+    clock = VirtualClock(start_time=100.0)
+    clock.install()
+    try:
+      self.assertEqual(100.0, time.time())
+      self.assertEqual(100.0, SyncTime.now().as_float())
+      clock.advance_to(200.0)
+      self.assertEqual(200.0, SyncTime.now().as_float())
+    finally:
+      clock.uninstall()
+    self.assertTrue(time.time is real_time)
+
+  def test_io_master_sleep(self):
+    io_master = IOMaster()
+    clock = VirtualClock(start_time=100.0)
+    io_master.set_virtual_clock(clock)
+    try:
+      start = clock.real_time()
+      io_master.sleep(20 * 60)
+      self.assertTrue(clock.real_time() - start < 60)
+      self.assertEqual(100.0 + 20 * 60, clock.time())
+    finally:
+      io_master.close_all()
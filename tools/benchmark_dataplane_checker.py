@@ -0,0 +1,132 @@
+#!/usr/bin/env python2.7
+#
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# note: must be invoked from the top-level sts directory
+
+import argparse
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from sts.replay_event import *
+from sts.event_dag import EventDag
+from sts.control_flow.replayer import DataplaneChecker
+from sts.util.convenience import find, find_index
+
+description = """
+Time how long DataplaneChecker takes to replay a synthetic trace of dataplane
+events, one round per event, where every expected dp_event shows up on time.
+Optionally compare against the previous implementation, which rescanned the
+whole trace for every event (and is quadratic, so keep its traces short).
+Example usage:
+
+$ %s -n 50000 --compare 2000 5000 10000
+""" % (sys.argv[0])
+
+class RescanningDataplaneChecker(DataplaneChecker):
+  ''' The previous implementation of DataplaneChecker's window, for
+  comparison '''
+  def __init__(self, event_dag, slop_buffer=10):
+    DataplaneChecker.__init__(self, event_dag, slop_buffer=slop_buffer)
+    self.current_dp_fingerprints = []
+    self.fingerprint_2_event_idx = {}
+
+  def decide_drop_fingerprint(self, dp_fingerprint):
+    event_fingerprint = find(lambda f: f[1:] == dp_fingerprint,
+                             self.current_dp_fingerprints)
+    if event_fingerprint is None:
+      return False
+    self.current_dp_fingerprints.remove(event_fingerprint)
+    event_idx = self.fingerprint_2_event_idx[event_fingerprint].pop()
+    self.events.pop(event_idx)
+    if event_fingerprint[0] == "DataplanePermit":
+      return False
+    self.stats.record_drop(event_fingerprint)
+    return True
+
+  def update_window(self, current_round):
+    self.current_dp_fingerprints = []
+    self.fingerprint_2_event_idx = defaultdict(list)
+    head_idx = find_index(lambda e: e.round == current_round - self.slop_buffer,
+                          self.events)
+    head_idx = max(head_idx, 0)
+    tail_idx = find_index(lambda e: e.round == current_round + self.slop_buffer,
+                          self.events)
+    if tail_idx is None:
+      tail_idx = len(self.events)
+    for i in xrange(head_idx, tail_idx):
+      if type(self.events[i]) in dp_events:
+        fingerprint = self.events[i].fingerprint
+        self.current_dp_fingerprints.append(fingerprint)
+        self.fingerprint_2_event_idx[fingerprint].append(i)
+
+def generate_trace(num_events, num_flows, drop_rate):
+  random.seed(0)
+  fingerprints = [ DPFingerprint({'dl_src': "00:00:00:00:00:%02x" % (i % 256),
+                                  'dl_dst': "00:00:00:00:01:%02x" % (i % 256),
+                                  'nw_src': "10.0.%d.1" % (i % 256),
+                                  'nw_dst': "10.1.%d.1" % (i % 256)})
+                   for i in xrange(num_flows) ]
+  events = []
+  for i in xrange(num_events):
+    fingerprint = (random.choice(fingerprints), i % 16 + 1, 1)
+    event_type = DataplaneDrop if random.random() < drop_rate else DataplanePermit
+    events.append(event_type(fingerprint, round=i))
+  return events
+
+def replay(checker_type, events):
+  ''' Return (seconds taken, number of drops) '''
+  checker = checker_type(EventDag(events))
+  drops = 0
+  start = time.time()
+  for i, event in enumerate(events):
+    checker.update_window(i)
+    if checker.decide_drop_fingerprint(event.fingerprint[1:]):
+      drops += 1
+  return (time.time() - start, drops)
+
+def main(args):
+  sizes = sorted(set(args.compare + [args.num_events]))
+  print "%10s %14s %14s %8s" % ("events", "indexed (s)", "rescanning (s)", "drops")
+  for size in sizes:
+    events = generate_trace(size, args.num_flows, args.drop_rate)
+    (seconds, drops) = replay(DataplaneChecker, events)
+    rescanning = "-"
+    if size in args.compare:
+      (rescanning_seconds, rescanning_drops) = replay(RescanningDataplaneChecker,
+                                                      events)
+      rescanning = "%.3f" % rescanning_seconds
+      if rescanning_drops != drops:
+        print >> sys.stderr, "Warning: %d drops vs %d" % (drops, rescanning_drops)
+    print "%10d %14.3f %14s %8d" % (size, seconds, rescanning, drops)
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter,
+                                   description=description)
+  parser.add_argument('-n', '--num-events', dest="num_events", type=int,
+                      default=50000, help='''number of dataplane events''')
+  parser.add_argument('-f', '--num-flows', dest="num_flows", type=int,
+                      default=64, help='''number of distinct fingerprints''')
+  parser.add_argument('-d', '--drop-rate', dest="drop_rate", type=float,
+                      default=0.1, help='''fraction of DataplaneDrops''')
+  parser.add_argument('--compare', type=int, nargs='*', default=[1000, 5000],
+                      help='''trace sizes to also time the previous '''
+                           '''implementation on''')
+  main(parser.parse_args())
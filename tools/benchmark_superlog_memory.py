@@ -0,0 +1,136 @@
+#!/usr/bin/env python2.7
+#
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# note: must be invoked from the top-level sts directory
+
+import argparse
+import gc
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from sts.replay_event import *
+from sts.fingerprints.messages import OFFingerprint, DPFingerprint
+from sts.util.convenience import base64_encode
+import sts.input_traces.log_parser as log_parser
+from pox.openflow.libopenflow_01 import ofp_echo_request, ofp_echo_reply, ofp_flow_mod
+
+description = """
+Measure how much memory log_parser takes to parse a synthetic superlog. The
+trace has roughly the mix of a real one: mostly control messages and
+dataplane permits, with some state changes and inputs.
+Each size is parsed in a fresh child process.
+Example usage:
+
+$ %s -n 500000 --sizes 10000 100000
+""" % (sys.argv[0])
+
+def generate_trace(path, num_events):
+  ''' Write a superlog with num_events events to path, one event at a time '''
+  random.seed(0)
+  messages = [ ofp_echo_request(), ofp_echo_reply(), ofp_flow_mod() ]
+  dp_fingerprint = DPFingerprint({'dl_src': "00:00:00:00:00:01",
+                                  'dl_dst': "00:00:00:00:00:02",
+                                  'nw_src': "10.0.0.1",
+                                  'nw_dst': "10.0.0.2"})
+  with open(path, "w") as output:
+    for i in xrange(num_events):
+      choice = random.random()
+      if choice < 0.6:
+        message = random.choice(messages)
+        event_type = random.choice([ControlMessageReceive, ControlMessageSend])
+        fingerprint = (event_type.__name__, OFFingerprint.from_pkt(message),
+                       i % 16 + 1, "c1")
+        event = event_type(i % 16 + 1, "c1", fingerprint,
+                           b64_packet=base64_encode(message), round=i)
+      elif choice < 0.85:
+        event = DataplanePermit(("DataplanePermit", dp_fingerprint,
+                                 i % 16 + 1, 1), round=i)
+      elif choice < 0.95:
+        event = ControllerStateChange("c1", "flow %s installed", "flow %s installed",
+                                      [str(i)], round=i)
+      elif choice < 0.975:
+        event = LinkFailure(i % 16 + 1, 1, i % 16 + 2, 1, round=i)
+      else:
+        event = LinkRecovery(i % 16 + 1, 1, i % 16 + 2, 1, round=i)
+      output.write(event.to_json() + '\n')
+
+def rss_bytes():
+  ''' Current resident set size of this process '''
+  try:
+    with open("/proc/self/statm") as statm:
+      return int(statm.read().split()[1]) * resource.getpagesize()
+  except IOError:
+    # Not Linux: fall back to the peak, which ru_maxrss reports in bytes on
+    # OS X
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def measure(path):
+  ''' Return (seconds taken, number of events, bytes of RSS used) '''
+  gc.collect()
+  before = rss_bytes()
+  start = time.time()
+  trace = log_parser.parse_path(path)
+  seconds = time.time() - start
+  gc.collect()
+  return (seconds, len(trace), rss_bytes() - before)
+
+def measure_in_child(path):
+  (read_fd, write_fd) = os.pipe()
+  pid = os.fork()
+  if pid == 0:
+    os.close(read_fd)
+    os.write(write_fd, json.dumps(measure(path)))
+    os._exit(0)
+  os.close(write_fd)
+  result = ""
+  while True:
+    data = os.read(read_fd, 4096)
+    if data == "":
+      break
+    result += data
+  os.close(read_fd)
+  os.waitpid(pid, 0)
+  return tuple(json.loads(result))
+
+def main(args):
+  sizes = sorted(set(args.sizes + [args.num_events]))
+  print "%10s %12s %12s %14s" % ("events", "parse (s)", "RSS (MB)", "bytes/event")
+  for size in sizes:
+    (fd, path) = tempfile.mkstemp(suffix=".trace")
+    os.close(fd)
+    try:
+      generate_trace(path, size)
+      (seconds, num_events, used) = measure_in_child(path)
+    finally:
+      os.remove(path)
+    print "%10d %12.3f %12.1f %14d" % (num_events, seconds, used / 1e6,
+                                       used / max(num_events, 1))
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter,
+                                   description=description)
+  parser.add_argument('-n', '--num-events', dest="num_events", type=int,
+                      default=500000, help='''number of events in the largest trace''')
+  parser.add_argument('--sizes', type=int, nargs='*', default=[10000, 100000],
+                      help='''other trace sizes to measure''')
+  main(parser.parse_args())
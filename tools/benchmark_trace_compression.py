@@ -0,0 +1,90 @@
+#!/usr/bin/env python2.7
+#
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# note: must be invoked from the top-level sts directory
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from sts.util.compressed_files import open_compressed, GZIP_SUFFIX, BZ2_SUFFIX
+from tools.benchmark_superlog_memory import generate_trace
+
+description = """
+Measure write throughput, read throughput and compression ratio of each
+trace compression suffix on a synthetic superlog (see
+benchmark_superlog_memory.py). Throughputs are of uncompressed data, so
+they're comparable to the disk bandwidth a compressed trace saves. Example
+usage:
+
+$ %s -n 200000 --levels 1 3 6 9
+""" % (sys.argv[0])
+
+def measure(lines, path, compresslevel):
+  ''' Return (write MB/s, read MB/s, compressed bytes) '''
+  num_bytes = sum(len(line) for line in lines)
+  start = time.time()
+  with open_compressed(path, 'w', compresslevel=compresslevel) as output:
+    for line in lines:
+      output.write(line)
+  write_seconds = time.time() - start
+  start = time.time()
+  with open_compressed(path) as input_file:
+    for line in input_file:
+      pass
+  read_seconds = time.time() - start
+  return (num_bytes / 1e6 / max(write_seconds, 1e-9),
+          num_bytes / 1e6 / max(read_seconds, 1e-9),
+          os.path.getsize(path))
+
+def main(args):
+  tmpdir = tempfile.mkdtemp()
+  try:
+    trace_path = os.path.join(tmpdir, "events.trace")
+    generate_trace(trace_path, args.num_events)
+    with open(trace_path) as trace:
+      lines = trace.readlines()
+    num_bytes = os.path.getsize(trace_path)
+    print "%d events, %.1f MB uncompressed" % (len(lines), num_bytes / 1e6)
+    print "%8s %6s %14s %14s %8s" % ("suffix", "level", "write (MB/s)",
+                                     "read (MB/s)", "ratio")
+    configurations = [("", 0)]
+    configurations += [ (GZIP_SUFFIX, level) for level in args.levels ]
+    configurations += [ (BZ2_SUFFIX, 9) ]
+    for (suffix, level) in configurations:
+      path = os.path.join(tmpdir, "measured.trace" + suffix)
+      (write_rate, read_rate, size) = measure(lines, path, level)
+      os.remove(path)
+      print "%8s %6s %14.1f %14.1f %8.1f" % (suffix or "none",
+                                             level if suffix else "-",
+                                             write_rate, read_rate,
+                                             num_bytes / float(size))
+  finally:
+    shutil.rmtree(tmpdir)
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter,
+                                   description=description)
+  parser.add_argument('-n', '--num-events', dest="num_events", type=int,
+                      default=200000, help='''number of events in the trace''')
+  parser.add_argument('--levels', type=int, nargs='*', default=[1, 3, 6, 9],
+                      help='''gzip compression levels to measure''')
+  main(parser.parse_args())
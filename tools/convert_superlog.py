@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+#
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# note: must be invoked from the top-level sts directory
+
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from sts.input_traces.binary_trace import (BINARY_TRACE_EXTENSION,
+                                           is_binary_trace_path,
+                                           json_to_binary, binary_to_json)
+from sts.util.compressed_files import split_compression_suffix
+
+description = """
+Convert a json superlog to an indexed binary superlog, or back. The direction
+is chosen by the input's extension: inputs ending in %s are converted to
+json, anything else (including compressed json, e.g. events.trace.gz) to
+binary. Example usage:
+
+$ %s experiments/fuzz_pox_mesh/events.trace
+(writes experiments/fuzz_pox_mesh/events%s)
+""" % (BINARY_TRACE_EXTENSION, sys.argv[0], BINARY_TRACE_EXTENSION)
+
+def main(args):
+  if is_binary_trace_path(args.input):
+    output = args.output
+    if output is None:
+      output = args.input[:-len(BINARY_TRACE_EXTENSION)] + ".trace"
+    binary_to_json(args.input, output)
+  else:
+    output = args.output
+    if output is None:
+      (path, _) = split_compression_suffix(args.input)
+      output = os.path.splitext(path)[0] + BINARY_TRACE_EXTENSION
+    json_to_binary(args.input, output)
+  print "Wrote %s" % output
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter,
+                                   description=description)
+  parser.add_argument('input', metavar="INPUT",
+                      help='The superlog to convert')
+  parser.add_argument('-o', '--output', default=None,
+                      help='''Where to write the converted superlog. Default: '''
+                           '''INPUT with its extension swapped''')
+  main(parser.parse_args())
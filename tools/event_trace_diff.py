@@ -10,28 +10,23 @@ from collections import Counter
 
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 
-from trace_utils import parse_event_trace, Stats
+from trace_utils import iter_event_trace, Stats
 from pretty_print_input_trace import default_fields, field_formatters
 import sts.replay_event as replay_events
 from sts.dataplane_traces.trace import Trace
-from sts.input_traces.log_parser import parse
 
-def l_minus_r(l, r):
-  result = []
-  r_fingerprints = Counter([e.fingerprint for e in r.events])
-  for e in l.events:
-    if e.fingerprint not in r_fingerprints:
-      result.append(e)
+def l_minus_r(l_path, r_path):
+  ''' Generate the events of trace l_path whose fingerprints are not in trace
+  r_path (counting duplicates). Only r_path's fingerprints are held in
+  memory, not the events of either trace. '''
+  r_fingerprints = Counter(e.fingerprint for e in iter_event_trace(r_path))
+  for e in iter_event_trace(l_path):
+    if r_fingerprints[e.fingerprint] > 0:
+      r_fingerprints[e.fingerprint] -= 1
     else:
-      r_fingerprints[e] -= 1
-      if r_fingerprints[e] == 0:
-        del r_fingerprints[e]
-  return result
+      yield e
 
 def main(args):
-  trace1 = parse_event_trace(args.trace1)
-  trace2 = parse_event_trace(args.trace2)
-
   if args.ignore_inputs:
     filtered_classes = set(replay_events.all_input_events)
   else:
@@ -40,7 +35,7 @@ def main(args):
   print "Events in trace1, not in trace2"
   print "================================="
   t1_t2_stats = Stats()
-  for e in l_minus_r(trace1, trace2):
+  for e in l_minus_r(args.trace1, args.trace2):
     if type(e) not in filtered_classes:
       t1_t2_stats.update(e)
       for field in default_fields:
@@ -50,7 +45,7 @@ def main(args):
   print "Events in trace2, not in trace1"
   print "================================="
   t2_t1_stats = Stats()
-  for e in l_minus_r(trace2, trace1):
+  for e in l_minus_r(args.trace2, args.trace1):
     if type(e) not in filtered_classes:
       t2_t1_stats.update(e)
       for field in default_fields:
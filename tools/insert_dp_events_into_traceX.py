@@ -8,7 +8,7 @@ sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 import sts.replay_event as replay_events
 from sts.dataplane_traces.trace import Trace
 from sts.input_traces.input_logger import InputLogger
-from sts.input_traces.log_parser import parse
+from sts.input_traces.log_parser import iter_parse_path
 
 def main(args):
   if args.dp_trace_path is None:
@@ -19,14 +19,12 @@ def main(args):
   event_logger = InputLogger()
   event_logger.open(results_dir="/tmp/events.trace")
 
-  with open(args.input) as input_file:
-    trace = parse(input_file)
-    for event in trace:
-      if type(event) == replay_events.TrafficInjection:
-        event.dp_event = dp_trace.pop(0)
-      event_logger.log_input_event(event)
+  for event in iter_parse_path(args.input):
+    if type(event) == replay_events.TrafficInjection:
+      event.dp_event = dp_trace.pop(0)
+    event_logger.log_input_event(event)
 
-    event_logger.output.close()
+  event_logger.output.close()
 
 if __name__ == '__main__':
   parser = argparse.ArgumentParser()
@@ -11,7 +11,7 @@ sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 
 import sts.replay_event as replay_events
 from sts.dataplane_traces.trace import Trace
-from sts.input_traces.log_parser import parse
+from sts.input_traces.log_parser import iter_parse_path
 from trace_utils import Stats
 
 default_fields = ['class_with_label', 'fingerprint', 'event_delimiter']
@@ -65,21 +65,18 @@ field_formatters = {
 }
 
 
-def check_for_violation_signature(trace, signature):
-  for event in reversed(trace):
-    # TODO(cs): this algorithm is broken in the case that InvariantViolations
-    # were part of the original events.trace as internal/special events. The
-    # last InvariantViolation in the trace is not necessarily the one that
-    # was checked by mcs_finder. A cleaner way to check for violations would be
-    # to store whether or not a violation was found for each run in runtime
-    # stats.
-    if type(event) == replay_events.WaitTime:
-      continue
-    if type(event) != replay_events.InvariantViolation:
-       # No InvariantViolation occured at the end of the trace
-       return False
-    return signature in event.violations
-  return False
+def check_last_event_for_violation_signature(last_event, signature):
+  ''' last_event is the last event in the trace that isn't a WaitTime '''
+  # TODO(cs): this algorithm is broken in the case that InvariantViolations
+  # were part of the original events.trace as internal/special events. The
+  # last InvariantViolation in the trace is not necessarily the one that
+  # was checked by mcs_finder. A cleaner way to check for violations would be
+  # to store whether or not a violation was found for each run in runtime
+  # stats.
+  if type(last_event) != replay_events.InvariantViolation:
+    # No InvariantViolation occured at the end of the trace
+    return False
+  return signature in last_event.violations
 
 def main(args):
   def load_format_file(format_file):
@@ -116,22 +113,25 @@ def main(args):
   # all events are printed with a fixed number of lines, and (optionally)
   # separated by delimiter lines of the form:
   # ----------------------------------
-  with open(args.input) as input_file:
-    trace = parse(input_file)
-    for event in trace:
-      if type(event) not in filtered_classes:
-        if dp_trace is not None and type(event) == replay_events.TrafficInjection:
-          event.dp_event = dp_trace.pop(0)
-        for field in fields:
-          field_formatters[field](event)
-        stats.update(event)
-
-    if check_for_violation_signature(trace, args.violation_signature):
-      print "Violation occurs at end of trace: %s" % args.violation_signature
-    elif args.violation_signature is not None:
-      print ("Violation does not occur at end of trace: %s",
-             args.violation_signature)
-    print
+  # Parse events one at a time, so the trace needn't fit in memory
+  last_event = None
+  for event in iter_parse_path(args.input):
+    if type(event) not in filtered_classes:
+      if dp_trace is not None and type(event) == replay_events.TrafficInjection:
+        event.dp_event = dp_trace.pop(0)
+      for field in fields:
+        field_formatters[field](event)
+      stats.update(event)
+    if type(event) != replay_events.WaitTime:
+      last_event = event
+
+  if check_last_event_for_violation_signature(last_event,
+                                              args.violation_signature):
+    print "Violation occurs at end of trace: %s" % args.violation_signature
+  elif args.violation_signature is not None:
+    print ("Violation does not occur at end of trace: %s",
+           args.violation_signature)
+  print
 
   if args.stats:
     print "Stats: %s" % stats
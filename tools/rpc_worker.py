@@ -0,0 +1,72 @@
+#!/usr/bin/env python2.7
+#
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# note: must be invoked from the top-level sts directory
+
+import argparse
+import os
+import signal
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from sts.util.rpc_forker import RemoteWorker, LocalForker
+
+description = """
+Serve tasks for a RemoteForker, e.g. replays for an MCSFinder configured with
+forker=RemoteForker([("localhost", 3000), ("localhost", 3001)]).
+Example usage:
+
+$ %s -p 3000 -c config.mcs_config
+""" % (sys.argv[0])
+
+parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter,
+                                 description=description)
+parser.add_argument('-a', '--address', default='localhost',
+                    help='''address to listen on''')
+parser.add_argument('-p', '--port', type=int, required=True,
+                    help='''port to listen on''')
+parser.add_argument('-m', '--max-tasks', dest="max_tasks", type=int, default=1,
+                    help='''number of tasks to run at once''')
+parser.add_argument('-c', '--config', default=None,
+                    help='''experiment config module whose control flow we run '''
+                         '''replays for. Must be the same config (and trace) as '''
+                         '''the parent's''')
+args = parser.parse_args()
+
+if args.config is not None:
+  # Allow configs to be specified as paths as well as module names
+  if args.config.endswith('.py'):
+    args.config = args.config[:-3].replace("/", ".")
+  config = __import__(args.config, globals(), locals(), ["*"])
+  if hasattr(config, 'control_flow') and hasattr(config.control_flow, 'init_remote_worker'):
+    config.control_flow.init_remote_worker()
+
+worker = RemoteWorker(args.address, args.port, max_tasks=args.max_tasks)
+
+def handle_int(signal, frame):
+  sys.stderr.write("Caught signal %d, stopping worker (pid %d)\n" %
+                   (signal, os.getpid()))
+  # kill fork()ed procs
+  LocalForker.kill_all()
+  sys.exit(13)
+
+signal.signal(signal.SIGINT, handle_int)
+signal.signal(signal.SIGTERM, handle_int)
+
+print "Worker listening on %s:%d" % (args.address, args.port)
+sys.stdout.flush()
+worker.serve_forever()
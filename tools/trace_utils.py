@@ -7,7 +7,7 @@ import os
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 
 import sts.replay_event as replay_events
-from sts.input_traces.log_parser import parse
+from sts.input_traces.log_parser import parse_path, iter_parse_path
 from sts.util.tabular import Tabular
 from sts.event_dag import EventDag
 from collections import Counter
@@ -23,8 +23,12 @@ def parse_json(subsequence_violations_path):
     return d
 
 def parse_event_trace(trace_path):
-  with open(trace_path) as input_file:
-    return EventDag(parse(input_file))
+  return EventDag(parse_path(trace_path))
+
+def iter_event_trace(trace_path):
+  ''' Generate the events of the trace one at a time, rather than holding the
+  whole trace in memory '''
+  return iter_parse_path(trace_path)
 
 class Stats(object):
   def __init__(self):